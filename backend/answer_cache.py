@@ -0,0 +1,245 @@
+"""
+answer_cache.py
+---------------
+Answer cache in front of query_openai_assistant.
+
+Answers are keyed on the assistant id, a normalized form of the question and the
+knowledge base version stamp. A bounded in-process LRU with TTL sits on top of the
+persistent AnswerCacheEntry table, so every API worker shares cached answers.
+Changing the vector store (upload, website scan, delete) bumps the version stamp,
+which makes every previously cached answer unreachable.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import APIRouter
+from sqlmodel import Session, select, update, delete, col
+from db import engine
+from models import KnowledgeBaseVersion, AnswerCacheEntry
+
+router = APIRouter()
+
+# Cache configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))     # In-memory LRU size
+ANSWER_CACHE_MAX_ROWS = int(os.getenv("ANSWER_CACHE_MAX_ROWS", "20000"))          # Persistent table size
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+KB_VERSION_REFRESH_SECONDS = 5.0  # How long a worker trusts its copy of the version stamp
+DB_EVICTION_EVERY = 100           # Trim the persistent table every N stores
+
+def normalize_question(question: str) -> str:
+    """Case-folds, strips punctuation and collapses whitespace so trivial variants share a key."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+# --- Knowledge base version stamp ---
+_version_lock = threading.Lock()
+_version_cache = {"version": None, "checked_at": 0.0}
+
+def get_kb_version() -> int:
+    """Returns the current knowledge base version, re-reading the DB at most every few seconds."""
+    with _version_lock:
+        if _version_cache["version"] is not None and time.monotonic() - _version_cache["checked_at"] < KB_VERSION_REFRESH_SECONDS:
+            return _version_cache["version"]
+
+    with Session(engine) as session:
+        row = session.get(KnowledgeBaseVersion, 1)
+        if row is None:
+            row = KnowledgeBaseVersion(id=1, version=1)
+            session.add(row)
+            session.commit()
+            session.refresh(row)
+        version = row.version
+
+    with _version_lock:
+        _version_cache.update(version=version, checked_at=time.monotonic())
+    return version
+
+def bump_kb_version(reason: str = "") -> int:
+    """
+    Marks the knowledge base as changed. Cached answers from older versions are
+    dropped from memory and the persistent table. Returns the new version.
+    """
+    with Session(engine) as session:
+        result = session.exec(
+            update(KnowledgeBaseVersion)
+            .where(KnowledgeBaseVersion.id == 1)
+            .values(version=KnowledgeBaseVersion.version + 1, updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            session.add(KnowledgeBaseVersion(id=1, version=2))
+        session.commit()
+        version = session.get(KnowledgeBaseVersion, 1).version
+        session.exec(delete(AnswerCacheEntry).where(AnswerCacheEntry.kb_version < version))
+        session.commit()
+
+    with _version_lock:
+        _version_cache.update(version=version, checked_at=time.monotonic())
+    answer_cache.clear_memory()
+    answer_cache.count("invalidations")
+    logging.info(f"Knowledge base version bumped to {version} ({reason or 'unspecified change'})")
+    return version
+
+# --- Cache implementation ---
+class AnswerCache:
+    """Thread-safe LRU/TTL answer cache backed by the AnswerCacheEntry table."""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (answer, stored_at monotonic)
+        self._lock = threading.Lock()
+        self._stores_since_eviction = 0
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "invalidations": 0, "errors": 0}
+        self._stats_lock = threading.Lock()  # Counters are bumped from many worker threads
+
+    def count(self, stat: str):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    @staticmethod
+    def make_key(question: str, assistant_id: str, kb_version: int) -> str:
+        raw = f"{assistant_id}\x1f{kb_version}\x1f{normalize_question(question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, question: str, assistant_id: str):
+        """
+        Returns (answer or None, kb_version). Pass the version back to store() so an
+        answer computed while the knowledge base changed is filed under the old stamp.
+        """
+        try:
+            kb_version = get_kb_version()
+        except Exception as e:
+            logging.warning(f"Answer cache unavailable, skipping lookup: {e}")
+            self.count("errors")
+            return None, None
+
+        key = self.make_key(question, assistant_id, kb_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, stored_at = entry
+                if time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.count("memory_hits")
+                    return answer, kb_version
+                del self._entries[key]
+
+        try:
+            with Session(engine) as session:
+                row = session.get(AnswerCacheEntry, key)
+                if row is not None:
+                    age = (datetime.utcnow() - row.created_at).total_seconds()
+                    if age > self.ttl_seconds:
+                        session.delete(row)
+                        session.commit()
+                    else:
+                        row.hits += 1
+                        row.last_used_at = datetime.utcnow()
+                        session.add(row)
+                        session.commit()
+                        self._remember(key, row.answer, stored_at=time.monotonic() - age)
+                        self.count("db_hits")
+                        return row.answer, kb_version
+        except Exception as e:
+            logging.warning(f"Answer cache lookup failed: {e}")
+            self.count("errors")
+
+        self.count("misses")
+        return None, kb_version
+
+    def store(self, question: str, assistant_id: str, answer: str, kb_version: int):
+        if kb_version is None or not answer:
+            return
+        key = self.make_key(question, assistant_id, kb_version)
+        self._remember(key, answer)
+        try:
+            with Session(engine) as session:
+                session.merge(AnswerCacheEntry(
+                    key=key,
+                    assistant_id=assistant_id,
+                    kb_version=kb_version,
+                    question=question,
+                    answer=answer
+                ))
+                session.commit()
+            with self._stats_lock:
+                self.stats["stores"] += 1
+                self._stores_since_eviction += 1
+                evict = self._stores_since_eviction >= DB_EVICTION_EVERY
+                if evict:
+                    self._stores_since_eviction = 0
+            if evict:
+                self.evict_persistent()
+        except Exception as e:
+            logging.warning(f"Answer cache store failed: {e}")
+            self.count("errors")
+
+    def evict_persistent(self):
+        """Drops expired rows and trims the table to ANSWER_CACHE_MAX_ROWS least recently used."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        with Session(engine) as session:
+            session.exec(delete(AnswerCacheEntry).where(AnswerCacheEntry.created_at < cutoff))
+            keep = select(AnswerCacheEntry.key).order_by(col(AnswerCacheEntry.last_used_at).desc()).limit(ANSWER_CACHE_MAX_ROWS)
+            session.exec(delete(AnswerCacheEntry).where(col(AnswerCacheEntry.key).not_in(keep)))
+            session.commit()
+
+    def _remember(self, key: str, answer: str, stored_at: float = None):
+        with self._lock:
+            self._entries[key] = (answer, stored_at if stored_at is not None else time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        lookups = hits + stats["misses"]
+        with self._lock:
+            memory_entries = len(self._entries)
+        return {
+            **stats,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "enabled": ANSWER_CACHE_ENABLED,
+        }
+
+answer_cache = AnswerCache()
+
+# --- API: Cache statistics ---
+@router.get("/stats")
+def get_answer_cache_stats():
+    stats = answer_cache.snapshot()
+    try:
+        stats["kb_version"] = get_kb_version()
+    except Exception as e:
+        logging.warning(f"Could not read knowledge base version: {e}")
+        stats["kb_version"] = None
+    return stats
+
+# --- API: Invalidate all cached answers ---
+@router.post("/clear")
+def clear_answer_cache():
+    version = bump_kb_version("manual cache clear")
+    return {"success": True, "kb_version": version}
+
+__all__ = [
+    "router", "answer_cache", "normalize_question",
+    "get_kb_version", "bump_kb_version", "ANSWER_CACHE_ENABLED"
+]
@@ -0,0 +1,209 @@
+"""
+answer_memory.py
+----------------
+Local similarity index over every question/answer pair stored in
+QuestionnaireSession.results_json, used to reuse past answers.
+
+Questions are embedded as TF-IDF vectors (word unigrams + bigrams) with an
+inverted index for candidate lookup and cosine similarity for scoring. The index
+is built lazily on first use and then grows incrementally: newly saved sessions
+are indexed immediately by save_questionnaire_entry, and sessions saved by other
+API workers are picked up by id on the next lookup. Each worker holds at most the
+ANSWER_MEMORY_MAX_SESSIONS most recent sessions.
+
+Cosine similarity alone scores "... before onboarding" and "... after onboarding"
+above 0.9, so a stored answer is only reused when, in addition:
+- both questions have the same content words and numbers (question_dedup.content_words)
+- it was produced against the current knowledge base version (answer_cache); answers
+  from before an upload, scan or delete, or without a recorded version, are not reused
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+from sqlmodel import Session, select, col
+from db import engine
+from models import QuestionnaireSession
+from answer_cache import normalize_question, get_kb_version
+from question_dedup import content_words
+
+ANSWER_MEMORY_THRESHOLD = float(os.getenv("ANSWER_MEMORY_THRESHOLD", "0.9"))  # Cosine similarity
+ANSWER_MEMORY_MAX_SESSIONS = int(os.getenv("ANSWER_MEMORY_MAX_SESSIONS", "500"))
+MAX_CANDIDATES = 5  # Ranked matches kept per question, in case the best source was deleted
+ERROR_ANSWER_PREFIX = "Error processing this question"
+
+@dataclass
+class AnswerMatch:
+    question: str
+    answer: str
+    session_id: int
+    similarity: float
+
+def _terms(text: str) -> Counter:
+    words = normalize_question(text).split()
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+def _numbers(text: str) -> frozenset:
+    return frozenset(re.findall(r"\d+", text))
+
+class AnswerMemory:
+    """Incremental TF-IDF index over historical questionnaire answers. Thread-safe."""
+
+    def __init__(self, max_sessions: int = ANSWER_MEMORY_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._watermark = 0              # Highest session id read from the DB by refresh()
+        self._removed_sessions = set()
+        self._reset_locked()
+
+    def _reset_locked(self):
+        self._loaded = False
+        self._indexed_sessions = set()
+        # (session_id, question, answer, term counts, numbers, content words, kb version)
+        self._entries = []
+        self._postings: Dict[str, List[int]] = {}
+        self._doc_freq: Counter = Counter()
+        self._norms: List[float] = []
+        self._norms_doc_count = -1       # Corpus size the cached norms were computed for
+
+    # --- Indexing ---
+    def index_session(self, session_id: int, results: list):
+        """Adds the Q&A pairs of one saved session. Reused and failed answers are skipped."""
+        with self._lock:
+            self._index_session_locked(session_id, results)
+
+    def _index_session_locked(self, session_id: int, results: list):
+        if session_id in self._indexed_sessions:
+            return
+        self._indexed_sessions.add(session_id)
+        for item in results:
+            question = (item.get("question") or "").strip()
+            answer = (item.get("answer") or "").strip()
+            if not question or not answer or item.get("reused") or answer.startswith(ERROR_ANSWER_PREFIX):
+                continue
+            terms = _terms(question)
+            if not terms:
+                continue
+            entry_id = len(self._entries)
+            self._entries.append((
+                session_id, question, answer, terms, _numbers(question), content_words(question), item.get("kb_version")
+            ))
+            for term in terms:
+                self._postings.setdefault(term, []).append(entry_id)
+                self._doc_freq[term] += 1
+
+    def remove_session(self, session_id: int):
+        with self._lock:
+            self._removed_sessions.add(session_id)
+
+    def refresh(self):
+        """
+        Indexes sessions saved since the last refresh (including by other workers).
+        The first load, and a reload once the index holds twice `max_sessions`, read
+        only the `max_sessions` most recent sessions.
+        """
+        with self._lock:
+            if len(self._indexed_sessions) > 2 * self.max_sessions:
+                self._reset_locked()
+            loaded = self._loaded
+        query = select(QuestionnaireSession.id, QuestionnaireSession.results_json)
+        if loaded:
+            query = query.where(QuestionnaireSession.id > self._watermark)
+        with Session(engine) as session:
+            rows = session.exec(query.order_by(col(QuestionnaireSession.id).desc()).limit(None if loaded else self.max_sessions)).all()
+        rows.reverse()
+
+        with self._lock:
+            for session_id, results_json in rows:
+                try:
+                    results = json.loads(results_json)
+                except (TypeError, ValueError):
+                    logging.warning(f"Skipping questionnaire session {session_id} with invalid results JSON")
+                    results = []
+                self._index_session_locked(session_id, results)
+                self._watermark = max(self._watermark, session_id)
+            if not self._loaded:
+                self._loaded = True
+                logging.info(f"Answer memory loaded {len(self._entries)} Q&A pairs from {len(self._indexed_sessions)} sessions")
+
+    # --- Lookup ---
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self._entries)) / (1 + self._doc_freq[term])) + 1.0
+
+    def _ensure_norms_locked(self):
+        # IDF depends on corpus size, so norms are recomputed only after the corpus grew
+        if self._norms_doc_count == len(self._entries):
+            return
+        self._norms = [
+            math.sqrt(sum((tf * self._idf(term)) ** 2 for term, tf in terms.items()))
+            for _, _, _, terms, *_ in self._entries
+        ]
+        self._norms_doc_count = len(self._entries)
+
+    def find_matches(self, questions: List[str], threshold: float = ANSWER_MEMORY_THRESHOLD) -> Dict[int, AnswerMatch]:
+        """Returns {question index: best AnswerMatch} for questions with similarity >= threshold."""
+        self.refresh()
+        kb_version = get_kb_version()
+        candidates = {}
+        with self._lock:
+            if not self._entries:
+                return {}
+            self._ensure_norms_locked()
+            for i, question in enumerate(questions):
+                terms = _terms(question)
+                if not terms:
+                    continue
+                weights = {term: tf * self._idf(term) for term, tf in terms.items()}
+                query_norm = math.sqrt(sum(w * w for w in weights.values()))
+                dots = Counter()
+                for term, weight in weights.items():
+                    for entry_id in self._postings.get(term, ()):
+                        dots[entry_id] += weight * self._entries[entry_id][3][term] * self._idf(term)
+
+                numbers, words = _numbers(question), content_words(question)
+                ranked = []
+                for entry_id, dot in dots.items():
+                    session_id, past_question, answer, _, past_numbers, past_words, past_version = self._entries[entry_id]
+                    if (session_id in self._removed_sessions or past_version != kb_version
+                            or past_numbers != numbers or past_words != words):
+                        continue
+                    similarity = dot / (query_norm * self._norms[entry_id])
+                    if similarity >= threshold:
+                        ranked.append(AnswerMatch(past_question, answer, session_id, min(similarity, 1.0)))
+                if ranked:
+                    # Prefer the most similar, then the most recent session
+                    ranked.sort(key=lambda m: (m.similarity, m.session_id), reverse=True)
+                    candidates[i] = ranked[:MAX_CANDIDATES]
+
+        return self._first_existing_sources(candidates)
+
+    def _first_existing_sources(self, candidates: Dict[int, List[AnswerMatch]]) -> Dict[int, AnswerMatch]:
+        """
+        Sessions may have been deleted through another worker; picks, per question, the best
+        candidate whose source still exists.
+        """
+        source_ids = {m.session_id for ranked in candidates.values() for m in ranked}
+        if not source_ids:
+            return {}
+        with Session(engine) as session:
+            existing = set(session.exec(
+                select(QuestionnaireSession.id).where(col(QuestionnaireSession.id).in_(source_ids))
+            ).all())
+        for missing in source_ids - existing:
+            self.remove_session(missing)
+        matches = {}
+        for i, ranked in candidates.items():
+            match = next((m for m in ranked if m.session_id in existing), None)
+            if match is not None:
+                matches[i] = match
+        return matches
+
+answer_memory = AnswerMemory()
+
+__all__ = ["answer_memory", "AnswerMatch", "ANSWER_MEMORY_THRESHOLD", "ANSWER_MEMORY_MAX_SESSIONS"]
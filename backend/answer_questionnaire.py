@@ -1,20 +1,30 @@
-
 """
 answer_questionnaire.py (Refactored)
 ------------------------------------
 Handles file upload of questionnaires, parses questions, and returns generated answers.
 Supports Excel and unstructured formats. Saves session with Q&A results.
 Future-ready for user-level logging and extended analytics.
+
+The pipeline steps (save upload, extract questions, answer, persist) are exposed as
+helpers so the background job runner in questionnaire_jobs.py can reuse them.
+Extraction and answering are awaited on the event loop; blocking file and DB work
+runs in worker threads.
 """
 import os
+import json
+import asyncio
 import tempfile
 import logging
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Callable, List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from langchain.schema import Document
-from questionnaire_parser import parse_questionnaire_file
+from questionnaire_parser import parse_questionnaire_file_async, QuestionExtractionIncomplete
 from questionnaire_history import save_questionnaire_entry
+from question_dedup import collapse_questions, QUESTION_DEDUP_ENABLED
+from answer_memory import answer_memory
+from answer_cache import get_kb_version
 from db import engine
 from sqlmodel import Session
 
@@ -22,12 +32,9 @@ router = APIRouter()
 
 SUPPORTED_FORMATS = {"xlsx", "pdf", "docx"}
 
-@router.post("/process")
-async def answer_questionnaire(file: UploadFile = File(...)):
-    """
-    Accepts a file upload (Q&A Excel or document), extracts questions,
-    and returns generated answers. Saves to DB for retrieval later.
-    """
+# --- Pipeline helpers ---
+def validate_questionnaire_upload(file: UploadFile) -> str:
+    """Checks the uploaded file name and returns its lower-case extension."""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
 
@@ -37,58 +44,149 @@ async def answer_questionnaire(file: UploadFile = File(...)):
             status_code=400,
             detail=f"Unsupported format. Supported: {', '.join(SUPPORTED_FORMATS)}"
         )
+    return ext
+
+async def save_upload_to_temp(file: UploadFile, ext: str) -> str:
+    """Writes the uploaded file to a temp file and returns its path. Caller must clean it up."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}") as temp_file:
+        content = await file.read()
+        temp_file.write(content)
+        return temp_file.name
+
+def cleanup_temp_file(temp_path: str):
+    if temp_path and os.path.exists(temp_path):
+        try:
+            os.remove(temp_path)
+        except Exception as e:
+            logging.warning(f"Failed to clean temp file: {e}")
+
+async def extract_questions(temp_path: str, file_name: str) -> List[str]:
+    """
+    Extracts the non-empty questions from a saved questionnaire file.
+    Raises HTTPException(400) when nothing usable is found, and HTTPException(502) when
+    part of the file could not be extracted (a partial list would leave questions unanswered).
+    """
+    # --- LLM-powered question extraction ---
+    # Uses OpenAI Assistant (asst_LHcHlznpeN50voRNxJA8FgZV) for robust, multilingual question extraction from any supported file type.
+    # Returns a list of langchain.schema.Document objects, each representing a question.
+    try:
+        chunks: List[Document] = await parse_questionnaire_file_async(temp_path)
+    except QuestionExtractionIncomplete as e:
+        logging.error(f"Incomplete question extraction for {file_name}: {e}")
+        raise HTTPException(status_code=502, detail=f"{e}. Please try again.")
+    if not chunks:
+        logging.warning(f"No questions extracted from file: {file_name}")
+        raise HTTPException(status_code=400, detail="No questions could be extracted from the uploaded file. Please check the file format and content.")
+
+    # Collect all non-empty questions
+    questions = [chunk.page_content.strip() for chunk in chunks if chunk.page_content.strip()]
+    if not questions:
+        logging.warning(f"No valid questions found in file: {file_name}")
+        raise HTTPException(status_code=400, detail="No valid questions found in the uploaded file.")
+    return questions
+
+async def answer_questions(questions: List[str], on_answer: Callable[[int, str], None] = None,
+                           reuse_answers: bool = False, retrieval_engine: str = "assistant") -> List[dict]:
+    """
+    Answers the questions with the RAG assistant and returns the list of Q&A dicts.
+    With `reuse_answers`, questions that closely match a previously answered question
+    get the stored answer (flagged with `reused` and `source_session_id`) instead of an
+    assistant run. Near-duplicate questions are collapsed first: one representative per
+    group is sent to the assistant and its answer is fanned back out to every original question.
+    `on_answer(index, answer)` is called on the event loop once per original question for progress reporting.
+    `retrieval_engine` picks the retrieval engine: "assistant" (OpenAI file_search) or "local" (pgvector).
+    New answers carry the knowledge base version they were produced against (`kb_version`),
+    so answer reuse can skip them once the knowledge base changes.
+    """
+    from openai_integration import query_openai_assistant_batch_async, RETRIEVAL_ENGINES
+
+    if retrieval_engine not in RETRIEVAL_ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine. Supported: {', '.join(RETRIEVAL_ENGINES)}")
+
+    ASSISTANT_ID = os.getenv("OPENAI_RAG_ASSISTANT_ID")
+    if retrieval_engine == "assistant" and not ASSISTANT_ID:
+        raise HTTPException(status_code=500, detail="Assistant ID not configured")
+
+    results = [{"question": q, "answer": None} for q in questions]
+    pending = list(range(len(questions)))
+
+    if reuse_answers:
+        matches = await run_in_threadpool(answer_memory.find_matches, questions)
+        for i, match in matches.items():
+            results[i].update(
+                answer=match.answer,
+                reused=True,
+                source_session_id=match.session_id,
+                similarity=round(match.similarity, 3)
+            )
+            if on_answer is not None:
+                on_answer(i, match.answer)
+        pending = [i for i in pending if i not in matches]
+        logging.info(f"Reused {len(matches)} stored answers, {len(pending)} questions left for the assistant")
+
+    if not pending:
+        return results
+
+    pending_questions = [questions[i] for i in pending]
+    if QUESTION_DEDUP_ENABLED:
+        unique_questions, mapping = collapse_questions(pending_questions)
+    else:
+        unique_questions, mapping = pending_questions, list(range(len(pending_questions)))
+
+    members = [[] for _ in unique_questions]
+    for position, unique_index in enumerate(mapping):
+        members[unique_index].append(pending[position])
+
+    def fan_out(unique_index: int, answer: str):
+        if on_answer is not None:
+            for i in members[unique_index]:
+                on_answer(i, answer)
+
+    logging.info(f"Processing {len(unique_questions)} unique of {len(pending_questions)} questions in batch mode")
+    # Read before answering: a change made while the batch runs leaves these answers on the older version
+    kb_version = await run_in_threadpool(get_kb_version)
+    answers = await query_openai_assistant_batch_async(unique_questions, ASSISTANT_ID, on_answer=fan_out, engine=retrieval_engine)
+
+    for position, i in enumerate(pending):
+        results[i].update(answer=answers[mapping[position]], kb_version=kb_version)
+    return results
+
+def persist_results(file_name: str, results: List[dict]) -> int:
+    """Saves the Q&A results as a questionnaire session and returns its id."""
+    with Session(engine) as session:
+        return save_questionnaire_entry(
+            title=file_name[:30],
+            file_name=file_name,
+            results=results,
+            session=session
+        )
+
+# --- API: Process questionnaire synchronously ---
+@router.post("/process")
+async def answer_questionnaire(
+    file: UploadFile = File(...),
+    reuse_answers: bool = Query(False, description="Reuse stored answers for questions answered before"),
+    retrieval_engine: str = Query("assistant", alias="engine", description="Retrieval engine: assistant or local")
+):
+    """
+    Accepts a file upload (Q&A Excel or document), extracts questions,
+    and returns generated answers. Saves to DB for retrieval later.
+    """
+    ext = validate_questionnaire_upload(file)
 
     temp_path = None
     try:
-        # Save temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
-
-        # --- LLM-powered question extraction ---
-        # Uses OpenAI Assistant (asst_LHcHlznpeN50voRNxJA8FgZV) for robust, multilingual question extraction from any supported file type.
-        # Returns a list of langchain.schema.Document objects, each representing a question.
-        chunks: List[Document] = parse_questionnaire_file(temp_path)
-        if not chunks:
-            logging.warning(f"No questions extracted from file: {file.filename}")
-            raise HTTPException(status_code=400, detail="No questions could be extracted from the uploaded file. Please check the file format and content.")
+        temp_path = await save_upload_to_temp(file, ext)
+
+        questions = await extract_questions(temp_path, file.filename)
 
         # --- LLM-powered answer generation (batch) ---
-        # Collect all non-empty questions
-        questions = [chunk.page_content.strip() for chunk in chunks if chunk.page_content.strip()]
-        if not questions:
-            logging.warning(f"No valid questions found in file: {file.filename}")
-            raise HTTPException(status_code=400, detail="No valid questions found in the uploaded file.")
-
-        # Call batch processor directly for multiple questions
-        import os
-        from openai_integration import query_openai_assistant_batch
-        
-        ASSISTANT_ID = os.getenv("OPENAI_RAG_ASSISTANT_ID")
-        if not ASSISTANT_ID:
-            raise HTTPException(status_code=500, detail="Assistant ID not configured")
-        
-        logging.info(f"Processing {len(questions)} questions in batch mode")
-        answers = query_openai_assistant_batch(questions, ASSISTANT_ID)
-        
-        results = []
-        for q, a in zip(questions, answers):
-            results.append({
-                "question": q,
-                "answer": a
-            })
+        results = await answer_questions(questions, reuse_answers=reuse_answers, retrieval_engine=retrieval_engine)
 
         logging.info(f"Processed {len(results)} questions from upload: {file.filename}")
 
         # Persist to DB
-        with Session(engine) as session:
-            session_id = save_questionnaire_entry(
-                title=file.filename[:30],
-                file_name=file.filename,
-                results=results,
-                session=session
-            )
+        session_id = await run_in_threadpool(persist_results, file.filename, results)
 
         return JSONResponse(content={
             "questions_and_answers": results,
@@ -102,11 +200,79 @@ async def answer_questionnaire(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
     finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception as e:
-                logging.warning(f"Failed to clean temp file: {e}")
+        cleanup_temp_file(temp_path)
+
+# --- API: Process questionnaire with streamed answers (Server-Sent Events) ---
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_questionnaire(temp_path: str, file_name: str, reuse_answers: bool = False,
+                                retrieval_engine: str = "assistant"):
+    """
+    Yields SSE events: `questions` once extraction finishes, one `answer` per question
+    as soon as its assistant run completes (in completion order), then `done` with the
+    saved session_id. Failures are reported as an `error` event.
+    """
+    answers_queue: asyncio.Queue = asyncio.Queue()
+
+    def on_answer(index: int, answer: str):
+        answers_queue.put_nowait((index, answer))
+
+    answering = None
+    try:
+        questions = await extract_questions(temp_path, file_name)
+        yield _sse_event("questions", {"questions": questions, "total": len(questions)})
+
+        answering = asyncio.ensure_future(answer_questions(questions, on_answer, reuse_answers, retrieval_engine))
+        streamed = 0
+        while streamed < len(questions):
+            getter = asyncio.ensure_future(answers_queue.get())
+            await asyncio.wait({getter, answering}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                # Batch finished (or failed); any remaining answers are drained below
+                getter.cancel()
+                break
+            index, answer = getter.result()
+            streamed += 1
+            yield _sse_event("answer", {"index": index, "question": questions[index], "answer": answer})
+
+        results = await answering
+        while not answers_queue.empty():
+            index, answer = answers_queue.get_nowait()
+            yield _sse_event("answer", {"index": index, "question": questions[index], "answer": answer})
+
+        logging.info(f"Streamed {len(results)} answers for upload: {file_name}")
+        session_id = await run_in_threadpool(persist_results, file_name, results)
+        yield _sse_event("done", {"session_id": session_id, "total": len(results)})
+
+    except HTTPException as e:
+        yield _sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logging.error(f"Streaming file processing failed: {e}")
+        yield _sse_event("error", {"status_code": 500, "detail": f"Internal error: {str(e)}"})
+    finally:
+        if answering is not None and not answering.done():
+            answering.cancel()  # Client disconnected; stop issuing assistant runs
+        cleanup_temp_file(temp_path)
+
+@router.post("/process/stream")
+async def answer_questionnaire_stream(
+    file: UploadFile = File(...),
+    reuse_answers: bool = Query(False, description="Reuse stored answers for questions answered before"),
+    retrieval_engine: str = Query("assistant", alias="engine", description="Retrieval engine: assistant or local")
+):
+    """
+    Streaming variant of /process. Returns a text/event-stream that emits the
+    extracted question list first and then each answer the moment it is ready.
+    """
+    ext = validate_questionnaire_upload(file)
+    temp_path = await save_upload_to_temp(file, ext)
+
+    return StreamingResponse(
+        _stream_questionnaire(temp_path, file.filename, reuse_answers, retrieval_engine),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # --- PLACEHOLDER ---
-# Future: user_id logging, format-specific metrics, parallel processing
+# Future: user_id logging, format-specific metrics
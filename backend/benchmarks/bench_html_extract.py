@@ -0,0 +1,81 @@
+"""
+bench_html_extract.py
+---------------------
+Compares the HTML extractors over the saved pages in fixtures/html.
+
+For each extractor it reports parse throughput (pages/second) and the size of
+the extracted text, which shows how much navigation and boilerplate ends up in
+the knowledge files. "soup" is the original path: the crawler parsed each page
+once for links and the scanner once more for text, so it is timed with two
+parses per page; "lxml" gets text and links from a single parse.
+
+Usage (from backend/):
+    python benchmarks/bench_html_extract.py [--rounds 20] [--fixtures DIR] [--show]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_extract import LxmlHtmlExtractor, SoupHtmlExtractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "html")
+PAGE_URL = "https://example.com/page"
+
+def load_fixtures(directory: str) -> dict:
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                pages[name] = f.read()
+    return pages
+
+def soup_two_pass(html: str):
+    extractor = SoupHtmlExtractor()
+    links = extractor.extract_links(html, PAGE_URL)
+    return extractor.extract_text(html), links
+
+def lxml_single_pass(html: str):
+    return LxmlHtmlExtractor().parse(html, PAGE_URL)
+
+EXTRACTORS = {"soup (2 parses)": soup_two_pass, "lxml (1 parse)": lxml_single_pass}
+
+def run(pages: dict, rounds: int, show: bool):
+    input_bytes = sum(len(html.encode("utf-8")) for html in pages.values())
+    print(f"{len(pages)} pages, {input_bytes / 1024:.1f} KiB of HTML, {rounds} rounds\n")
+    print(f"{'extractor':<18}{'pages/s':>10}{'ms/page':>10}{'text chars':>12}{'links':>8}")
+
+    for label, extract in EXTRACTORS.items():
+        outputs = {name: extract(html) for name, html in pages.items()}  # Warm-up and output sizes
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for html in pages.values():
+                extract(html)
+        elapsed = time.perf_counter() - start
+        parsed = rounds * len(pages)
+        text_chars = sum(len(text) for text, _ in outputs.values())
+        links = sum(len(page_links) for _, page_links in outputs.values())
+        print(f"{label:<18}{parsed / elapsed:>10.1f}{elapsed / parsed * 1000:>10.2f}{text_chars:>12}{links:>8}")
+
+        if show:
+            for name, (text, _) in outputs.items():
+                print(f"\n  --- {name} ({len(text)} chars) ---\n  {text[:600]}")
+            print()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--show", action="store_true", help="Print the start of each extracted text")
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.fixtures)
+    if not pages:
+        sys.exit(f"No .html fixtures in {args.fixtures}")
+    run(pages, args.rounds, args.show)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+bench_llm_stub.py
+-----------------
+Measures questionnaire answering throughput offline, against the stub LLM backend.
+
+Answers a batch of generated questions with query_openai_assistant_batch_async
+(the /questionnaires path) at each requested concurrency and reports questions per
+second, latency percentiles, failures and the provider calls made per question.
+The answer cache is disabled so every question runs through the assistant flow.
+
+Usage (from backend/):
+    python benchmarks/bench_llm_stub.py [--questions 500] [--concurrency 8 32 128]
+        [--latency 0.05] [--run-seconds 2] [--distribution lognormal] [--error-rate 0]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configure before the app modules read their settings; the answer cache is off, so the DB is never used
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_llm_stub.db')}")
+
+from llm_backend import StubBackend, set_llm_backend, LATENCY_DISTRIBUTIONS
+from openai_integration import query_openai_assistant_batch_async
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+async def run_batch(questions: list, concurrency: int):
+    finished_at = {}
+    started = time.perf_counter()
+
+    def on_answer(index: int, _answer: str):
+        finished_at[index] = time.perf_counter() - started
+
+    answers = await query_openai_assistant_batch_async(
+        questions, "asst_bench", max_concurrency=concurrency, on_answer=on_answer
+    )
+    return answers, time.perf_counter() - started, list(finished_at.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds per API call")
+    parser.add_argument("--run-seconds", type=float, default=2.0, help="Mean seconds per assistant run")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability that an API call fails")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    questions = [f"Does control {i} apply to the production environment?" for i in range(args.questions)]
+    print(
+        f"{args.questions} questions, {args.distribution} latency {args.latency * 1000:.0f} ms/call, "
+        f"runs {args.run_seconds:.1f}s, error rate {args.error_rate:.1%}\n"
+    )
+    print(f"{'concurrency':>12}{'q/s':>10}{'p50 s':>9}{'p95 s':>9}{'failed':>8}{'calls/q':>9}{'polls/q':>9}")
+
+    for concurrency in args.concurrency:
+        backend = StubBackend(
+            latency_seconds=args.latency, run_seconds=args.run_seconds, distribution=args.distribution,
+            error_rate=args.error_rate, seed=args.seed
+        )
+        set_llm_backend(backend)
+        answers, elapsed, finish_times = asyncio.run(run_batch(questions, concurrency))
+        failed = sum(answer.startswith("Error processing this question") for answer in answers)
+        calls = sum(backend.calls.values())
+        print(
+            f"{concurrency:>12}{len(questions) / elapsed:>10.1f}{percentile(finish_times, 0.5):>9.2f}"
+            f"{percentile(finish_times, 0.95):>9.2f}{failed:>8}{calls / len(questions):>9.1f}"
+            f"{backend.calls['retrieve_run'] / len(questions):>9.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
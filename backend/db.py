@@ -10,6 +10,8 @@ Supported DATABASE_URL formats:
 """
 
 import os
+import logging
+from sqlalchemy import text
 from sqlmodel import SQLModel, create_engine, Session
 
 # --- Database Config ---
@@ -39,5 +41,19 @@ def get_session():
 
 # --- Initializer ---
 def init_db():
-    from models import ChatSession, ChatMessage, QuestionnaireSession
-    SQLModel.metadata.create_all(engine)
+    from models import (
+        ChatSession, ChatMessage, QuestionnaireSession, QuestionnaireJob,
+        KnowledgeBaseVersion, AnswerCacheEntry, KnowledgeChunk, KnowledgeFile, WebPageState,
+        ProcessedItem, QuestionnaireParseCacheEntry
+    )
+    core_tables = [t for t in SQLModel.metadata.sorted_tables if t is not KnowledgeChunk.__table__]
+    SQLModel.metadata.create_all(engine, tables=core_tables)
+
+    # Local retrieval needs the pgvector extension; the rest of the app works without it
+    try:
+        if engine.dialect.name == "postgresql":
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        SQLModel.metadata.create_all(engine, tables=[KnowledgeChunk.__table__])
+    except Exception as e:
+        logging.warning(f"pgvector unavailable, local retrieval disabled: {e}")
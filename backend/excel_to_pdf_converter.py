@@ -3,9 +3,15 @@ excel_to_pdf_converter.py
 -------------------------
 Converts Excel files to PDF format for knowledge base upload.
 Handles filled questionnaires and other Excel documents.
+
+Workbooks are read once and streamed: .xlsx/.xlsm through openpyxl's read-only
+mode, row by row, and each sheet is written as a series of table chunks that
+ReportLab lays out and releases one after another, so memory stays bounded by
+the chunk size rather than the sheet size.
 """
 
 import os
+import time
 import pandas as pd
 from reportlab.lib.pagesizes import A4, letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -13,14 +19,186 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 import logging
-from typing import Optional
+from datetime import date, datetime, time as dt_time
+from typing import Iterator, List, Optional, Tuple
 import tempfile
 
+OPENPYXL_EXTENSIONS = {'.xlsx', '.xlsm'}
+TABLE_CHUNK_ROWS = int(os.getenv("EXCEL_PDF_CHUNK_ROWS", "200"))  # Data rows per table chunk
+STORY_LOOKAHEAD = 8  # Flowables built ahead of the ReportLab layout loop
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+
+# --- Workbook reading ---
+def cell_to_text(value) -> str:
+    """Display text of a cell value (empty for blanks, no trailing .0 on whole numbers)."""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if value != value:  # NaN from the pandas reader
+            return ''
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ') if value.time() != dt_time() else value.date().isoformat()
+    if isinstance(value, (date, dt_time)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def _clean_rows(rows, numbered: bool = False) -> Iterator:
+    """
+    Rows as lists of cell text, with trailing blank cells trimmed and blank rows skipped.
+    With `numbered`, yields (row_number, cells) using 1-based spreadsheet row numbers.
+    """
+    for row_number, row in enumerate(rows, start=1):
+        cells = [cell_to_text(value) for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            yield (row_number, cells) if numbered else cells
+
+
+class WorkbookReader:
+    """
+    Single-pass reader over a workbook's sheets.
+
+    .xlsx/.xlsm are opened with openpyxl in read-only mode, so rows are parsed one
+    at a time; other formats fall back to pandas, parsing each sheet once.
+    Use as a context manager.
+    """
+
+    def __init__(self, excel_path: str):
+        self.excel_path = excel_path
+        if os.path.splitext(excel_path.lower())[1] in OPENPYXL_EXTENSIONS:
+            from openpyxl import load_workbook
+
+            self._workbook = load_workbook(excel_path, read_only=True, data_only=True)
+            self.sheet_names = list(self._workbook.sheetnames)
+        else:
+            self._workbook = pd.ExcelFile(excel_path)
+            self.sheet_names = list(self._workbook.sheet_names)
+
+    def iter_sheets(self, numbered: bool = False) -> Iterator[Tuple[str, Iterator]]:
+        """
+        Yields (sheet_name, rows) per sheet. rows iterates the non-blank rows as lists
+        of cell text ((row_number, cells) pairs with `numbered`) and must be consumed
+        before moving on to the next sheet.
+        """
+        if isinstance(self._workbook, pd.ExcelFile):
+            for sheet_name in self.sheet_names:
+                df = self._workbook.parse(sheet_name, header=None, dtype=object)
+                yield sheet_name, _clean_rows(df.itertuples(index=False, name=None), numbered)
+        else:
+            for worksheet in self._workbook.worksheets:
+                yield worksheet.title, _clean_rows(worksheet.iter_rows(values_only=True), numbered)
+
+    def close(self):
+        self._workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- PDF building ---
+class _StreamedStory(list):
+    """
+    Flowable list fed lazily from a generator. ReportLab consumes the story from
+    the front and checks len() before every step, so topping up there keeps only
+    a few table chunks alive at a time.
+    """
+
+    def __init__(self, source: Iterator):
+        super().__init__()
+        self._source = source
+
+    def __len__(self):
+        while super().__len__() < STORY_LOOKAHEAD and self._source is not None:
+            flowable = next(self._source, None)
+            if flowable is None:
+                self._source = None
+            else:
+                self.append(flowable)
+        return super().__len__()
+
+
+def _table_chunk(header: List[str], rows: List[List[str]]) -> Table:
+    col_count = max(len(header), max((len(row) for row in rows), default=0), 1)
+    data = [row + [''] * (col_count - len(row)) for row in [header] + rows]
+
+    # Spread the columns evenly over the page width
+    available_width = A4[0] - 2 * 0.5 * inch
+    table = Table(data, colWidths=[available_width / col_count] * col_count, repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+    return table
+
+
+def _row_chunks(rows: Iterator[List[str]], size: int) -> Iterator[List[List[str]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _sheet_flowables(sheet_name: str, rows: Iterator[List[str]], styles, show_title: bool):
+    """Table chunks of one sheet; the first row is the header and is repeated on every chunk."""
+    header = next(rows, None)
+    if header is None:
+        return
+    has_rows = False
+    for chunk in _row_chunks(rows, TABLE_CHUNK_ROWS):
+        # Add sheet title if multiple sheets (only for sheets with data)
+        if show_title and not has_rows:
+            yield Paragraph(f"Sheet: {sheet_name}", styles['Heading2'])
+            yield Spacer(1, 12)
+        has_rows = True
+        yield _table_chunk(header, chunk)
+    if has_rows:
+        yield Spacer(1, 20)
+
+
+def _workbook_flowables(excel_path: str, styles, title_style):
+    filename = os.path.basename(excel_path)
+    yield Paragraph(f"Document: {filename}", title_style)
+    yield Spacer(1, 20)
+
+    with WorkbookReader(excel_path) as reader:
+        multiple_sheets = len(reader.sheet_names) > 1
+        for sheet_name, rows in reader.iter_sheets():
+            try:
+                yield from _sheet_flowables(sheet_name, rows, styles, multiple_sheets)
+            except Exception as e:
+                logging.warning(f"Failed to process sheet '{sheet_name}': {e}")
+                # Add error note
+                yield Paragraph(f"Error processing sheet '{sheet_name}': {str(e)}", styles['Normal'])
+                yield Spacer(1, 12)
+
 
 def excel_to_pdf(excel_path: str, pdf_path: Optional[str] = None) -> str:
     """
     Convert Excel file to PDF format.
     
+    Sheets are streamed row by row and rendered as paginated table chunks of
+    TABLE_CHUNK_ROWS rows (header repeated), so large workbooks convert in
+    bounded memory.
+    
     Args:
         excel_path: Path to the Excel file
         pdf_path: Output PDF path (optional, auto-generated if not provided)
@@ -32,14 +210,12 @@ def excel_to_pdf(excel_path: str, pdf_path: Optional[str] = None) -> str:
         Exception: If conversion fails
     """
     try:
+        started = time.perf_counter()
         # Generate PDF path if not provided
         if pdf_path is None:
             base_name = os.path.splitext(os.path.basename(excel_path))[0]
             pdf_path = os.path.join(os.path.dirname(excel_path), f"{base_name}.pdf")
         
-        # Read Excel file with all sheets
-        excel_file = pd.ExcelFile(excel_path)
-        
         # Create PDF document
         doc = SimpleDocTemplate(
             pdf_path, 
@@ -50,8 +226,6 @@ def excel_to_pdf(excel_path: str, pdf_path: Optional[str] = None) -> str:
             bottomMargin=0.5*inch
         )
         
-        # Build content
-        story = []
         styles = getSampleStyleSheet()
         
         # Title style
@@ -63,85 +237,10 @@ def excel_to_pdf(excel_path: str, pdf_path: Optional[str] = None) -> str:
             alignment=1  # Center alignment
         )
         
-        # Add document title
-        filename = os.path.basename(excel_path)
-        story.append(Paragraph(f"Document: {filename}", title_style))
-        story.append(Spacer(1, 20))
+        # Build PDF while the workbook is being read
+        doc.build(_StreamedStory(_workbook_flowables(excel_path, styles, title_style)))
         
-        # Process each sheet
-        for sheet_name in excel_file.sheet_names:
-            try:
-                df = pd.read_excel(excel_path, sheet_name=sheet_name)
-                
-                if df.empty:
-                    continue
-                
-                # Add sheet title if multiple sheets
-                if len(excel_file.sheet_names) > 1:
-                    sheet_title = Paragraph(f"Sheet: {sheet_name}", styles['Heading2'])
-                    story.append(sheet_title)
-                    story.append(Spacer(1, 12))
-                
-                # Clean the dataframe
-                df = df.fillna('')  # Replace NaN with empty string
-                
-                # Convert to string to handle mixed data types
-                df = df.astype(str)
-                
-                # Prepare table data
-                table_data = []
-                
-                # Add headers if they exist
-                if not df.columns.empty:
-                    headers = [str(col) for col in df.columns]
-                    table_data.append(headers)
-                
-                # Add data rows
-                for _, row in df.iterrows():
-                    table_data.append([str(cell) for cell in row])
-                
-                if table_data:
-                    # Create table
-                    table = Table(table_data)
-                    
-                    # Style the table
-                    table_style = [
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('FONTSIZE', (0, 0), (-1, -1), 8),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                        ('WORDWRAP', (0, 0), (-1, -1), True),
-                    ]
-                    
-                    table.setStyle(TableStyle(table_style))
-                    
-                    # Auto-size columns to fit page
-                    available_width = A4[0] - 2 * 0.5 * inch
-                    col_count = len(table_data[0]) if table_data else 1
-                    col_width = available_width / col_count
-                    
-                    # Set column widths
-                    table._argW = [col_width] * col_count
-                    
-                    story.append(table)
-                    story.append(Spacer(1, 20))
-                    
-            except Exception as e:
-                logging.warning(f"Failed to process sheet '{sheet_name}': {e}")
-                # Add error note
-                error_para = Paragraph(f"Error processing sheet '{sheet_name}': {str(e)}", styles['Normal'])
-                story.append(error_para)
-                story.append(Spacer(1, 12))
-        
-        # Build PDF
-        doc.build(story)
-        
-        logging.info(f"Successfully converted {excel_path} to {pdf_path}")
+        logging.info(f"Successfully converted {excel_path} to {pdf_path} in {time.perf_counter() - started:.1f}s")
         return pdf_path
         
     except Exception as e:
@@ -188,18 +287,20 @@ def batch_convert_excel_files(excel_files: list, output_dir: str) -> list:
     Returns:
         List of converted PDF file paths
     """
-    converted_files = []
+    from process_pool import map_cpu_bound_sync
     
+    jobs = []
     for excel_file in excel_files:
-        try:
-            base_name = os.path.splitext(os.path.basename(excel_file))[0]
-            pdf_path = os.path.join(output_dir, f"{base_name}.pdf")
-            
-            converted_pdf = excel_to_pdf(excel_file, pdf_path)
-            converted_files.append(converted_pdf)
-            
-        except Exception as e:
-            logging.error(f"Failed to convert {excel_file}: {e}")
+        base_name = os.path.splitext(os.path.basename(excel_file))[0]
+        jobs.append((excel_file, os.path.join(output_dir, f"{base_name}.pdf")))
+    
+    # Files are converted in parallel across the process pool
+    converted_files = []
+    for (excel_file, _), result in zip(jobs, map_cpu_bound_sync(excel_to_pdf, jobs)):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to convert {excel_file}: {result}")
+        else:
+            converted_files.append(result)
     
     return converted_files
 
@@ -208,3 +309,4 @@ def is_excel_file(file_path: str) -> bool:
     """Check if file is an Excel file based on extension."""
     excel_extensions = {'.xlsx', '.xls', '.xlsm', '.xlsb'}
     return os.path.splitext(file_path.lower())[1] in excel_extensions
+
@@ -0,0 +1,126 @@
+"""
+excel_to_text_converter.py
+--------------------------
+Converts Excel files to structured text for knowledge base upload, as a fast
+alternative to rendering a PDF.
+
+Two layouts are supported:
+- "records": one block per row, headed by the sheet name and the row number as
+  shown in Excel, with a "Header: value" line per non-empty cell. Each row stays
+  self-contained when the vector store chunks the file, which keeps row-level
+  retrieval precise.
+- "markdown": one markdown table per sheet; the header row is repeated every
+  MARKDOWN_HEADER_EVERY rows so chunks keep their column names.
+
+Rows are streamed with excel_to_pdf_converter.WorkbookReader and written straight
+to disk, so memory does not grow with the workbook.
+"""
+
+import os
+import time
+import logging
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+from excel_to_pdf_converter import WorkbookReader
+
+TEXT_FORMATS = ("records", "markdown")
+MARKDOWN_HEADER_EVERY = int(os.getenv("EXCEL_MARKDOWN_HEADER_EVERY", "50"))
+
+
+def _column_names(header: List[str], width: int) -> List[str]:
+    return [
+        (header[i] if i < len(header) and header[i] else f"Column {i + 1}")
+        for i in range(width)
+    ]
+
+
+def _records(sheet_name: str, rows: Iterator[Tuple[int, List[str]]]) -> Iterator[str]:
+    _, header = next(rows, (None, None))
+    if header is None:
+        return
+    for row_number, row in rows:  # Spreadsheet row numbers, blank rows skipped
+        columns = _column_names(header, max(len(header), len(row)))
+        lines = [f"{name}: {value}" for name, value in zip(columns, row) if value]
+        if lines:
+            yield f"[Sheet: {sheet_name} | Row {row_number}]\n" + "\n".join(lines) + "\n\n"
+
+
+def _markdown_cell(value: str) -> str:
+    return " ".join(value.split()).replace("|", "\\|")
+
+
+def _markdown(sheet_name: str, rows: Iterator[List[str]]) -> Iterator[str]:
+    header = next(rows, None)
+    if header is None:
+        return
+    columns: List[str] = []
+    written = 0
+    for row in rows:
+        repeat_header = written % MARKDOWN_HEADER_EVERY == 0
+        if len(row) > len(columns) or not columns:
+            columns = _column_names(header, max(len(header), len(row), len(columns)))
+            repeat_header = True  # Cells beyond the header widen the table
+        if written == 0:
+            yield f"## Sheet: {sheet_name}\n\n"
+        if repeat_header:
+            yield ("\n" if written else "") + "| " + " | ".join(_markdown_cell(name) for name in columns) + " |\n"
+            yield "|" + "---|" * len(columns) + "\n"
+        cells = row + [""] * (len(columns) - len(row))
+        yield "| " + " | ".join(_markdown_cell(value) for value in cells) + " |\n"
+        written += 1
+    if written:
+        yield "\n"
+
+
+def excel_to_text(excel_path: str, output_path: Optional[str] = None, text_format: str = "records") -> str:
+    """
+    Convert Excel file to a structured text file.
+
+    Args:
+        excel_path: Path to the Excel file
+        output_path: Output path (optional, auto-generated next to the Excel file if not provided)
+        text_format: "records" or "markdown"
+
+    Returns:
+        Path to the generated text file
+
+    Raises:
+        ValueError: If text_format is unknown
+        Exception: If conversion fails
+    """
+    if text_format not in TEXT_FORMATS:
+        raise ValueError(f"Unknown Excel text format '{text_format}', expected one of {TEXT_FORMATS}")
+    sheet_writer = _records if text_format == "records" else _markdown
+
+    started = time.perf_counter()
+    if output_path is None:
+        base_name = os.path.splitext(os.path.basename(excel_path))[0]
+        output_path = os.path.join(os.path.dirname(excel_path), f"{base_name}.md")
+
+    try:
+        with WorkbookReader(excel_path) as reader, open(output_path, "w", encoding="utf-8") as out:
+            out.write(f"# Document: {os.path.basename(excel_path)}\n\n")
+            for sheet_name, rows in reader.iter_sheets(numbered=sheet_writer is _records):
+                try:
+                    out.writelines(sheet_writer(sheet_name, rows))
+                except Exception as e:
+                    logging.warning(f"Failed to process sheet '{sheet_name}': {e}")
+                    out.write(f"Error processing sheet '{sheet_name}': {str(e)}\n\n")
+    except Exception as e:
+        logging.error(f"Failed to convert Excel to {text_format} text: {e}")
+        raise
+
+    logging.info(f"Converted {excel_path} to {text_format} text {output_path} in {time.perf_counter() - started:.1f}s")
+    return output_path
+
+
+def convert_excel_to_text_for_knowledge_base(excel_path: str, temp_dir: Optional[str] = None,
+                                             text_format: str = "records") -> str:
+    """
+    Convert Excel file to structured text specifically for knowledge base upload.
+    Creates a temporary .md file that can be uploaded and then cleaned up.
+    """
+    if temp_dir is None:
+        temp_dir = tempfile.gettempdir()
+    base_name = os.path.splitext(os.path.basename(excel_path))[0]
+    return excel_to_text(excel_path, os.path.join(temp_dir, f"{base_name}_converted.md"), text_format)
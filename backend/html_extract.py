@@ -0,0 +1,182 @@
+"""
+html_extract.py
+---------------
+HTML text and link extraction for the website crawler and scanner.
+
+Extractors share one interface so the implementation can be chosen with the
+HTML_EXTRACTOR setting:
+- "lxml" (default): lxml's C parser; drops navigation, header/footer, sidebars,
+  forms and cookie/consent banners before extracting text
+- "soup": the original BeautifulSoup html.parser path (all visible text)
+
+backend/benchmarks/bench_html_extract.py compares both over saved pages.
+"""
+
+import os
+import re
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+from urllib.parse import urljoin, urldefrag
+
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "lxml")  # "lxml" or "soup"
+
+SKIPPED_HREF_PREFIXES = ("#", "mailto:", "javascript:", "tel:")
+
+class HtmlExtractor(ABC):
+    @abstractmethod
+    def parse(self, html: str, page_url: str) -> Tuple[str, List[str]]:
+        """Returns (page text, absolute link URLs without fragments) from one parse of the page."""
+
+    def extract_text(self, html: str) -> str:
+        return self.parse(html, "")[0]
+
+    def extract_links(self, html: str, page_url: str) -> List[str]:
+        return self.parse(html, page_url)[1]
+
+def _resolve_links(hrefs, page_url: str) -> List[str]:
+    links = []
+    for href in hrefs:
+        href = href.strip()
+        if not href or href.startswith(SKIPPED_HREF_PREFIXES):
+            continue
+        links.append(urldefrag(urljoin(page_url, href)).url)
+    return links
+
+# --- BeautifulSoup (original path) ---
+class SoupHtmlExtractor(HtmlExtractor):
+    """All visible text via BeautifulSoup's pure-Python html.parser."""
+
+    def parse(self, html: str, page_url: str) -> Tuple[str, List[str]]:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, "html.parser")
+        links = _resolve_links((a["href"] for a in soup.find_all("a", href=True)), page_url)
+
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Get text content and clean up whitespace
+        lines = (line.strip() for line in soup.get_text().splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return ' '.join(chunk for chunk in chunks if chunk), links
+
+# --- lxml with boilerplate removal ---
+NON_CONTENT_TAGS = ("script", "style", "noscript", "template", "svg", "canvas", "iframe", "object")
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form", "button", "select", "dialog", "menu"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "search", "complementary", "menu", "menubar", "dialog"}
+BOILERPLATE_MARKERS = (
+    "cookie", "consent", "gdpr", "breadcrumb", "navbar", "nav", "menu", "sidebar", "skip",
+    "share", "social", "newsletter", "subscribe", "pagination", "related", "advert", "banner", "footer"
+)
+# A boilerplate candidate holding more than this share of the page text is a layout
+# wrapper (e.g. a page-wide <form> or "has-sidebar" div) and is kept
+BOILERPLATE_MAX_TEXT_SHARE = 0.6
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "br", "pre", "blockquote", "dd", "dt", "dl", "figcaption", "caption"
+}
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")  # lxml rejects str input that declares an encoding
+_WHITESPACE = re.compile(r"[ \t\r\f\v\u00a0]+")
+_LINE_BREAKS = re.compile(r" ?\n[\s]*")
+_TOKEN_SPLIT = re.compile(r"[\s_-]+")
+
+def _has_boilerplate_marker(element) -> bool:
+    value = f"{element.get('id', '')} {element.get('class', '')}".lower()
+    return bool(value.strip()) and any(token in BOILERPLATE_MARKERS for token in _TOKEN_SPLIT.split(value))
+
+def _is_boilerplate(element) -> bool:
+    return (
+        element.tag in BOILERPLATE_TAGS
+        or element.get("role") in BOILERPLATE_ROLES
+        or element.get("aria-hidden") == "true"
+        or element.get("hidden") is not None
+        or _has_boilerplate_marker(element)
+    )
+
+class LxmlHtmlExtractor(HtmlExtractor):
+    """Main-content text via lxml, with navigation and boilerplate blocks removed."""
+
+    def parse(self, html: str, page_url: str) -> Tuple[str, List[str]]:
+        import lxml.html
+        from lxml import etree
+
+        if not html or not html.strip():
+            return "", []
+        try:
+            root = lxml.html.document_fromstring(_XML_DECLARATION.sub("", html, count=1))
+        except (etree.ParserError, ValueError) as e:
+            logging.warning(f"lxml could not parse {page_url or 'page'}: {e}")
+            return "", []
+
+        # Links are taken before boilerplate removal so navigation still drives the crawl
+        links = _resolve_links(root.xpath("//a/@href"), page_url)
+
+        etree.strip_elements(root, *NON_CONTENT_TAGS, with_tail=False)
+        # Comments and processing instructions go, but the text after them (their tail) stays
+        etree.strip_tags(root, etree.Comment, etree.ProcessingInstruction)
+        body = root.find("body")
+        body = body if body is not None else root
+        page_length = len(body.text_content()) or 1
+
+        candidates = [el for el in body.iterdescendants() if isinstance(el.tag, str) and _is_boilerplate(el)]
+        for element in candidates:
+            if element.getroottree().getroot() is not root:
+                continue  # Already removed with an ancestor
+            if element.tag != "nav" and len(element.text_content()) > page_length * BOILERPLATE_MAX_TEXT_SHARE:
+                continue
+            if element.tag == "header" and any(a.tag in ("main", "article") for a in element.iterancestors()):
+                continue  # Article headers carry the title
+            element.drop_tree()
+
+        # Prefer the main content regions when the page marks them
+        regions = body.xpath(".//main | .//*[@role='main'] | .//article[not(ancestor::main) and not(ancestor::article)]")
+        regions = [el for el in regions if not any(a in regions for a in el.iterancestors())]
+        containers = regions or [body]
+
+        return "\n".join(filter(None, (self._text(el) for el in containers))), links
+
+    @staticmethod
+    def _text(element) -> str:
+        # Line breaks at block boundaries keep paragraphs, cells and list items apart
+        from lxml import etree
+
+        parts = []
+        for event, node in etree.iterwalk(element, events=("start", "end")):
+            if not isinstance(node.tag, str):
+                continue
+            block = node.tag in BLOCK_TAGS
+            if event == "start":
+                if block:
+                    parts.append("\n")
+                if node.text:
+                    parts.append(node.text)
+            else:
+                if block:
+                    parts.append("\n")
+                if node.tail and node is not element:
+                    parts.append(node.tail)
+        text = _WHITESPACE.sub(" ", "".join(parts))
+        return _LINE_BREAKS.sub("\n", text).strip()
+
+_EXTRACTORS = {"lxml": LxmlHtmlExtractor, "soup": SoupHtmlExtractor}
+_extractor = None
+
+def set_html_extractor(extractor: HtmlExtractor):
+    """Overrides the configured extractor."""
+    global _extractor
+    _extractor = extractor
+
+def get_html_extractor() -> HtmlExtractor:
+    global _extractor
+    if _extractor is None:
+        if HTML_EXTRACTOR not in _EXTRACTORS:
+            logging.warning(f"Unknown HTML_EXTRACTOR '{HTML_EXTRACTOR}', using lxml")
+        _extractor = _EXTRACTORS.get(HTML_EXTRACTOR, LxmlHtmlExtractor)()
+    return _extractor
+
+__all__ = [
+    "HtmlExtractor", "LxmlHtmlExtractor", "SoupHtmlExtractor",
+    "get_html_extractor", "set_html_extractor", "HTML_EXTRACTOR"
+]
@@ -0,0 +1,232 @@
+"""
+http_client.py
+--------------
+Shared, pooled HTTP clients for OpenAI and other outbound REST calls.
+
+- get_http_session(): blocking requests.Session for code running in worker threads
+- get_openai_client(): blocking openai.OpenAI for code running in worker threads
+- get_async_http_client(): httpx.AsyncClient for code running on the event loop
+- get_async_openai_client(): openai.AsyncOpenAI sharing the async connection pool
+
+Both HTTP clients keep connections alive and retry with exponential backoff on
+429 and 5xx responses (honoring Retry-After), so one worker can keep hundreds of
+outbound calls in flight without blocking the event loop. Non-idempotent requests
+(POST uploads, run creation) are only retried when the server never processed
+them: on 429 or when the connection could not be opened.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, TypeVar
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OPENAI_API_BASE = "https://api.openai.com/v1"
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))  # 0.5s, 1s, 2s, 4s, ...
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "200"))
+ASYNC_HTTP_MAX_KEEPALIVE = int(os.getenv("ASYNC_HTTP_MAX_KEEPALIVE", "50"))
+ASYNC_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+MAX_BACKOFF_SECONDS = 30.0
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+# Failures raised before the request reached the server, so replaying it cannot duplicate anything
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+T = TypeVar("T")
+
+def _should_retry(method: str, status_code: int = None, error: Exception = None) -> bool:
+    """Whether a failed attempt may be replayed. A POST that timed out or got a 5xx may already have been applied."""
+    if method.upper() in IDEMPOTENT_METHODS:
+        return error is not None or status_code in RETRY_STATUSES
+    return isinstance(error, UNSENT_ERRORS) or status_code == 429
+
+_session = None
+_session_lock = threading.Lock()
+
+class _IdempotentRetry(Retry):
+    """
+    urllib3 always retries connect errors; read errors and RETRY_STATUSES are only
+    retried for IDEMPOTENT_METHODS. Other methods (POST) are also retried on 429.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return bool(self.total) and _should_retry(method, status_code)
+        return super().is_retry(method, status_code, has_retry_after)
+
+def _build_session() -> requests.Session:
+    retry = _IdempotentRetry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_http_session() -> requests.Session:
+    """Returns the process-wide pooled session (thread-safe)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+_openai_client = None
+
+def get_openai_client() -> openai.OpenAI:
+    """Returns the process-wide blocking OpenAI client (thread-safe)."""
+    global _openai_client
+    if _openai_client is None:
+        with _session_lock:
+            if _openai_client is None:
+                _openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=HTTP_MAX_RETRIES)
+    return _openai_client
+
+def openai_headers() -> dict:
+    return {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+
+# --- Async clients ---
+# httpx connections belong to the event loop that opened them, so the shared
+# clients are rebuilt if they are requested from a different loop.
+_async_clients = {"loop": None, "http": None, "openai": None}
+
+def _close_stale_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+    """Closes a client left behind by another event loop (best effort; a closed loop's sockets are dropped)."""
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+
+    async def close():
+        try:
+            await client.aclose()
+        except Exception as e:
+            logging.debug(f"Closing the previous event loop's HTTP client failed: {e!r}")
+
+    asyncio.get_running_loop().create_task(close())
+
+def _current_loop_clients() -> dict:
+    loop = asyncio.get_running_loop()
+    if _async_clients["loop"] is not loop:
+        if _async_clients["http"] is not None:
+            _close_stale_client(_async_clients["http"], _async_clients["loop"])
+        _async_clients.update(loop=loop, http=None, openai=None)
+    return _async_clients
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Returns the event loop's shared keep-alive httpx client. Must be called from async code."""
+    clients = _current_loop_clients()
+    if clients["http"] is None:
+        clients["http"] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_HTTP_MAX_KEEPALIVE
+            ),
+            timeout=ASYNC_HTTP_TIMEOUT,
+            follow_redirects=True
+        )
+    return clients["http"]
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """Returns an AsyncOpenAI client that shares the async connection pool."""
+    clients = _current_loop_clients()
+    if clients["openai"] is None:
+        clients["openai"] = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_async_http_client(),
+            max_retries=HTTP_MAX_RETRIES
+        )
+    return clients["openai"]
+
+def _retry_delay(attempt: int, response: httpx.Response = None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+    return min(HTTP_BACKOFF_FACTOR * (2 ** attempt), MAX_BACKOFF_SECONDS)
+
+async def async_request(method: str, url: str, retries: int = HTTP_MAX_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Sends a request with the shared async client, retrying 429/5xx responses and
+    transport errors with exponential backoff (for non-idempotent methods only 429
+    and connect errors, see _should_retry). Returns the last response.
+    """
+    client = get_async_http_client()
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if attempt >= retries or not _should_retry(method, error=e):
+                raise
+            delay = _retry_delay(attempt)
+            logging.warning(f"{method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if attempt >= retries or not _should_retry(method, status_code=response.status_code):
+            return response
+        delay = _retry_delay(attempt, response)
+        logging.warning(f"{method} {url} returned HTTP {response.status_code}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+# --- Non-idempotent SDK calls ---
+# The OpenAI SDK sends no idempotency key and replays POSTs after read timeouts and
+# 5xx responses, so calls that create a file, message or run use a client without
+# SDK retries and are only retried when the server never saw them.
+def _sdk_unsent(error: Exception) -> bool:
+    return isinstance(error, openai.RateLimitError) or isinstance(error.__cause__, UNSENT_ERRORS)
+
+def create_once(call: Callable[[openai.OpenAI], T], retries: int = HTTP_MAX_RETRIES) -> T:
+    """Runs call(client) with a no-retry blocking OpenAI client, retrying only 429s and connect errors."""
+    client = get_openai_client().with_options(max_retries=0)
+    for attempt in range(retries + 1):
+        try:
+            return call(client)
+        except openai.APIError as e:
+            if attempt >= retries or not _sdk_unsent(e):
+                raise
+            delay = _retry_delay(attempt, getattr(e, "response", None))
+            logging.warning(f"OpenAI request failed before it was processed ({e!r}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+async def create_once_async(call: Callable[[openai.AsyncOpenAI], Awaitable[T]], retries: int = HTTP_MAX_RETRIES) -> T:
+    """Async create_once with the shared AsyncOpenAI connection pool."""
+    client = get_async_openai_client().with_options(max_retries=0)
+    for attempt in range(retries + 1):
+        try:
+            return await call(client)
+        except openai.APIError as e:
+            if attempt >= retries or not _sdk_unsent(e):
+                raise
+            delay = _retry_delay(attempt, getattr(e, "response", None))
+            logging.warning(f"OpenAI request failed before it was processed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def close_async_clients():
+    """Closes the shared async clients (call on application shutdown)."""
+    if _async_clients["http"] is not None:
+        await _async_clients["http"].aclose()
+    _async_clients.update(loop=None, http=None, openai=None)
+
+__all__ = [
+    "get_http_session", "get_openai_client", "openai_headers", "OPENAI_API_BASE",
+    "get_async_http_client", "get_async_openai_client", "async_request", "close_async_clients",
+    "create_once", "create_once_async"
+]
@@ -0,0 +1,110 @@
+"""
+knowledge_catalog.py
+--------------------
+Local catalog of the files attached to the OpenAI vector store.
+
+/knowledge/files is served from the KnowledgeFile table instead of listing the
+vector store and fetching every file's details on each request. Uploads and
+deletes update the catalog directly; a periodic refresh in openai_file_upload
+reconciles it with the vector store.
+
+Files uploaded through this API also carry the SHA-256 of their bytes, which
+makes duplicate detection a single indexed lookup.
+"""
+
+import logging
+from datetime import datetime
+from typing import List, Optional
+from sqlmodel import Session, select, delete, col
+from db import engine
+from models import KnowledgeFile
+
+_last_refresh_at: Optional[datetime] = None
+
+def _to_dict(row: KnowledgeFile) -> dict:
+    return {
+        "id": row.id,
+        "filename": row.filename,
+        "size": row.size,
+        "created_at": row.created_at,
+        "purpose": row.purpose
+    }
+
+def _apply(session: Session, file_info: dict, content_hash: Optional[str] = None):
+    """Inserts or updates a row, keeping a known content hash when the listing has none."""
+    row = session.get(KnowledgeFile, file_info["id"]) or KnowledgeFile(id=file_info["id"], filename="Unknown")
+    row.filename = file_info.get("filename", "Unknown")
+    row.size = file_info.get("size", 0)
+    row.created_at = file_info.get("created_at", 0)
+    row.purpose = file_info.get("purpose", "assistants")
+    if content_hash:
+        row.content_hash = content_hash
+    row.synced_at = datetime.utcnow()
+    session.add(row)
+
+def upsert_catalog_file(file_info: dict, content_hash: Optional[str] = None):
+    """Adds or updates one file (same dict shape as get_vector_store_files)."""
+    with Session(engine) as session:
+        _apply(session, file_info, content_hash)
+        session.commit()
+
+def remove_catalog_file(file_id: str):
+    with Session(engine) as session:
+        session.exec(delete(KnowledgeFile).where(KnowledgeFile.id == file_id))
+        session.commit()
+
+def find_catalog_file_by_hash(content_hash: str) -> Optional[dict]:
+    """Indexed lookup of a file with identical content."""
+    with Session(engine) as session:
+        row = session.exec(select(KnowledgeFile).where(KnowledgeFile.content_hash == content_hash).limit(1)).first()
+        return _to_dict(row) if row else None
+
+def find_catalog_file(filename: str, size: int) -> Optional[dict]:
+    """Lookup by name and size, for files catalogued without a content hash."""
+    with Session(engine) as session:
+        row = session.exec(
+            select(KnowledgeFile)
+            .where(KnowledgeFile.filename == filename, KnowledgeFile.size == size)
+            .where(col(KnowledgeFile.content_hash).is_(None))
+            .limit(1)
+        ).first()
+        return _to_dict(row) if row else None
+
+def list_catalog_files() -> List[dict]:
+    """All catalogued files, newest first."""
+    with Session(engine) as session:
+        rows = session.exec(select(KnowledgeFile).order_by(col(KnowledgeFile.created_at).desc())).all()
+        return [_to_dict(row) for row in rows]
+
+def replace_catalog(files: List[dict], started_at: datetime, remote_ids: Optional[List[str]] = None):
+    """
+    Reconciles the catalog with a full vector store listing taken at `started_at`.
+    `remote_ids` are all file ids in the listing (the ids of `files` by default); rows are
+    only deleted when their file is gone from it, so a file whose details could not be
+    fetched keeps its existing row and content hash. Rows written after the listing
+    started (e.g. a concurrent upload) are kept.
+    """
+    global _last_refresh_at
+    if remote_ids is None:
+        remote_ids = [f["id"] for f in files]
+    with Session(engine) as session:
+        for f in files:
+            _apply(session, f)
+        session.exec(
+            delete(KnowledgeFile)
+            .where(col(KnowledgeFile.id).not_in(remote_ids))
+            .where(KnowledgeFile.synced_at < started_at)
+        )
+        session.commit()
+    _last_refresh_at = datetime.utcnow()
+    logging.info(f"Knowledge catalog refreshed: {len(remote_ids)} files ({len(files)} with details)")
+
+def last_refresh_at() -> Optional[datetime]:
+    """When this worker last reconciled the catalog (None if never)."""
+    return _last_refresh_at
+
+__all__ = [
+    "upsert_catalog_file", "remove_catalog_file", "list_catalog_files",
+    "find_catalog_file_by_hash", "find_catalog_file",
+    "replace_catalog", "last_refresh_at"
+]
@@ -0,0 +1,668 @@
+"""
+llm_backend.py
+--------------
+Backend interface for every LLM provider call the app makes: chat completions,
+embeddings, assistant threads and runs, file storage and vector store operations.
+
+LLM_BACKEND setting:
+- "openai" (default): the OpenAI API, through the pooled clients in http_client
+- "stub": an in-process fake with no network access, for load tests and profiling
+  on an offline machine. Each call waits for a sampled latency and may fail with an
+  injected error; assistant runs take a sampled duration and may end "failed".
+  Replies are derived from the request text, embeddings are feature-hashed from it
+  (hashing_embedding), and latencies come from a seeded RNG.
+
+Stub settings:
+- LLM_STUB_LATENCY_SECONDS: mean latency of one API call (default 0.05)
+- LLM_STUB_RUN_SECONDS: mean time until an assistant run ends (default 2)
+- LLM_STUB_LATENCY_DISTRIBUTION: "fixed", "uniform", "exponential" or "lognormal" (default)
+- LLM_STUB_ERROR_RATE: probability that a call raises LLMBackendError (default 0)
+- LLM_STUB_RUN_FAILURE_RATE: probability that a run ends "failed" (default 0)
+- LLM_STUB_SEED: RNG seed (default 0)
+
+Every operation has a blocking method for worker threads and an `_async` method
+for the event loop, following the foo / foo_async naming used across the app.
+"""
+
+import os
+import re
+import math
+import zlib
+import time
+import random
+import asyncio
+import logging
+import threading
+import itertools
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+from http_client import (
+    get_openai_client, get_async_openai_client, get_http_session, async_request, openai_headers, OPENAI_API_BASE,
+    create_once, create_once_async
+)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")  # "openai" or "stub"
+
+LLM_STUB_LATENCY_SECONDS = float(os.getenv("LLM_STUB_LATENCY_SECONDS", "0.05"))
+LLM_STUB_RUN_SECONDS = float(os.getenv("LLM_STUB_RUN_SECONDS", "2"))
+LLM_STUB_LATENCY_DISTRIBUTION = os.getenv("LLM_STUB_LATENCY_DISTRIBUTION", "lognormal")
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+LLM_STUB_RUN_FAILURE_RATE = float(os.getenv("LLM_STUB_RUN_FAILURE_RATE", "0"))
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+LOGNORMAL_SIGMA = 0.5
+
+class LLMBackendError(RuntimeError):
+    """A provider call failed (non-2xx response or injected stub error)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+@dataclass
+class RunState:
+    id: str
+    status: str
+    last_error: Optional[str] = None
+
+class LLMBackend(ABC):
+    """
+    Provider operations used by the app. Files, vector store files and batches are
+    returned as dicts shaped like the OpenAI REST objects ("id", "filename", "bytes",
+    "created_at", "purpose" for files; "id", "status", "file_counts" for batches).
+    """
+
+    def is_configured(self) -> bool:
+        """Whether the backend has the credentials it needs."""
+        return True
+
+    # --- Chat completion ---
+    @abstractmethod
+    def chat_completion(self, messages: List[dict], model: str, **params) -> str:
+        """Returns the reply text for a list of {"role", "content"} messages."""
+
+    @abstractmethod
+    async def chat_completion_async(self, messages: List[dict], model: str, **params) -> str: ...
+
+    # --- Embeddings ---
+    @abstractmethod
+    def embed(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]:
+        """One `dimensions`-sized vector per input text, in input order."""
+
+    @abstractmethod
+    async def embed_async(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]: ...
+
+    # --- Assistant threads and runs ---
+    @abstractmethod
+    def create_thread(self, messages: Optional[List[dict]] = None) -> str:
+        """Creates a thread (optionally with initial messages) and returns its id."""
+
+    @abstractmethod
+    async def create_thread_async(self, messages: Optional[List[dict]] = None) -> str: ...
+
+    @abstractmethod
+    def add_message(self, thread_id: str, content: str, role: str = "user"): ...
+
+    @abstractmethod
+    async def add_message_async(self, thread_id: str, content: str, role: str = "user"): ...
+
+    @abstractmethod
+    def start_run(self, thread_id: str, assistant_id: str) -> str:
+        """Starts an assistant run on a thread and returns the run id."""
+
+    @abstractmethod
+    async def start_run_async(self, thread_id: str, assistant_id: str) -> str: ...
+
+    @abstractmethod
+    def retrieve_run(self, thread_id: str, run_id: str) -> RunState: ...
+
+    @abstractmethod
+    async def retrieve_run_async(self, thread_id: str, run_id: str) -> RunState: ...
+
+    @abstractmethod
+    def cancel_run(self, thread_id: str, run_id: str): ...
+
+    @abstractmethod
+    async def cancel_run_async(self, thread_id: str, run_id: str): ...
+
+    @abstractmethod
+    def latest_assistant_message(self, thread_id: str) -> Optional[str]:
+        """Text of the newest assistant message on the thread, None if there is none."""
+
+    @abstractmethod
+    async def latest_assistant_message_async(self, thread_id: str) -> Optional[str]: ...
+
+    # --- File storage ---
+    @abstractmethod
+    def upload_file(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict: ...
+
+    @abstractmethod
+    async def upload_file_async(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict: ...
+
+    @abstractmethod
+    async def get_file_async(self, file_id: str) -> Optional[dict]:
+        """The file object, None when it cannot be read."""
+
+    @abstractmethod
+    async def delete_file_async(self, file_id: str) -> bool: ...
+
+    # --- Vector stores ---
+    @abstractmethod
+    def attach_file(self, vector_store_id: str, file_id: str) -> dict: ...
+
+    @abstractmethod
+    async def attach_file_async(self, vector_store_id: str, file_id: str) -> dict: ...
+
+    @abstractmethod
+    async def detach_file_async(self, vector_store_id: str, file_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_vector_store_file_async(self, vector_store_id: str, file_id: str) -> Optional[dict]:
+        """The vector store file ("status" is "in_progress" while indexing), None when it cannot be read."""
+
+    @abstractmethod
+    async def create_file_batch_async(self, vector_store_id: str, file_ids: List[str]) -> dict: ...
+
+    @abstractmethod
+    async def get_file_batch_async(self, vector_store_id: str, batch_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_vector_store_files_async(self, vector_store_id: str, limit: int = 100,
+                                            after: Optional[str] = None) -> dict:
+        """One page of the vector store's files: {"data": [...], "has_more": bool, "last_id": str}."""
+
+    @abstractmethod
+    def use_vector_store(self, assistant_id: str, vector_store_id: str):
+        """Points the assistant's file_search tool at the vector store."""
+
+# --- OpenAI ---
+def _file_dict(file) -> dict:
+    return {
+        "id": file.id,
+        "filename": file.filename,
+        "bytes": file.bytes,
+        "created_at": file.created_at,
+        "purpose": file.purpose
+    }
+
+def _run_state(run) -> RunState:
+    last_error = getattr(run, "last_error", None)
+    return RunState(run.id, run.status, getattr(last_error, "message", None) if last_error else None)
+
+def _assistant_text(messages) -> Optional[str]:
+    for message in messages.data:  # Newest first
+        if message.role == "assistant" and message.content:
+            return message.content[0].text.value
+    return None
+
+def _json_or_raise(response, ok=(200,)) -> dict:
+    if response.status_code not in ok:
+        raise LLMBackendError(f"HTTP {response.status_code}: {response.text}", response.status_code)
+    return response.json()
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI API. SDK calls use the shared clients; files and vector stores go through the pooled REST helpers."""
+
+    def is_configured(self) -> bool:
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def chat_completion(self, messages: List[dict], model: str, **params) -> str:
+        response = get_openai_client().chat.completions.create(model=model, messages=messages, **params)
+        return response.choices[0].message.content or ""
+
+    async def chat_completion_async(self, messages: List[dict], model: str, **params) -> str:
+        response = await get_async_openai_client().chat.completions.create(model=model, messages=messages, **params)
+        return response.choices[0].message.content or ""
+
+    def embed(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]:
+        response = get_openai_client().embeddings.create(model=model, input=texts, dimensions=dimensions)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    async def embed_async(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]:
+        response = await get_async_openai_client().embeddings.create(model=model, input=texts, dimensions=dimensions)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def create_thread(self, messages: Optional[List[dict]] = None) -> str:
+        return get_openai_client().beta.threads.create(**({"messages": messages} if messages else {})).id
+
+    async def create_thread_async(self, messages: Optional[List[dict]] = None) -> str:
+        thread = await get_async_openai_client().beta.threads.create(**({"messages": messages} if messages else {}))
+        return thread.id
+
+    def add_message(self, thread_id: str, content: str, role: str = "user"):
+        create_once(lambda client: client.beta.threads.messages.create(thread_id=thread_id, role=role, content=content))
+
+    async def add_message_async(self, thread_id: str, content: str, role: str = "user"):
+        await create_once_async(
+            lambda client: client.beta.threads.messages.create(thread_id=thread_id, role=role, content=content)
+        )
+
+    def start_run(self, thread_id: str, assistant_id: str) -> str:
+        return create_once(lambda client: client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)).id
+
+    async def start_run_async(self, thread_id: str, assistant_id: str) -> str:
+        run = await create_once_async(
+            lambda client: client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        )
+        return run.id
+
+    def retrieve_run(self, thread_id: str, run_id: str) -> RunState:
+        return _run_state(get_openai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id))
+
+    async def retrieve_run_async(self, thread_id: str, run_id: str) -> RunState:
+        return _run_state(await get_async_openai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id))
+
+    def cancel_run(self, thread_id: str, run_id: str):
+        get_openai_client().beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+
+    async def cancel_run_async(self, thread_id: str, run_id: str):
+        await get_async_openai_client().beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+
+    def latest_assistant_message(self, thread_id: str) -> Optional[str]:
+        return _assistant_text(get_openai_client().beta.threads.messages.list(thread_id=thread_id))
+
+    async def latest_assistant_message_async(self, thread_id: str) -> Optional[str]:
+        return _assistant_text(await get_async_openai_client().beta.threads.messages.list(thread_id=thread_id))
+
+    def upload_file(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict:
+        with open(file_path, "rb") as f:
+            file = create_once(lambda client: client.files.create(file=(filename, f) if filename else f, purpose=purpose))
+        return _file_dict(file)
+
+    async def upload_file_async(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict:
+        def read() -> bytes:
+            with open(file_path, "rb") as f:
+                return f.read()
+
+        response = await async_request(
+            "POST",
+            f"{OPENAI_API_BASE}/files",
+            headers=openai_headers(),
+            files={"file": (filename or os.path.basename(file_path), await asyncio.to_thread(read))},
+            data={"purpose": purpose},
+            timeout=300
+        )
+        return _json_or_raise(response)
+
+    async def get_file_async(self, file_id: str) -> Optional[dict]:
+        response = await async_request("GET", f"{OPENAI_API_BASE}/files/{file_id}", headers=openai_headers(), timeout=30)
+        if response.status_code != 200:
+            logging.warning(f"Failed to get details for file {file_id}: HTTP {response.status_code}")
+            return None
+        return response.json()
+
+    async def delete_file_async(self, file_id: str) -> bool:
+        response = await async_request("DELETE", f"{OPENAI_API_BASE}/files/{file_id}", headers=openai_headers(), timeout=60)
+        if response.status_code not in (200, 204):
+            logging.warning(f"Failed to delete file {file_id} from OpenAI storage: {response.text}")
+            return False
+        return True
+
+    def attach_file(self, vector_store_id: str, file_id: str) -> dict:
+        response = get_http_session().post(
+            f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/files",
+            headers=openai_headers(),
+            json={"file_id": file_id},
+            timeout=60
+        )
+        return _json_or_raise(response)
+
+    async def attach_file_async(self, vector_store_id: str, file_id: str) -> dict:
+        response = await async_request(
+            "POST",
+            f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/files",
+            headers=openai_headers(),
+            json={"file_id": file_id},
+            timeout=60
+        )
+        return _json_or_raise(response)
+
+    async def detach_file_async(self, vector_store_id: str, file_id: str) -> bool:
+        response = await async_request(
+            "DELETE", f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/files/{file_id}", headers=openai_headers(), timeout=60
+        )
+        if response.status_code not in (200, 204):
+            logging.warning(f"Failed to remove file {file_id} from vector store: {response.text}")
+            return False
+        return True
+
+    async def get_vector_store_file_async(self, vector_store_id: str, file_id: str) -> Optional[dict]:
+        response = await async_request(
+            "GET", f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/files/{file_id}", headers=openai_headers(), timeout=30
+        )
+        return response.json() if response.status_code == 200 else None
+
+    async def create_file_batch_async(self, vector_store_id: str, file_ids: List[str]) -> dict:
+        response = await async_request(
+            "POST",
+            f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/file_batches",
+            headers=openai_headers(),
+            json={"file_ids": file_ids},
+            timeout=60
+        )
+        return _json_or_raise(response)
+
+    async def get_file_batch_async(self, vector_store_id: str, batch_id: str) -> Optional[dict]:
+        response = await async_request(
+            "GET", f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/file_batches/{batch_id}", headers=openai_headers(), timeout=30
+        )
+        return response.json() if response.status_code == 200 else None
+
+    async def list_vector_store_files_async(self, vector_store_id: str, limit: int = 100,
+                                            after: Optional[str] = None) -> dict:
+        params = {"limit": limit, **({"after": after} if after else {})}
+        response = await async_request(
+            "GET", f"{OPENAI_API_BASE}/vector_stores/{vector_store_id}/files", headers=openai_headers(), params=params, timeout=30
+        )
+        return _json_or_raise(response)
+
+    def use_vector_store(self, assistant_id: str, vector_store_id: str):
+        get_openai_client().beta.assistants.update(
+            assistant_id=assistant_id,
+            tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}}
+        )
+
+# --- Offline stub ---
+def sample_latency(mean: float, distribution: str, rng: random.Random) -> float:
+    """Draws a delay with the given mean from one of LATENCY_DISTRIBUTIONS."""
+    if mean <= 0:
+        return 0.0
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return rng.uniform(0, 2 * mean)
+    if distribution == "exponential":
+        return rng.expovariate(1 / mean)
+    # Log-normal with the requested mean: a long right tail like real API latencies
+    return rng.lognormvariate(math.log(mean) - LOGNORMAL_SIGMA ** 2 / 2, LOGNORMAL_SIGMA)
+
+def _stub_reply(content: str) -> str:
+    """
+    Extraction-style requests (several question lines, as in questionnaire text or
+    table windows) get the question lines back; anything else gets a canned answer.
+    """
+    questions = [
+        cell.strip()
+        for line in content.splitlines()
+        for cell in line.split(" | ")
+        if cell.strip().endswith("?")
+    ]
+    if len(questions) > 1:
+        return "\n".join(questions)
+    return f"Stub answer: {' '.join(content.split())[:200]}"
+
+def hashing_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic offline embedding: signed feature hashing of words and word bigrams, L2-normalized."""
+    vector = [0.0] * dimensions
+    words = re.findall(r"\w+", text.lower())
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dimensions] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class StubBackend(LLMBackend):
+    """In-process fake provider with sampled latencies, injected errors and timed runs."""
+
+    def __init__(self, latency_seconds: float = LLM_STUB_LATENCY_SECONDS, run_seconds: float = LLM_STUB_RUN_SECONDS,
+                 distribution: str = LLM_STUB_LATENCY_DISTRIBUTION, error_rate: float = LLM_STUB_ERROR_RATE,
+                 run_failure_rate: float = LLM_STUB_RUN_FAILURE_RATE, seed: int = LLM_STUB_SEED):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}', expected one of {LATENCY_DISTRIBUTIONS}")
+        self.latency_seconds = latency_seconds
+        self.run_seconds = run_seconds
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.run_failure_rate = run_failure_rate
+        self.calls = Counter()  # Operation name -> number of calls
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = {}        # thread id -> [{"role", "content"}]
+        self._runs = {}           # run id -> {"thread_id", "ends_at", "outcome", "status"}
+        self._files = {}          # file id -> file dict
+        self._vector_stores = {}  # vector store id -> {file id: vector store file dict}
+        self._batches = {}
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_stub{next(self._ids):06d}"
+
+    def _sample(self, operation: str):
+        with self._lock:
+            self.calls[operation] += 1
+            delay = sample_latency(self.latency_seconds, self.distribution, self._rng)
+            failed = self._rng.random() < self.error_rate
+        return delay, failed
+
+    def _call(self, operation: str, fn, *args):
+        delay, failed = self._sample(operation)
+        time.sleep(delay)
+        if failed:
+            raise LLMBackendError(f"Stub backend: injected error in {operation}", 503)
+        with self._lock:
+            return fn(*args)
+
+    async def _call_async(self, operation: str, fn, *args):
+        delay, failed = self._sample(operation)
+        await asyncio.sleep(delay)
+        if failed:
+            raise LLMBackendError(f"Stub backend: injected error in {operation}", 503)
+        with self._lock:
+            return fn(*args)
+
+    # Operations below run under self._lock
+    def _chat(self, messages: List[dict]) -> str:
+        user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+        return _stub_reply(user_messages[-1] if user_messages else "")
+
+    def _embed(self, texts: List[str], dimensions: int) -> List[List[float]]:
+        return [hashing_embedding(text, dimensions) for text in texts]
+
+    def _create_thread(self, messages: Optional[List[dict]]) -> str:
+        thread_id = self._new_id("thread")
+        self._threads[thread_id] = [{"role": m.get("role", "user"), "content": m["content"]} for m in messages or []]
+        return thread_id
+
+    def _add_message(self, thread_id: str, content: str, role: str):
+        self._threads[thread_id].append({"role": role, "content": content})
+
+    def _start_run(self, thread_id: str, assistant_id: str) -> str:
+        if thread_id not in self._threads:
+            raise LLMBackendError(f"No thread found with id '{thread_id}'", 404)
+        run_id = self._new_id("run")
+        self._runs[run_id] = {
+            "thread_id": thread_id,
+            "ends_at": time.monotonic() + sample_latency(self.run_seconds, self.distribution, self._rng),
+            "outcome": "failed" if self._rng.random() < self.run_failure_rate else "completed",
+            "status": "in_progress"
+        }
+        return run_id
+
+    def _retrieve_run(self, thread_id: str, run_id: str) -> RunState:
+        run = self._runs[run_id]
+        if run["status"] == "in_progress" and time.monotonic() >= run["ends_at"]:
+            run["status"] = run["outcome"]
+            if run["status"] == "completed":
+                thread = self._threads[thread_id]
+                user_messages = [m["content"] for m in thread if m["role"] == "user"]
+                thread.append({"role": "assistant", "content": _stub_reply(user_messages[-1] if user_messages else "")})
+        return RunState(run_id, run["status"], "Stub backend: injected run failure" if run["status"] == "failed" else None)
+
+    def _cancel_run(self, thread_id: str, run_id: str):
+        run = self._runs[run_id]
+        if run["status"] != "in_progress":
+            raise LLMBackendError(f"Cannot cancel run with status '{run['status']}'", 400)
+        run["status"] = "cancelled"
+
+    def _latest_assistant_message(self, thread_id: str) -> Optional[str]:
+        replies = [m["content"] for m in self._threads[thread_id] if m["role"] == "assistant"]
+        return replies[-1] if replies else None
+
+    def _upload_file(self, file_path: str, filename: Optional[str], purpose: str) -> dict:
+        file = {
+            "id": self._new_id("file"),
+            "filename": filename or os.path.basename(file_path),
+            "bytes": os.path.getsize(file_path),
+            "created_at": int(time.time()),
+            "purpose": purpose
+        }
+        self._files[file["id"]] = file
+        return dict(file)
+
+    def _get_file(self, file_id: str) -> Optional[dict]:
+        file = self._files.get(file_id)
+        return dict(file) if file else None
+
+    def _delete_file(self, file_id: str) -> bool:
+        return self._files.pop(file_id, None) is not None
+
+    def _attach_file(self, vector_store_id: str, file_id: str) -> dict:
+        if file_id not in self._files:
+            raise LLMBackendError(f"No file found with id '{file_id}'", 404)
+        entry = {"id": file_id, "vector_store_id": vector_store_id, "status": "completed"}
+        self._vector_stores.setdefault(vector_store_id, {})[file_id] = entry
+        return dict(entry)
+
+    def _detach_file(self, vector_store_id: str, file_id: str) -> bool:
+        return self._vector_stores.get(vector_store_id, {}).pop(file_id, None) is not None
+
+    def _get_vector_store_file(self, vector_store_id: str, file_id: str) -> Optional[dict]:
+        entry = self._vector_stores.get(vector_store_id, {}).get(file_id)
+        return dict(entry) if entry else None
+
+    def _create_file_batch(self, vector_store_id: str, file_ids: List[str]) -> dict:
+        attached = [file_id for file_id in file_ids if file_id in self._files]
+        for file_id in attached:
+            self._attach_file(vector_store_id, file_id)
+        batch = {
+            "id": self._new_id("vsfb"),
+            "vector_store_id": vector_store_id,
+            "status": "completed",
+            "file_counts": {"completed": len(attached), "failed": len(file_ids) - len(attached), "in_progress": 0}
+        }
+        self._batches[batch["id"]] = batch
+        return dict(batch)
+
+    def _get_file_batch(self, vector_store_id: str, batch_id: str) -> Optional[dict]:
+        batch = self._batches.get(batch_id)
+        return dict(batch) if batch else None
+
+    def _list_vector_store_files(self, vector_store_id: str, limit: int, after: Optional[str]) -> dict:
+        file_ids = sorted(self._vector_stores.get(vector_store_id, {}))
+        start = file_ids.index(after) + 1 if after in file_ids else 0
+        page = file_ids[start:start + limit]
+        return {
+            "data": [dict(self._vector_stores[vector_store_id][file_id]) for file_id in page],
+            "has_more": start + limit < len(file_ids),
+            "last_id": page[-1] if page else None
+        }
+
+    # Public operations
+    def chat_completion(self, messages: List[dict], model: str, **params) -> str:
+        return self._call("chat_completion", self._chat, messages)
+
+    async def chat_completion_async(self, messages: List[dict], model: str, **params) -> str:
+        return await self._call_async("chat_completion", self._chat, messages)
+
+    def embed(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]:
+        return self._call("embed", self._embed, texts, dimensions)
+
+    async def embed_async(self, texts: List[str], model: str, dimensions: int) -> List[List[float]]:
+        return await self._call_async("embed", self._embed, texts, dimensions)
+
+    def create_thread(self, messages: Optional[List[dict]] = None) -> str:
+        return self._call("create_thread", self._create_thread, messages)
+
+    async def create_thread_async(self, messages: Optional[List[dict]] = None) -> str:
+        return await self._call_async("create_thread", self._create_thread, messages)
+
+    def add_message(self, thread_id: str, content: str, role: str = "user"):
+        self._call("add_message", self._add_message, thread_id, content, role)
+
+    async def add_message_async(self, thread_id: str, content: str, role: str = "user"):
+        await self._call_async("add_message", self._add_message, thread_id, content, role)
+
+    def start_run(self, thread_id: str, assistant_id: str) -> str:
+        return self._call("start_run", self._start_run, thread_id, assistant_id)
+
+    async def start_run_async(self, thread_id: str, assistant_id: str) -> str:
+        return await self._call_async("start_run", self._start_run, thread_id, assistant_id)
+
+    def retrieve_run(self, thread_id: str, run_id: str) -> RunState:
+        return self._call("retrieve_run", self._retrieve_run, thread_id, run_id)
+
+    async def retrieve_run_async(self, thread_id: str, run_id: str) -> RunState:
+        return await self._call_async("retrieve_run", self._retrieve_run, thread_id, run_id)
+
+    def cancel_run(self, thread_id: str, run_id: str):
+        self._call("cancel_run", self._cancel_run, thread_id, run_id)
+
+    async def cancel_run_async(self, thread_id: str, run_id: str):
+        await self._call_async("cancel_run", self._cancel_run, thread_id, run_id)
+
+    def latest_assistant_message(self, thread_id: str) -> Optional[str]:
+        return self._call("latest_assistant_message", self._latest_assistant_message, thread_id)
+
+    async def latest_assistant_message_async(self, thread_id: str) -> Optional[str]:
+        return await self._call_async("latest_assistant_message", self._latest_assistant_message, thread_id)
+
+    def upload_file(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict:
+        return self._call("upload_file", self._upload_file, file_path, filename, purpose)
+
+    async def upload_file_async(self, file_path: str, filename: Optional[str] = None, purpose: str = "assistants") -> dict:
+        return await self._call_async("upload_file", self._upload_file, file_path, filename, purpose)
+
+    async def get_file_async(self, file_id: str) -> Optional[dict]:
+        return await self._call_async("get_file", self._get_file, file_id)
+
+    async def delete_file_async(self, file_id: str) -> bool:
+        return await self._call_async("delete_file", self._delete_file, file_id)
+
+    def attach_file(self, vector_store_id: str, file_id: str) -> dict:
+        return self._call("attach_file", self._attach_file, vector_store_id, file_id)
+
+    async def attach_file_async(self, vector_store_id: str, file_id: str) -> dict:
+        return await self._call_async("attach_file", self._attach_file, vector_store_id, file_id)
+
+    async def detach_file_async(self, vector_store_id: str, file_id: str) -> bool:
+        return await self._call_async("detach_file", self._detach_file, vector_store_id, file_id)
+
+    async def get_vector_store_file_async(self, vector_store_id: str, file_id: str) -> Optional[dict]:
+        return await self._call_async("get_vector_store_file", self._get_vector_store_file, vector_store_id, file_id)
+
+    async def create_file_batch_async(self, vector_store_id: str, file_ids: List[str]) -> dict:
+        return await self._call_async("create_file_batch", self._create_file_batch, vector_store_id, file_ids)
+
+    async def get_file_batch_async(self, vector_store_id: str, batch_id: str) -> Optional[dict]:
+        return await self._call_async("get_file_batch", self._get_file_batch, vector_store_id, batch_id)
+
+    async def list_vector_store_files_async(self, vector_store_id: str, limit: int = 100,
+                                            after: Optional[str] = None) -> dict:
+        return await self._call_async("list_vector_store_files", self._list_vector_store_files, vector_store_id, limit, after)
+
+    def use_vector_store(self, assistant_id: str, vector_store_id: str):
+        self._call("use_vector_store", lambda: None)
+
+_BACKENDS = {"openai": OpenAIBackend, "stub": StubBackend}
+_backend = None
+
+def set_llm_backend(backend: LLMBackend):
+    """Overrides the configured backend (e.g. with a StubBackend tuned for a benchmark)."""
+    global _backend
+    _backend = backend
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        if LLM_BACKEND not in _BACKENDS:
+            logging.warning(f"Unknown LLM_BACKEND '{LLM_BACKEND}', using openai")
+        _backend = _BACKENDS.get(LLM_BACKEND, OpenAIBackend)()
+        logging.info(f"Using LLM backend: {type(_backend).__name__}")
+    return _backend
+
+__all__ = [
+    "LLMBackend", "OpenAIBackend", "StubBackend", "RunState", "LLMBackendError",
+    "get_llm_backend", "set_llm_backend", "sample_latency", "hashing_embedding", "LLM_BACKEND", "LATENCY_DISTRIBUTIONS"
+]
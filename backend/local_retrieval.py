@@ -0,0 +1,185 @@
+"""
+local_retrieval.py
+------------------
+Local retrieval pipeline as an alternative to the Assistants file_search hop.
+
+Knowledge files are chunked and embedded at upload time into the KnowledgeChunk
+pgvector table (when LOCAL_RAG_INDEXING_ENABLED, off by default). A question is answered with a local top-k cosine search and a
+single chat completion over the retrieved context, instead of a thread create,
+run, poll and message listing round trip.
+
+Embedding and completion calls go through small provider interfaces so the
+offline stubs (LOCAL_RAG_PROVIDER=stub) can stand in during tests. The default
+providers call the configured llm_backend, so LLM_BACKEND=stub keeps them offline too.
+"""
+
+import os
+import re
+import logging
+from abc import ABC, abstractmethod
+from typing import List
+from sqlmodel import Session, select, delete
+from db import engine
+from models import KnowledgeChunk, EMBEDDING_DIM
+from process_pool import run_cpu_bound_sync
+from llm_backend import get_llm_backend, hashing_embedding
+
+LOCAL_RAG_PROVIDER = os.getenv("LOCAL_RAG_PROVIDER", "openai")  # "openai" or "stub"
+LOCAL_RAG_EMBEDDING_MODEL = os.getenv("LOCAL_RAG_EMBEDDING_MODEL", "text-embedding-3-small")
+LOCAL_RAG_COMPLETION_MODEL = os.getenv("LOCAL_RAG_COMPLETION_MODEL", "gpt-4o-mini")
+LOCAL_RAG_TOP_K = int(os.getenv("LOCAL_RAG_TOP_K", "5"))
+LOCAL_RAG_CHUNK_SIZE = int(os.getenv("LOCAL_RAG_CHUNK_SIZE", "1200"))
+LOCAL_RAG_CHUNK_OVERLAP = int(os.getenv("LOCAL_RAG_CHUNK_OVERLAP", "150"))
+EMBEDDING_BATCH_SIZE = 64
+
+SYSTEM_PROMPT = (
+    "You answer customer security and compliance questionnaire questions on behalf of the company. "
+    "Use only the provided knowledge base excerpts. If they do not contain the answer, say so briefly. "
+    "Answer concisely without citing excerpt numbers."
+)
+
+# --- Provider interfaces ---
+class EmbeddingProvider(ABC):
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns one EMBEDDING_DIM-sized vector per input text."""
+
+class CompletionProvider(ABC):
+    @abstractmethod
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        """Returns the model's answer text."""
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str = LOCAL_RAG_EMBEDDING_MODEL):
+        self.model = model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return get_llm_backend().embed(texts, model=self.model, dimensions=EMBEDDING_DIM)
+
+class OpenAICompletionProvider(CompletionProvider):
+    def __init__(self, model: str = LOCAL_RAG_COMPLETION_MODEL):
+        self.model = model
+
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        return get_llm_backend().chat_completion(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.2
+        )
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Offline stub: signed feature hashing of words and word bigrams, L2-normalized."""
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [hashing_embedding(text, EMBEDDING_DIM) for text in texts]
+
+class ExtractiveCompletionProvider(CompletionProvider):
+    """Offline stub: answers with the first retrieved excerpt."""
+
+    def complete(self, system_prompt: str, user_prompt: str) -> str:
+        match = re.search(r"\[1\][^\n]*\n(.*?)(?:\n\n\[\d+\]|\n\nQuestion:)", user_prompt, re.S)
+        return match.group(1).strip() if match else "The knowledge base does not contain this information."
+
+_providers = {}
+
+def set_providers(embedding: EmbeddingProvider = None, completion: CompletionProvider = None):
+    """Overrides the configured providers (e.g. with the stubs in tests)."""
+    if embedding is not None:
+        _providers["embedding"] = embedding
+    if completion is not None:
+        _providers["completion"] = completion
+
+def get_embedding_provider() -> EmbeddingProvider:
+    if "embedding" not in _providers:
+        _providers["embedding"] = HashingEmbeddingProvider() if LOCAL_RAG_PROVIDER == "stub" else OpenAIEmbeddingProvider()
+    return _providers["embedding"]
+
+def get_completion_provider() -> CompletionProvider:
+    if "completion" not in _providers:
+        _providers["completion"] = ExtractiveCompletionProvider() if LOCAL_RAG_PROVIDER == "stub" else OpenAICompletionProvider()
+    return _providers["completion"]
+
+# --- Indexing ---
+def extract_file_text(file_path: str) -> str:
+    """Best-effort plain text of a knowledge file for chunking."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in {".txt", ".md", ".csv", ".json"}:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    if ext in {".xlsx", ".xls", ".xlsm"}:
+        import pandas as pd
+        sheets = pd.read_excel(file_path, sheet_name=None)
+        return "\n\n".join(
+            f"Sheet: {name}\n{df.fillna('').to_string(index=False)}" for name, df in sheets.items() if not df.empty
+        )
+    if ext == ".docx":
+        from docx import Document as DocxDocument
+        return "\n".join(p.text for p in DocxDocument(file_path).paragraphs if p.text.strip())
+
+    from langchain_unstructured import UnstructuredLoader
+    return "\n".join(doc.page_content for doc in UnstructuredLoader(file_path).load())
+
+def index_knowledge_file(file_path: str, file_id: str, filename: str) -> int:
+    """Chunks and embeds a knowledge file into KnowledgeChunk. Returns the number of chunks stored."""
+    from questionnaire_parser import create_text_splitter
+
+    # Parsing is CPU-bound and runs in the process pool
+    text = run_cpu_bound_sync(extract_file_text, file_path)
+    if not text.strip():
+        logging.warning(f"No text extracted from {filename}; nothing indexed for local retrieval")
+        return 0
+
+    chunks = create_text_splitter(LOCAL_RAG_CHUNK_SIZE, LOCAL_RAG_CHUNK_OVERLAP).split_text(text)
+    provider = get_embedding_provider()
+
+    with Session(engine) as session:
+        session.exec(delete(KnowledgeChunk).where(KnowledgeChunk.file_id == file_id))
+        for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+            batch = chunks[start:start + EMBEDDING_BATCH_SIZE]
+            for offset, (content, embedding) in enumerate(zip(batch, provider.embed(batch))):
+                session.add(KnowledgeChunk(
+                    file_id=file_id,
+                    filename=filename,
+                    chunk_index=start + offset,
+                    content=content,
+                    embedding=embedding
+                ))
+        session.commit()
+
+    logging.info(f"Indexed {len(chunks)} chunks of {filename} ({file_id}) for local retrieval")
+    return len(chunks)
+
+def remove_knowledge_file(file_id: str):
+    with Session(engine) as session:
+        session.exec(delete(KnowledgeChunk).where(KnowledgeChunk.file_id == file_id))
+        session.commit()
+
+# --- Retrieval + answer ---
+def retrieve_chunks(question: str, top_k: int = LOCAL_RAG_TOP_K) -> List[KnowledgeChunk]:
+    query_vector = get_embedding_provider().embed([question])[0]
+    with Session(engine) as session:
+        return list(session.exec(
+            select(KnowledgeChunk)
+            .order_by(KnowledgeChunk.embedding.cosine_distance(query_vector))
+            .limit(top_k)
+        ).all())
+
+def answer_with_local_retrieval(question: str, top_k: int = LOCAL_RAG_TOP_K) -> str:
+    """Top-k local search plus one completion call. Returns the raw model answer."""
+    chunks = retrieve_chunks(question, top_k)
+    if not chunks:
+        raise RuntimeError("Local knowledge index is empty; upload knowledge files first")
+
+    context = "\n\n".join(f"[{i}] {chunk.filename}\n{chunk.content}" for i, chunk in enumerate(chunks, 1))
+    user_prompt = f"Knowledge base excerpts:\n\n{context}\n\nQuestion: {question}"
+    logging.info(f"Local retrieval: {len(chunks)} chunks for question: {question[:100]}...")
+    return get_completion_provider().complete(SYSTEM_PROMPT, user_prompt)
+
+__all__ = [
+    "EmbeddingProvider", "CompletionProvider", "set_providers",
+    "index_knowledge_file", "remove_knowledge_file",
+    "retrieve_chunks", "answer_with_local_retrieval", "LOCAL_RAG_COMPLETION_MODEL"
+]
@@ -6,13 +6,13 @@ FastAPI application with organized routing for Chat, Questionnaires, and Knowled
 
 import os
 import logging
-import openai
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 from answer_questionnaire import router as answer_router
+from questionnaire_jobs import router as questionnaire_jobs_router
 from questionnaire_history import router as questionnaire_router
 from chat_history import (
     router as chat_router,
@@ -21,7 +21,13 @@ from chat_history import (
     list_sessions
 )
 from db import init_db, get_session
-from openai_file_upload import router as openai_file_upload_router
+from openai_file_upload import router as openai_file_upload_router, start_catalog_refresher
+from answer_cache import router as answer_cache_router
+from questionnaire_parse_cache import router as questionnaire_parse_cache_router
+from http_client import close_async_clients
+from llm_backend import get_llm_backend
+from processed_items import import_legacy_track_file, purge_expired_items
+from process_pool import start_process_pool, shutdown_process_pool
 
 load_dotenv()
 
@@ -49,20 +55,35 @@ app.add_middleware(
 
 # --- Startup ---
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
     os.makedirs("temp_uploads", exist_ok=True)
+    import_legacy_track_file()
+    purge_expired_items()
+    start_process_pool()
+    app.state.catalog_refresher = start_catalog_refresher()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if app.state.catalog_refresher is not None:
+        app.state.catalog_refresher.cancel()
+    await close_async_clients()
+    shutdown_process_pool()
 
 # --- Mount Routers with Clean URL Structure ---
 app.include_router(chat_router, prefix="/chat", tags=["Chat & Ask"])
 app.include_router(answer_router, prefix="/questionnaires", tags=["Questionnaires"])
+app.include_router(questionnaire_jobs_router, prefix="/questionnaires", tags=["Questionnaires"])
 app.include_router(questionnaire_router, prefix="/questionnaires", tags=["Questionnaires"])
 app.include_router(openai_file_upload_router, prefix="/knowledge", tags=["Knowledge Base"])
+app.include_router(answer_cache_router, prefix="/cache", tags=["Answer Cache"])
+app.include_router(questionnaire_parse_cache_router, prefix="/cache", tags=["Answer Cache"])
 
 # --- Request Models ---
 class AssistantRequest(BaseModel):
     question: str
     session_id: int = None
+    engine: str = "assistant"  # Retrieval engine for /chat/assistant: "assistant" or "local"
 
 # --- Root Health Check ---
 @app.get("/", tags=["Health"])
@@ -89,6 +110,10 @@ def api_info():
             },
             "questionnaires": {
                 "process": "/questionnaires/process",
+                "process_stream": "/questionnaires/process/stream",
+                "submit_job": "/questionnaires/jobs",
+                "job_status": "/questionnaires/jobs/{job_id}",
+                "job_result": "/questionnaires/jobs/{job_id}/result",
                 "history": "/questionnaires/history",
                 "session": "/questionnaires/{session_id}",
                 "rename": "/questionnaires/{session_id}/rename",
@@ -99,6 +124,12 @@ def api_info():
                 "upload": "/knowledge/upload",
                 "scan_website": "/knowledge/scan-website",
                 "delete": "/knowledge/files/{file_id}"
+            },
+            "answer_cache": {
+                "stats": "/cache/stats",
+                "clear": "/cache/clear",
+                "questionnaire_stats": "/cache/questionnaires/stats",
+                "questionnaire_clear": "/cache/questionnaires/clear"
             }
         }
     }
@@ -108,16 +139,19 @@ def api_info():
 def chat_assistant(req: AssistantRequest, session=Depends(get_session)):
     """F24 QA Expert - Chat with knowledge base"""
     try:
-        from openai_integration import query_openai_assistant
+        from openai_integration import answer_question, RETRIEVAL_ENGINES
+        
+        if req.engine not in RETRIEVAL_ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unknown engine. Supported: {', '.join(RETRIEVAL_ENGINES)}")
         
         ASSISTANT_ID = os.getenv("OPENAI_RAG_ASSISTANT_ID")
-        if not ASSISTANT_ID:
+        if req.engine == "assistant" and not ASSISTANT_ID:
             raise HTTPException(status_code=500, detail="Assistant ID not configured")
         
-        logging.info(f"Assistant chat: {req.question[:50]}...")
+        logging.info(f"Assistant chat ({req.engine}): {req.question[:50]}...")
         
-        # Call OpenAI assistant with knowledge base
-        answer = query_openai_assistant(req.question, ASSISTANT_ID)
+        # Call OpenAI assistant (or the local retrieval pipeline) with knowledge base
+        answer = answer_question(req.question, ASSISTANT_ID, req.engine)
         
         logging.info(f"Assistant answer generated: {answer[:100]}...")
         
@@ -132,6 +166,8 @@ def chat_assistant(req: AssistantRequest, session=Depends(get_session)):
             "session_id": req.session_id,
             "mode": "expert"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Assistant chat failed: {e}")
         raise HTTPException(status_code=500, detail=f"Assistant failed: {str(e)}")
@@ -140,14 +176,14 @@ def chat_assistant(req: AssistantRequest, session=Depends(get_session)):
 def chat_general(req: AssistantRequest, session=Depends(get_session)):
     """General Chat - Direct GPT without knowledge base"""
     try:
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        if not openai.api_key:
+        backend = get_llm_backend()
+        if not backend.is_configured():
             raise HTTPException(status_code=500, detail="OpenAI API key not configured")
         
         logging.info(f"General chat: {req.question[:50]}...")
         
         # Direct GPT call without knowledge base
-        response = openai.chat.completions.create(
+        answer = backend.chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful AI assistant. Provide clear, accurate, and helpful responses."},
@@ -155,9 +191,7 @@ def chat_general(req: AssistantRequest, session=Depends(get_session)):
             ],
             max_tokens=1000,
             temperature=0.7
-        )
-        
-        answer = response.choices[0].message.content.strip()
+        ).strip()
         
         logging.info(f"General chat answer: {answer[:100]}...")
         
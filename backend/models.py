@@ -8,12 +8,25 @@ Models:
 - ChatSession: groups messages by conversation
 - ChatMessage: stores role/content/timestamp
 - QuestionnaireSession: stores uploaded questionnaire responses
+- QuestionnaireJob: tracks background questionnaire processing and its progress
+- KnowledgeBaseVersion: single-row version stamp bumped whenever the vector store changes
+- AnswerCacheEntry: cached assistant answers keyed by normalized question + knowledge base version
+- QuestionnaireParseCacheEntry: extracted questions keyed by file hash + extraction assistant
+- KnowledgeChunk: embedded knowledge file chunks for local pgvector retrieval
+- KnowledgeFile: local catalog of the files attached to the OpenAI vector store
+- WebPageState: per-page validators, text and links for incremental website scans
+- ProcessedItem: processed URLs / file hashes (replaces processed_items.txt)
 """
 
+import os
 from typing import List, Optional
 from datetime import datetime
+from sqlalchemy import Column
+from pgvector.sqlalchemy import Vector
 from sqlmodel import SQLModel, Field, Relationship
 
+EMBEDDING_DIM = int(os.getenv("LOCAL_RAG_EMBEDDING_DIM", "1536"))
+
 # --- Chat Session Entity ---
 class ChatSession(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -41,5 +54,88 @@ class QuestionnaireSession(SQLModel, table=True):
     results_json: str  # JSON-encoded list of Q&A dicts
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# --- Questionnaire Job Entity ---
+class QuestionnaireJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # uuid4 hex
+    file_name: str
+    status: str = Field(default="queued", description="queued, extracting, answering, completed or failed")
+    questions_total: int = 0
+    questions_done: int = 0
+    session_id: Optional[int] = None  # QuestionnaireSession id once results are saved
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    answering_started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# --- Knowledge Base Version Stamp ---
+class KnowledgeBaseVersion(SQLModel, table=True):
+    id: int = Field(default=1, primary_key=True)
+    version: int = 1
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# --- Answer Cache Entity ---
+class AnswerCacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # sha256 of assistant id, kb version and normalized question
+    assistant_id: str
+    kb_version: int = Field(index=True)
+    question: str
+    answer: str
+    hits: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+# --- Questionnaire Parse Cache Entity ---
+class QuestionnaireParseCacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # sha256 of the file hash and extraction assistant id
+    file_hash: str = Field(index=True)  # SHA-256 of the questionnaire file bytes
+    assistant_id: str
+    filename: str  # Name of the file that was first extracted
+    documents_json: str  # Extracted questions as [{"page_content": ..., "metadata": {...}}]
+    question_count: int = 0
+    hits: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+# --- Knowledge Chunk Entity (pgvector) ---
+class KnowledgeChunk(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: str = Field(index=True)  # OpenAI file id the chunk was uploaded as
+    filename: str
+    chunk_index: int
+    content: str
+    embedding: List[float] = Field(sa_column=Column(Vector(EMBEDDING_DIM)))
+
+# --- Knowledge File Catalog Entity ---
+class KnowledgeFile(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # OpenAI file id
+    filename: str
+    size: int = 0
+    created_at: int = Field(default=0, index=True)  # Unix timestamp reported by OpenAI
+    purpose: str = "assistants"
+    content_hash: Optional[str] = Field(default=None, index=True)  # SHA-256 of the uploaded bytes, when known
+    synced_at: datetime = Field(default_factory=datetime.utcnow)
+
+# --- Website Page State (incremental scans) ---
+class WebPageState(SQLModel, table=True):
+    url: str = Field(primary_key=True)
+    site: str = Field(index=True)  # Domain the page was crawled under
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: str  # Hash of the extracted text, so markup-only changes do not trigger a re-ingest
+    text: str  # Extracted text, reused when a sibling page in the same file changes
+    links_json: str = "[]"  # Same-domain links, so a 304 response still extends the crawl
+    file_id: Optional[str] = Field(default=None, index=True)  # Vector store file holding this page
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+# --- Processed Item Tracking ---
+class ProcessedItem(SQLModel, table=True):
+    namespace: str = Field(primary_key=True)  # Kind of identifier, e.g. "url" or "file_hash"
+    item_key: str = Field(primary_key=True)
+    info: Optional[str] = None  # Optional caller data (e.g. a file id)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: Optional[datetime] = Field(default=None, index=True)  # None = never expires
+
 # --- PLACEHOLDER ---
 # Future: Add user_id, questionnaire tags, versioning support
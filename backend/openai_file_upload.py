@@ -2,25 +2,63 @@
 openai_file_upload.py
 ---------------------
 FastAPI endpoint to upload any knowledge file (Excel, PDF, Word, etc.) to OpenAI storage and attach to vector store.
+
+Provider calls from the endpoints go through the async methods of the configured
+LLM backend (llm_backend) so uploads, deletes and catalog syncs never block the
+event loop; file conversion, catalog writes and local indexing run in worker threads.
 """
 
 import os
+import asyncio
 import tempfile
 import time
-import requests
 import logging
 import hashlib
-import openai  # Add openai import for helper functions
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from datetime import datetime
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from web_utils import crawl_static_links
-from bs4 import BeautifulSoup
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import urlparse
+from web_utils import iter_crawl_site
+from web_page_state import load_site_pages, save_site_pages, set_page_files, iter_page_texts, classify_page
+from website_aggregator import WebsiteContentWriter
 from excel_to_pdf_converter import convert_excel_for_knowledge_base, is_excel_file
+from excel_to_text_converter import convert_excel_to_text_for_knowledge_base, TEXT_FORMATS
+from answer_cache import bump_kb_version
+from llm_backend import get_llm_backend, LLMBackendError
+from local_retrieval import index_knowledge_file, remove_knowledge_file
+from process_pool import run_cpu_bound
+from knowledge_catalog import (
+    upsert_catalog_file, remove_catalog_file, list_catalog_files, replace_catalog, last_refresh_at,
+    find_catalog_file_by_hash, find_catalog_file
+)
 
 router = APIRouter()
 
-# OpenAI Configuration
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Knowledge base configuration. Indexing for the local retrieval engine (engine=local) costs an
+# extraction, embedding calls and a pgvector write per upload, so only deployments using it turn it on
+LOCAL_RAG_INDEXING_ENABLED = os.getenv("LOCAL_RAG_INDEXING_ENABLED", "false").lower() == "true"
+
+# Knowledge catalog sync
+KNOWLEDGE_CATALOG_REFRESH_SECONDS = int(os.getenv("KNOWLEDGE_CATALOG_REFRESH_SECONDS", "600"))
+VECTOR_STORE_PAGE_SIZE = 100  # Maximum page size of the vector store files listing
+FILE_DETAIL_FETCH_CONCURRENCY = 8
+
+# Parallel upload pipeline
+KNOWLEDGE_UPLOAD_CONCURRENCY = int(os.getenv("KNOWLEDGE_UPLOAD_CONCURRENCY", "4"))
+
+# How Excel uploads are stored: "pdf" (rendered tables), "records"/"markdown"
+# (structured text, see excel_to_text_converter) or "original" (the workbook as is)
+EXCEL_KNOWLEDGE_FORMATS = ("pdf",) + TEXT_FORMATS + ("original",)
+EXCEL_KNOWLEDGE_FORMAT = os.getenv("EXCEL_KNOWLEDGE_FORMAT", "pdf")
+
+# Vector store batch attach
+FILE_BATCH_MAX_FILES = 500
+FILE_BATCH_WAIT_SECONDS = 120
+FILE_BATCH_POLL_SECONDS = 2.0
+
+# Website scans
+WEBSITE_STATE_SAVE_BATCH = 50  # Page states buffered before they are written
 
 # Helper functions moved from openai_integration.py
 def upload_file_to_openai_storage(file_path: str, purpose: str = "assistants") -> str:
@@ -28,13 +66,11 @@ def upload_file_to_openai_storage(file_path: str, purpose: str = "assistants") -
     Uploads a file to OpenAI's file storage for use with Assistants.
     Returns the OpenAI file ID on success, or raises an exception on failure.
     """
-    if not OPENAI_API_KEY:
+    backend = get_llm_backend()
+    if not backend.is_configured():
         raise ValueError("OPENAI_API_KEY environment variable not set.")
-    openai.api_key = OPENAI_API_KEY
     try:
-        with open(file_path, "rb") as f:
-            response = openai.files.create(file=f, purpose=purpose)
-        file_id = response.id
+        file_id = backend.upload_file(file_path, purpose=purpose)["id"]
         logging.info(f"Uploaded {file_path} to OpenAI storage with file_id: {file_id}")
         return file_id
     except Exception as e:
@@ -46,37 +82,47 @@ def add_file_to_openai_assistant_vector_store(file_id: str, assistant_id: str =
     Attaches a file to the central OpenAI vector store for retrieval by the assistant.
     Returns the Assistant ID.
     """
-    if not OPENAI_API_KEY:
+    backend = get_llm_backend()
+    if not backend.is_configured():
         raise ValueError("OPENAI_API_KEY environment variable not set.")
-    openai.api_key = OPENAI_API_KEY
     VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
     if not VECTOR_STORE_ID:
         raise ValueError("OPENAI_VECTOR_STORE_ID environment variable not set.")
     try:
         # Attach file to the central vector store (not just a thread)
-        openai.beta.vector_stores.files.create(
-            vector_store_id=VECTOR_STORE_ID,
-            file_id=file_id
-        )
+        backend.attach_file(VECTOR_STORE_ID, file_id)
         logging.info(f"Attached file {file_id} to vector store {VECTOR_STORE_ID}.")
         # Optionally, update the assistant to use this vector store if not already
         if assistant_id is not None:
-            openai.beta.assistants.update(
-                assistant_id=assistant_id,
-                tool_resources={"file_search": {"vector_store_ids": [VECTOR_STORE_ID]}}
-            )
+            backend.use_vector_store(assistant_id, VECTOR_STORE_ID)
             logging.info(f"Ensured assistant {assistant_id} uses vector store {VECTOR_STORE_ID}.")
         return assistant_id
     except Exception as e:
         logging.error(f"Failed to add file {file_id} to vector store: {e}")
         raise
 
-def get_vector_store_files():
+async def _fetch_file_details(file_id: str):
+    """Returns the catalog dict for one OpenAI file, or None if it cannot be read."""
+    file_data = await get_llm_backend().get_file_async(file_id)
+    if file_data is None:
+        return None
+    return {
+        "id": file_id,
+        "filename": file_data.get("filename", "Unknown"),
+        "size": file_data.get("bytes", 0),
+        "created_at": file_data.get("created_at", 0),
+        "purpose": file_data.get("purpose", "assistants")
+    }
+
+async def get_vector_store_files():
     """
     Gets all files from the OpenAI vector store along with their metadata.
-    Returns a list of file dictionaries with id, filename, size, and created_at.
+    Pages through the whole vector store listing and fetches file details concurrently.
+    Returns (file ids in the listing, list of file dictionaries with id, filename, size,
+    and created_at). A file whose details could not be fetched is listed but has no dict.
     """
-    if not OPENAI_API_KEY:
+    backend = get_llm_backend()
+    if not backend.is_configured():
         raise ValueError("OPENAI_API_KEY environment variable not set.")
     
     VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
@@ -84,88 +130,166 @@ def get_vector_store_files():
         raise ValueError("OPENAI_VECTOR_STORE_ID environment variable not set.")
     
     try:
-        # Get files from vector store
-        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-        url = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/files"
-        
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            raise Exception(f"Failed to get vector store files: {response.text}")
+        # Page through the vector store listing
+        file_ids = []
+        after = None
+        while True:
+            page = await backend.list_vector_store_files_async(VECTOR_STORE_ID, limit=VECTOR_STORE_PAGE_SIZE, after=after)
+            file_ids.extend(vf["id"] for vf in page.get("data", []) if vf.get("id"))
+            if not page.get("has_more") or not page.get("last_id"):
+                break
+            after = page["last_id"]
         
-        vector_files = response.json().get("data", [])
+        # Get detailed file information concurrently
+        semaphore = asyncio.Semaphore(FILE_DETAIL_FETCH_CONCURRENCY)
         
-        # Get detailed file information for each file
-        files_with_details = []
-        for vf in vector_files:
-            file_id = vf.get("id")
-            if file_id:
-                # Get file details from OpenAI files API
-                file_url = f"https://api.openai.com/v1/files/{file_id}"
-                file_resp = requests.get(file_url, headers=headers)
-                if file_resp.status_code == 200:
-                    file_data = file_resp.json()
-                    files_with_details.append({
-                        "id": file_id,
-                        "filename": file_data.get("filename", "Unknown"),
-                        "size": file_data.get("bytes", 0),
-                        "created_at": file_data.get("created_at", 0),
-                        "purpose": file_data.get("purpose", "assistants")
-                    })
+        async def fetch(file_id: str):
+            async with semaphore:
+                return await _fetch_file_details(file_id)
         
-        return files_with_details
+        details = await asyncio.gather(*(fetch(file_id) for file_id in file_ids))
+        missing = details.count(None)
+        if missing:
+            logging.warning(f"Could not fetch details of {missing} of {len(file_ids)} vector store files")
+        return file_ids, [d for d in details if d is not None]
     except Exception as e:
         logging.error(f"Failed to get vector store files: {e}")
         raise
 
-def check_duplicate_file(filename: str, file_size: int):
+async def refresh_knowledge_catalog():
+    """Reconciles the local knowledge file catalog with the vector store."""
+    started_at = datetime.utcnow()
+    file_ids, files = await get_vector_store_files()
+    await run_in_threadpool(replace_catalog, files, started_at, file_ids)
+
+async def _catalog_refresh_loop():
+    while True:
+        try:
+            await refresh_knowledge_catalog()
+        except Exception as e:
+            logging.warning(f"Knowledge catalog refresh failed: {e}")
+        await asyncio.sleep(KNOWLEDGE_CATALOG_REFRESH_SECONDS)
+
+def start_catalog_refresher():
     """
-    Checks if a file with the same name and size already exists in the vector store.
-    Returns the existing file info if found, None otherwise.
+    Starts the periodic catalog refresh as a task on the running event loop.
+    Returns the task (cancel it on shutdown), or None when OpenAI is not configured.
+    """
+    if get_llm_backend().is_configured() and os.getenv("OPENAI_VECTOR_STORE_ID"):
+        return asyncio.get_running_loop().create_task(_catalog_refresh_loop(), name="knowledge-catalog-refresh")
+    logging.info("OpenAI not configured; knowledge catalog refresh disabled")
+    return None
+
+def check_duplicate_file(filename: str, file_size: int, content_hash: str = None):
+    """
+    Checks the local knowledge catalog for a file with identical content (SHA-256),
+    falling back to the same name and size for files catalogued without a hash.
+    Returns the existing file info if found, None otherwise. No OpenAI round trip.
     """
     try:
-        existing_files = get_vector_store_files()
-        for file_info in existing_files:
-            if (file_info["filename"] == filename and 
-                file_info["size"] == file_size):
-                return file_info
-        return None
+        if content_hash:
+            existing = find_catalog_file_by_hash(content_hash)
+            if existing:
+                return existing
+        return find_catalog_file(filename, file_size)
     except Exception as e:
         logging.error(f"Error checking for duplicate file: {e}")
         return None
 
-def delete_file_from_vector_store(file_id: str):
+async def delete_file_from_vector_store(file_id: str):
     """
     Removes a file from the vector store and deletes it from OpenAI storage.
     """
-    if not OPENAI_API_KEY:
+    backend = get_llm_backend()
+    if not backend.is_configured():
         raise ValueError("OPENAI_API_KEY environment variable not set.")
     
     VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
     if not VECTOR_STORE_ID:
         raise ValueError("OPENAI_VECTOR_STORE_ID environment variable not set.")
     
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    
     try:
-        # First, remove from vector store
-        vs_url = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/files/{file_id}"
-        vs_resp = requests.delete(vs_url, headers=headers)
+        # First, remove from vector store, then delete the file from OpenAI storage
+        # (failures of either are logged by the backend)
+        await backend.detach_file_async(VECTOR_STORE_ID, file_id)
+        await backend.delete_file_async(file_id)
         
-        if vs_resp.status_code not in [200, 204]:
-            logging.warning(f"Failed to remove file from vector store: {vs_resp.text}")
-        
-        # Then delete the file from OpenAI storage
-        file_url = f"https://api.openai.com/v1/files/{file_id}"
-        file_resp = requests.delete(file_url, headers=headers)
+        try:
+            await run_in_threadpool(remove_catalog_file, file_id)
+        except Exception as e:
+            logging.warning(f"Failed to remove {file_id} from knowledge catalog: {e}")
         
-        if file_resp.status_code not in [200, 204]:
-            logging.warning(f"Failed to delete file from OpenAI storage: {file_resp.text}")
+        # Drop the file's chunks from the local retrieval index
+        try:
+            await run_in_threadpool(remove_knowledge_file, file_id)
+        except Exception as e:
+            logging.warning(f"Failed to remove local retrieval chunks for {file_id}: {e}")
         
         return True
     except Exception as e:
         logging.error(f"Failed to delete file {file_id}: {e}")
         raise
 
+def invalidate_answer_cache(reason: str):
+    """Bumps the knowledge base version so cached answers are not served from stale content."""
+    try:
+        bump_kb_version(reason)
+    except Exception as e:
+        logging.warning(f"Failed to invalidate answer cache ({reason}): {e}")
+
+_pending_invalidations = set()  # Keeps invalidate-after-indexing tasks alive until they finish
+
+async def _invalidate_when_indexed(vector_store_id: str, file_ids: list, reason: str):
+    """
+    Bumps the knowledge base version once the vector store has finished indexing `file_ids`
+    (or after FILE_BATCH_WAIT_SECONDS). Bumping at attach time would file answers computed
+    while indexing runs, without the new content, under the new version for the full TTL.
+    """
+    backend = get_llm_backend()
+    waiting = set(file_ids)
+    deadline = time.monotonic() + FILE_BATCH_WAIT_SECONDS
+    try:
+        while waiting and time.monotonic() < deadline:
+            for file_id in list(waiting):
+                vector_store_file = await backend.get_vector_store_file_async(vector_store_id, file_id)
+                if vector_store_file is None or vector_store_file.get("status") != "in_progress":
+                    waiting.discard(file_id)
+            if waiting:
+                await asyncio.sleep(FILE_BATCH_POLL_SECONDS)
+    except Exception as e:
+        logging.warning(f"Could not check indexing of {len(waiting)} file(s): {e}")
+    if waiting:
+        logging.warning(f"{len(waiting)} file(s) still indexing after {FILE_BATCH_WAIT_SECONDS}s, invalidating answers anyway")
+    await run_in_threadpool(invalidate_answer_cache, reason)
+
+def invalidate_answer_cache_when_indexed(vector_store_id: str, file_ids: list, reason: str):
+    """Schedules _invalidate_when_indexed on the running event loop without waiting for it."""
+    task = asyncio.ensure_future(_invalidate_when_indexed(vector_store_id, file_ids, reason))
+    _pending_invalidations.add(task)
+    task.add_done_callback(_pending_invalidations.discard)
+
+def record_catalog_file(uploaded: dict, content_hash: str = None):
+    """Adds a freshly uploaded OpenAI file object (and its content hash) to the local knowledge catalog."""
+    try:
+        upsert_catalog_file({
+            "id": uploaded["id"],
+            "filename": uploaded.get("filename", "Unknown"),
+            "size": uploaded.get("bytes", 0),
+            "created_at": uploaded.get("created_at", int(time.time())),
+            "purpose": uploaded.get("purpose", "assistants")
+        }, content_hash)
+    except Exception as e:
+        logging.warning(f"Failed to record {uploaded.get('id')} in knowledge catalog: {e}")
+
+def index_for_local_retrieval(file_path: str, file_id: str, filename: str):
+    """Chunks and embeds an uploaded file for the local retrieval engine. Never fails the upload."""
+    if not LOCAL_RAG_INDEXING_ENABLED:
+        return
+    try:
+        index_knowledge_file(file_path, file_id, filename)
+    except Exception as e:
+        logging.warning(f"Local retrieval indexing failed for {filename}: {e}")
+
 # Utility function for safe file cleanup
 def safe_cleanup_error(file_path):
     """Cleanup file ignoring any errors (for error handling scenarios)."""
@@ -192,134 +316,208 @@ def safe_cleanup_with_retry(file_path, max_retries=3):
             logging.warning(f"Unexpected cleanup error for {file_path}: {e}")
             return
 
+def _skipped_duplicate(filename: str, duplicate_file: dict) -> dict:
+    same_name = duplicate_file["filename"] == filename
+    existing_label = f"File '{filename}'" if same_name else f"File '{filename}' (identical to '{duplicate_file['filename']}')"
+    if duplicate_file.get("id") is None:
+        message = f"{existing_label} appears more than once in this upload. Upload skipped."
+    else:
+        message = f"{existing_label} already exists in knowledge base (uploaded on {duplicate_file['created_at']}). Upload skipped."
+    return {
+        "filename": filename,
+        "status": "skipped",
+        "message": message,
+        "duplicate": True,
+        "existing_file": duplicate_file
+    }
+
+async def upload_file_to_openai_async(file_path: str, filename: str = None) -> dict:
+    """Uploads a local file to OpenAI storage. Returns the file object; raises LLMBackendError on failure."""
+    return await get_llm_backend().upload_file_async(file_path, filename)
+
+async def attach_file_to_vector_store_async(vector_store_id: str, file_id: str) -> dict:
+    """Attaches an uploaded file to the vector store. Raises LLMBackendError on failure."""
+    return await get_llm_backend().attach_file_async(vector_store_id, file_id)
+
+async def attach_files_to_vector_store_batch_async(vector_store_id: str, file_ids: list) -> list:
+    """
+    Attaches files through the vector store file_batches endpoint (FILE_BATCH_MAX_FILES per
+    batch) and waits up to FILE_BATCH_WAIT_SECONDS for processing. Returns the batch objects.
+    Raises when a batch cannot be created, does not complete in time, or has failed files.
+    """
+    backend = get_llm_backend()
+    batches = []
+    for start in range(0, len(file_ids), FILE_BATCH_MAX_FILES):
+        try:
+            batches.append(await backend.create_file_batch_async(vector_store_id, file_ids[start:start + FILE_BATCH_MAX_FILES]))
+        except LLMBackendError as e:
+            raise Exception(f"OpenAI vector store batch attach failed: {e}")
+    
+    deadline = time.monotonic() + FILE_BATCH_WAIT_SECONDS
+    for i, batch in enumerate(batches):
+        while batch.get("status") == "in_progress" and time.monotonic() < deadline:
+            await asyncio.sleep(FILE_BATCH_POLL_SECONDS)
+            batch = await backend.get_file_batch_async(vector_store_id, batch["id"]) or batch
+        batches[i] = batch
+        counts = batch.get("file_counts") or {}
+        if batch.get("status") != "completed" or counts.get("failed"):
+            raise Exception(f"Vector store file batch {batch.get('id')} is {batch.get('status')}: {counts}")
+    return batches
+
+def _write_upload_file(path: str, file_content: bytes):
+    with open(path, "wb") as f_out:
+        f_out.write(file_content)
+
+async def _prepare_upload_file(filename: str, file_content: bytes, work_dir: str, excel_format: str = EXCEL_KNOWLEDGE_FORMAT):
+    """
+    Writes the upload to `work_dir` and converts Excel files to `excel_format` in the process pool.
+    Returns (temp_path, upload_path, converted_to), converted_to being None when the original is uploaded.
+    """
+    temp_path = os.path.join(work_dir, os.path.basename(filename))
+    await run_in_threadpool(_write_upload_file, temp_path, file_content)
+    
+    if is_excel_file(filename) and excel_format != "original":
+        try:
+            logging.info(f"Converting Excel file {filename} to {excel_format} for knowledge base")
+            if excel_format == "pdf":
+                converted_path = await run_cpu_bound(convert_excel_for_knowledge_base, temp_path, work_dir)
+            else:
+                converted_path = await run_cpu_bound(
+                    convert_excel_to_text_for_knowledge_base, temp_path, work_dir, excel_format
+                )
+            logging.info(f"Successfully converted {filename} to {excel_format}")
+            return temp_path, converted_path, excel_format
+        except Exception as e:
+            # Fall back to uploading original Excel file
+            logging.warning(f"Failed to convert Excel to {excel_format}: {e}. Uploading original file.")
+    return temp_path, temp_path, None
+
+def _cleanup_work_dir(work_dir: str):
+    for name in os.listdir(work_dir):
+        safe_cleanup_with_retry(os.path.join(work_dir, name))
+    try:
+        os.rmdir(work_dir)
+    except OSError as e:
+        logging.warning(f"Could not remove temp dir {work_dir}: {e}")
+
+async def _process_knowledge_upload(filename: str, file_content: bytes, content_hash: str, vector_store_id: str,
+                                    excel_format: str = EXCEL_KNOWLEDGE_FORMAT):
+    """
+    Runs one file through the upload pipeline: write temp file, convert Excel (to `excel_format`),
+    upload to OpenAI storage, attach to the vector store, then catalog and index it.
+    Returns (result dict, None) or (None, error message).
+    """
+    # Each file gets its own temp dir so concurrent uploads of the same name cannot collide
+    work_dir = tempfile.mkdtemp(prefix="knowledge_upload_")
+    try:
+        temp_path, upload_file_path, converted_to = await _prepare_upload_file(
+            filename, file_content, work_dir, excel_format
+        )
+        
+        # 1. Upload file to OpenAI storage
+        try:
+            uploaded = await upload_file_to_openai_async(upload_file_path)
+        except LLMBackendError as e:
+            return None, f"OpenAI file upload failed for {filename}: {e}"
+        file_id = uploaded["id"]
+        
+        # 2. Attach file to vector store
+        try:
+            await attach_file_to_vector_store_async(vector_store_id, file_id)
+        except LLMBackendError as e:
+            return None, f"OpenAI vector store attach failed for {filename}: {e}"
+        
+        await run_in_threadpool(record_catalog_file, uploaded, content_hash)
+        
+        # Index for the local retrieval engine: structured text as uploaded, otherwise the original file
+        index_path = upload_file_path if converted_to in TEXT_FORMATS else temp_path
+        await run_in_threadpool(index_for_local_retrieval, index_path, file_id, filename)
+        
+        response_message = "File uploaded and attached to vector store via REST API."
+        if converted_to == "pdf":
+            response_message += " (Excel file was converted to PDF for better knowledge base compatibility.)"
+        elif converted_to:
+            response_message += f" (Excel file was converted to structured text ({converted_to}) for the knowledge base.)"
+        
+        return {
+            "filename": filename,
+            "status": "success",
+            "message": response_message,
+            "file_id": file_id,
+            "vector_store_id": vector_store_id,
+            "converted_to_pdf": converted_to == "pdf",
+            "converted_to": converted_to
+        }, None
+    
+    except Exception as e:
+        logging.error(f"Unexpected error uploading {filename}: {str(e)}", exc_info=True)
+        return None, f"Upload failed for {filename}: {str(e)}"
+    
+    finally:
+        await run_in_threadpool(_cleanup_work_dir, work_dir)
+
 @router.post("/upload")
-async def upload_knowledge_file(files: list[UploadFile] = File(...)):
+async def upload_knowledge_file(files: list[UploadFile] = File(...), excel_format: str = Form(None)):
     """
     Uploads one or more files to OpenAI storage and attaches them to the vector store for retrieval using the REST API.
     Accepts any file type supported by OpenAI (pdf, docx, txt, etc.).
-    Checks for duplicates based on filename and size.
+    Excel files are converted according to the optional `excel_format` form field
+    ("pdf", "records", "markdown" or "original"; default EXCEL_KNOWLEDGE_FORMAT).
+    Checks for duplicates by content hash (or filename and size) against the local catalog.
+    Files run through the conversion/upload/attach pipeline concurrently (KNOWLEDGE_UPLOAD_CONCURRENCY at a time).
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
+    excel_format = excel_format or EXCEL_KNOWLEDGE_FORMAT
+    if excel_format not in EXCEL_KNOWLEDGE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid excel_format '{excel_format}'. Expected one of: {', '.join(EXCEL_KNOWLEDGE_FORMATS)}"
+        )
     
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
-    if not OPENAI_API_KEY or not VECTOR_STORE_ID:
+    if not get_llm_backend().is_configured() or not VECTOR_STORE_ID:
         raise HTTPException(status_code=500, detail="OpenAI API key or Vector Store ID not configured.")
     
-    results = []
-    errors = []
-    
+    # Read uploads and resolve duplicates up front; outcomes keep the request's file order
+    outcomes = []  # (result, error) or a pending upload
+    pending = []
+    seen_hashes = {}
     for file in files:
         if not file.filename:
-            errors.append(f"Empty filename in uploaded file")
+            outcomes.append((None, "Empty filename in uploaded file"))
             continue
-            
-        try:
-            # Save file temporarily to check size
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, file.filename)
-            file_content = await file.read()
-            with open(temp_path, "wb") as f_out:
-                f_out.write(file_content)
-            
-            # Get file size
-            file_size = len(file_content)
-            
-            # Check for duplicates
-            duplicate_file = check_duplicate_file(file.filename, file_size)
-            if duplicate_file:
-                safe_cleanup_error(temp_path)
-                results.append({
-                    "filename": file.filename,
-                    "status": "skipped",
-                    "message": f"File '{file.filename}' already exists in knowledge base (uploaded on {duplicate_file['created_at']}). Upload skipped.",
-                    "duplicate": True,
-                    "existing_file": duplicate_file
-                })
-                continue
-            
-            # Check if file is Excel and convert to PDF if needed
-            upload_file_path = temp_path
-            converted_file = False
-            
-            if is_excel_file(file.filename):
-                try:
-                    logging.info(f"Converting Excel file {file.filename} to PDF for knowledge base")
-                    pdf_path = convert_excel_for_knowledge_base(temp_path, temp_dir)
-                    upload_file_path = pdf_path
-                    converted_file = True
-                    logging.info(f"Successfully converted {file.filename} to PDF")
-                    
-                    # Give a small delay to ensure file handles are released
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logging.warning(f"Failed to convert Excel to PDF: {e}. Uploading original file.")
-                    # Fall back to uploading original Excel file
-                    upload_file_path = temp_path
-                    converted_file = False
-            
-            # 1. Upload file to OpenAI storage
-            url = "https://api.openai.com/v1/files"
-            headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-            with open(upload_file_path, "rb") as f_in:
-                files_data = {"file": f_in, "purpose": (None, "assistants")}
-                resp = requests.post(url, headers=headers, files=files_data)
-            
-            if resp.status_code != 200:
-                # Cleanup before continuing to next file
-                safe_cleanup_error(temp_path)
-                if converted_file and upload_file_path != temp_path:
-                    safe_cleanup_error(upload_file_path)
-                errors.append(f"OpenAI file upload failed for {file.filename}: {resp.text}")
-                continue
-            
-            file_id = resp.json()["id"]
-            
-            # 2. Attach file to vector store
-            url2 = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/files"
-            data = {"file_id": file_id}
-            resp2 = requests.post(url2, headers=headers, json=data)
-            
-            if resp2.status_code != 200:
-                # Cleanup before continuing to next file
-                safe_cleanup_error(temp_path)
-                if converted_file and upload_file_path != temp_path:
-                    safe_cleanup_error(upload_file_path)
-                errors.append(f"OpenAI vector store attach failed for {file.filename}: {resp2.text}")
-                continue
-            
-            # Cleanup temporary files after successful upload
-            safe_cleanup_with_retry(temp_path)
-            if converted_file and upload_file_path != temp_path:
-                safe_cleanup_with_retry(upload_file_path)
-            
-            response_message = "File uploaded and attached to vector store via REST API."
-            if converted_file:
-                response_message += " (Excel file was converted to PDF for better knowledge base compatibility.)"
-            
-            results.append({
-                "filename": file.filename,
-                "status": "success",
-                "message": response_message,
-                "file_id": file_id,
-                "vector_store_id": VECTOR_STORE_ID,
-                "converted_to_pdf": converted_file
-            })
-            
-        except Exception as e:
-            # Cleanup on any unexpected error
-            try:
-                if 'temp_path' in locals():
-                    safe_cleanup_error(temp_path)
-                if 'upload_file_path' in locals() and upload_file_path != temp_path:
-                    safe_cleanup_error(upload_file_path)
-            except:
-                pass
-            
-            logging.error(f"Unexpected error uploading {file.filename}: {str(e)}", exc_info=True)
-            errors.append(f"Upload failed for {file.filename}: {str(e)}")
+        
+        file_content = await file.read()
+        content_hash = hashlib.sha256(file_content).hexdigest()
+        
+        duplicate_file = seen_hashes.get(content_hash) or await run_in_threadpool(
+            check_duplicate_file, file.filename, len(file_content), content_hash
+        )
+        if duplicate_file:
+            outcomes.append((_skipped_duplicate(file.filename, duplicate_file), None))
+            continue
+        seen_hashes[content_hash] = {"id": None, "filename": file.filename, "created_at": None}
+        
+        outcomes.append(None)
+        pending.append((len(outcomes) - 1, file.filename, file_content, content_hash))
+    
+    semaphore = asyncio.Semaphore(KNOWLEDGE_UPLOAD_CONCURRENCY)
+    
+    async def run_pipeline(filename: str, file_content: bytes, content_hash: str):
+        async with semaphore:
+            return await _process_knowledge_upload(filename, file_content, content_hash, VECTOR_STORE_ID, excel_format)
+    
+    processed = await asyncio.gather(*(run_pipeline(name, content, h) for _, name, content, h in pending))
+    for (position, _, _, _), outcome in zip(pending, processed):
+        outcomes[position] = outcome
+    
+    results = [result for result, _ in outcomes if result is not None]
+    errors = [error for _, error in outcomes if error is not None]
+    
+    uploaded_ids = [r["file_id"] for r in results if r["status"] == "success"]
+    if uploaded_ids:
+        invalidate_answer_cache_when_indexed(VECTOR_STORE_ID, uploaded_ids, f"uploaded {len(uploaded_ids)} knowledge file(s)")
     
     # Return summary of results
     if len(results) == 0 and len(errors) > 0:
@@ -336,102 +534,119 @@ async def upload_knowledge_file(files: list[UploadFile] = File(...)):
 @router.post("/scan-website")
 async def upload_website_content(payload: dict):
     """
-    Crawls up to `max_pages` from the given URL's domain, aggregates main text, and uploads to OpenAI vector store.
+    Crawls up to `max_pages` from the given URL's domain and uploads the page text to the OpenAI vector store.
+    Page text is streamed into size-bounded files (one URL-tagged section per page) that are
+    attached with a single vector store file batch.
+    Rescans are incremental: known pages are fetched with conditional GETs and only new or
+    changed pages are re-ingested; the files they replace are deleted.
+    Pass `"force": true` to re-ingest every crawled page.
     """
     url = payload.get("url")
     max_pages = payload.get("max_pages", 10)
+    force = bool(payload.get("force", False))
     
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
     
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
-    if not OPENAI_API_KEY or not VECTOR_STORE_ID:
+    if not get_llm_backend().is_configured() or not VECTOR_STORE_ID:
         raise HTTPException(status_code=500, detail="OpenAI API key or Vector Store ID not configured.")
     
+    site = urlparse(url).netloc
+    work_dir = tempfile.mkdtemp(prefix="website_scan_")
+    writer = WebsiteContentWriter(work_dir, site, str(int(time.time())))
     try:
-        # Crawl the website
-        logging.info(f"Starting website crawl for {url}, max_pages={max_pages}")
-        all_links = crawl_static_links(url, max_pages=max_pages)
-        
-        if not all_links:
-            raise HTTPException(status_code=400, detail="No content found at the provided URL")
+        known_pages = await run_in_threadpool(load_site_pages, site)
         
-        # Aggregate all page content
-        full_content = ""
-        for page_url in all_links:
-            try:
-                # Fetch content from each URL
-                logging.info(f"Fetching content from {page_url}")
-                response = requests.get(page_url, timeout=15, headers={
-                    'User-Agent': 'Mozilla/5.0 (compatible; Knowledge-Bot/1.0)'
-                })
-                if response.status_code == 200:
-                    from bs4 import BeautifulSoup
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    
-                    # Remove script and style elements
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    
-                    # Get text content
-                    page_content = soup.get_text()
-                    
-                    # Clean up whitespace
-                    lines = (line.strip() for line in page_content.splitlines())
-                    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                    page_content = ' '.join(chunk for chunk in chunks if chunk)
-                    
-                    if page_content.strip():
-                        full_content += f"\n\n--- Content from {page_url} ---\n{page_content}"
-                else:
-                    logging.warning(f"Failed to fetch {page_url}: HTTP {response.status_code}")
-            except Exception as e:
-                logging.error(f"Error fetching content from {page_url}: {str(e)}")
-                continue
+        # Crawl the website (conditionally for pages seen by an earlier scan) and write
+        # changed pages to disk as they arrive; only page metadata is kept in memory
+        logging.info(f"Starting website crawl for {url}, max_pages={max_pages}, known pages={len(known_pages)}")
+        pages_crawled = 0
+        changed_states = {}  # url -> final state (without text), saved once the upload succeeded
+        superseded_file_ids = set()
+        pending_states = []
         
-        # Check if we got any content
-        if not full_content.strip():
-            raise HTTPException(status_code=400, detail="No readable content found from the crawled pages")
+        def ingest_page(page):
+            previous = known_pages.get(page.url)
+            state, changed = classify_page(page, previous, force)
+            if not changed:
+                return state
+            if previous and previous["file_id"]:
+                superseded_file_ids.add(previous["file_id"])
+            writer.add(page.url, state["text"])
+            changed_states[page.url] = {k: v for k, v in state.items() if k != "text"}
+            # Until the new files are attached, keep the old hash and validators so a failed
+            # scan is detected as changed again next time; only the text is stored now
+            interim = previous or {"url": page.url, "etag": None, "last_modified": None,
+                                   "content_hash": "", "links": state["links"], "file_id": None}
+            return {**interim, "text": state["text"]}
         
-        # Create a temporary text file
-        temp_dir = tempfile.gettempdir()
-        temp_filename = f"website_content_{int(time.time())}.txt"
-        temp_path = os.path.join(temp_dir, temp_filename)
+        async for page in iter_crawl_site(url, max_pages=max_pages, validators=None if force else known_pages):
+            pages_crawled += 1
+            pending_states.append(await run_in_threadpool(ingest_page, page))
+            if len(pending_states) >= WEBSITE_STATE_SAVE_BATCH:
+                await run_in_threadpool(save_site_pages, site, pending_states)
+                pending_states = []
+        await run_in_threadpool(save_site_pages, site, pending_states)
         
-        with open(temp_path, "w", encoding="utf-8") as f:
-            f.write(full_content)
+        if not pages_crawled:
+            raise HTTPException(status_code=400, detail="No content found at the provided URL")
         
-        # Upload to OpenAI
-        url_upload = "https://api.openai.com/v1/files"
-        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-        with open(temp_path, "rb") as f_in:
-            files = {"file": f_in, "purpose": (None, "assistants")}
-            resp = requests.post(url_upload, headers=headers, files=files)
+        # Pages sharing a file with a changed page move to the new files as well
+        def add_siblings() -> int:
+            count = 0
+            for sibling_url, text in iter_page_texts(site, superseded_file_ids, exclude_urls=changed_states):
+                writer.add(sibling_url, text)
+                count += 1
+            return count
         
-        if resp.status_code != 200:
-            safe_cleanup_error(temp_path)
-            raise HTTPException(status_code=500, detail=f"OpenAI file upload failed: {resp.text}")
+        siblings = await run_in_threadpool(add_siblings)
+        files = writer.close()
+        logging.info(
+            f"Website scan of {site}: {pages_crawled} pages, {len(changed_states)} changed, "
+            f"{siblings} carried over, {len(files)} files, {len(superseded_file_ids)} files superseded"
+        )
         
-        file_id = resp.json()["id"]
+        if not files and not superseded_file_ids:
+            if not changed_states:
+                return JSONResponse(content={
+                    "message": f"No changes detected across {pages_crawled} pages",
+                    "file_ids": [],
+                    "vector_store_id": VECTOR_STORE_ID,
+                    "pages_crawled": pages_crawled,
+                    "pages_changed": 0,
+                    "source_url": url
+                })
+            raise HTTPException(status_code=400, detail="No readable content found from the crawled pages")
         
-        # Attach to vector store
-        url_attach = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/files"
-        data = {"file_id": file_id}
-        resp2 = requests.post(url_attach, headers=headers, json=data)
+        file_ids = await _upload_website_files(files, VECTOR_STORE_ID)
+        file_by_url = {}
+        for aggregated, file_id in zip(files, file_ids):
+            file_by_url.update({page_url: file_id for page_url in aggregated.urls})
+        for page_url, state in changed_states.items():
+            state["file_id"] = file_by_url.pop(page_url, None)
+        await run_in_threadpool(save_site_pages, site, list(changed_states.values()))
+        await run_in_threadpool(set_page_files, file_by_url)  # Carried-over siblings
         
-        if resp2.status_code != 200:
-            safe_cleanup_error(temp_path)
-            raise HTTPException(status_code=500, detail=f"OpenAI vector store attach failed: {resp2.text}")
+        # Remove the files whose pages now live in the new files (only reached once the
+        # new files are confirmed attached; _upload_website_files raises otherwise)
+        for superseded_id in superseded_file_ids:
+            try:
+                await delete_file_from_vector_store(superseded_id)
+                logging.info(f"Removed superseded website file {superseded_id}")
+            except Exception as e:
+                logging.warning(f"Failed to remove superseded website file {superseded_id}: {e}")
         
-        # Cleanup
-        safe_cleanup_with_retry(temp_path)
+        await run_in_threadpool(invalidate_answer_cache, f"website scan of {url}")
         
         return JSONResponse(content={
-            "message": f"Successfully crawled and uploaded content from {len(all_links)} pages",
-            "file_id": file_id,
+            "message": f"Successfully crawled {pages_crawled} pages and uploaded {len(file_ids)} files",
+            "file_ids": file_ids,
             "vector_store_id": VECTOR_STORE_ID,
-            "pages_crawled": len(all_links),
+            "pages_crawled": pages_crawled,
+            "pages_changed": len(changed_states),
+            "pages_ingested": sum(len(f.urls) for f in files),
+            "superseded_file_ids": sorted(superseded_file_ids),
             "source_url": url
         })
         
@@ -440,16 +655,61 @@ async def upload_website_content(payload: dict):
     except Exception as e:
         logging.error(f"Website upload failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Website upload failed: {str(e)}")
+    finally:
+        writer.close()
+        await run_in_threadpool(_cleanup_work_dir, work_dir)
+
+async def _upload_website_files(files: list, vector_store_id: str) -> list:
+    """
+    Uploads the aggregated website files concurrently, attaches them in one vector store
+    file batch, then catalogs and indexes them. Returns the file ids in `files` order.
+    If any upload or the attach fails, the files uploaded so far are removed again.
+    """
+    semaphore = asyncio.Semaphore(KNOWLEDGE_UPLOAD_CONCURRENCY)
+    
+    async def upload(aggregated):
+        async with semaphore:
+            try:
+                return await upload_file_to_openai_async(aggregated.path, aggregated.filename)
+            except LLMBackendError as e:
+                raise Exception(f"OpenAI file upload failed for {aggregated.filename}: {e}")
+    
+    outcomes = await asyncio.gather(*(upload(f) for f in files), return_exceptions=True)
+    failures = [o for o in outcomes if isinstance(o, Exception)]
+    uploaded = [o for o in outcomes if not isinstance(o, Exception)]
+    if failures:
+        for item in uploaded:
+            await get_llm_backend().delete_file_async(item["id"])
+        raise failures[0]
+    
+    file_ids = [item["id"] for item in uploaded]
+    try:
+        await attach_files_to_vector_store_batch_async(vector_store_id, file_ids)
+    except Exception:
+        # Some files may be attached already; take them out of the store before deleting them
+        backend = get_llm_backend()
+        for file_id in file_ids:
+            await backend.detach_file_async(vector_store_id, file_id)
+            await backend.delete_file_async(file_id)
+        raise
+    
+    for aggregated, item in zip(files, uploaded):
+        await run_in_threadpool(record_catalog_file, item, aggregated.content_hash)
+        await run_in_threadpool(index_for_local_retrieval, aggregated.path, item["id"], aggregated.filename)
+    return file_ids
 
 @router.get("/files")
-async def get_knowledge_files():
+async def get_knowledge_files(refresh: bool = False):
     """
     Returns a list of all files currently in the knowledge base vector store.
+    Served from the local catalog; `refresh=true` re-syncs it with the vector store first.
     """
     try:
-        files = get_vector_store_files()
-        # Sort by creation date (newest first)
-        files.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+        files = await run_in_threadpool(list_catalog_files)
+        if refresh or (not files and last_refresh_at() is None):
+            await refresh_knowledge_catalog()
+            files = await run_in_threadpool(list_catalog_files)
+        # Catalog is already sorted by creation date (newest first)
         return JSONResponse(content={
             "files": files,
             "total": len(files)
@@ -464,8 +724,9 @@ async def delete_knowledge_file(file_id: str):
     Deletes a file from the knowledge base vector store.
     """
     try:
-        success = delete_file_from_vector_store(file_id)
+        success = await delete_file_from_vector_store(file_id)
         if success:
+            await run_in_threadpool(invalidate_answer_cache, f"deleted knowledge file {file_id}")
             return JSONResponse(content={
                 "message": "File deleted successfully",
                 "file_id": file_id
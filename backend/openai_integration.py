@@ -3,26 +3,105 @@ openai_integration.py
 ---------------------
 Handles OpenAI Assistant interactions for RAG workflows.
 Note: File upload functions have been moved to openai_file_upload.py
+Provider calls go through llm_backend, so LLM_BACKEND=stub runs these workflows offline.
 """
 
 import os
+import math
 import logging
 import re
-import openai  # Make sure to install openai package
+import time
+import asyncio
+from typing import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from llm_backend import get_llm_backend
+from run_waiter import wait_for_run, wait_for_run_sync, RunWaitError
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # Set your API key in environment or config
+# Batch processing configuration
+BATCH_MAX_WORKERS = int(os.getenv("OPENAI_BATCH_MAX_WORKERS", "8"))
+BATCH_QUESTION_TIMEOUT = float(os.getenv("OPENAI_BATCH_QUESTION_TIMEOUT", "300"))
+BATCH_POLL_INTERVAL = 1.0  # Seconds between completion/timeout checks
+BATCH_MAX_CONCURRENCY = int(os.getenv("OPENAI_BATCH_MAX_CONCURRENCY", "32"))  # Async batch: questions in flight
 
 
-def query_openai_assistant(question: str, assistant_id: str, file_id: str = None) -> str:
+RETRIEVAL_ENGINES = ("assistant", "local")
+
+
+def _with_answer_cache(question: str, cache_id: str, compute: Callable[[], str]) -> str:
+    """Serves the answer from the answer cache or computes and stores it."""
+    if not ANSWER_CACHE_ENABLED:
+        return compute()
+    cached_answer, kb_version = answer_cache.lookup(question, cache_id)
+    if cached_answer is not None:
+        logging.info(f"Answer cache hit: {question[:100]}...")
+        return cached_answer
+    answer = compute()
+    answer_cache.store(question, cache_id, answer, kb_version)
+    return answer
+
+
+def answer_question(question: str, assistant_id: str, engine: str = "assistant", deadline: float = None) -> str:
+    """
+    Answers a question with the selected retrieval engine:
+    "assistant" uses the OpenAI Assistant with file_search, "local" uses the pgvector pipeline.
+    `deadline` caps the assistant run in seconds (OPENAI_RUN_DEADLINE_SECONDS by default).
+    """
+    if engine == "assistant":
+        return query_openai_assistant(question, assistant_id, deadline=deadline)
+    if engine == "local":
+        return query_local_rag(question)
+    raise ValueError(f"Unknown retrieval engine: {engine}. Supported: {', '.join(RETRIEVAL_ENGINES)}")
+
+
+def query_openai_assistant(question: str, assistant_id: str, file_id: str = None, use_cache: bool = True,
+                           deadline: float = None) -> str:
     """
     Sends a question to the OpenAI Assistant and returns the answer.
+    Answers are served from the answer cache when the same normalized question was already
+    answered against the current knowledge base version. Questions with a file attachment
+    always go to the assistant.
+    """
+    if not use_cache or file_id:
+        return _query_openai_assistant_uncached(question, assistant_id, file_id, deadline)
+    return _with_answer_cache(
+        question, assistant_id, lambda: _query_openai_assistant_uncached(question, assistant_id, deadline=deadline)
+    )
+
+
+def query_local_rag(question: str, use_cache: bool = True) -> str:
+    """
+    Answers a question from the local pgvector index with a single completion call.
+    Uses the same answer cleanup and answer cache as query_openai_assistant.
+    """
+    from local_retrieval import answer_with_local_retrieval, LOCAL_RAG_COMPLETION_MODEL
+
+    def compute() -> str:
+        return clean_answer(answer_with_local_retrieval(question))
+
+    if not use_cache:
+        return compute()
+    return _with_answer_cache(question, f"local:{LOCAL_RAG_COMPLETION_MODEL}", compute)
+
+
+def _question_messages(question: str, file_id: str = None) -> list:
+    """Initial thread message for a question, with the file attached for file_search when given."""
+    return [{
+        "role": "user",
+        "content": question,
+        **({"attachments": [{"file_id": file_id, "tools": [{"type": "file_search"}]}]} if file_id else {})
+    }]
+
+
+def _query_openai_assistant_uncached(question: str, assistant_id: str, file_id: str = None, deadline: float = None) -> str:
+    """
+    Runs the question through a fresh assistant thread and returns the cleaned answer.
     Simple, direct call to the assistant with enhanced logging for debugging.
     """
-    if not OPENAI_API_KEY:
+    backend = get_llm_backend()
+    if not backend.is_configured():
         raise ValueError("OPENAI_API_KEY environment variable not set.")
     
-    openai.api_key = OPENAI_API_KEY
-    
     try:
         logging.info(f"=== OpenAI Assistant Call Debug ===")
         logging.info(f"Question: {question[:100]}...")
@@ -30,57 +109,20 @@ def query_openai_assistant(question: str, assistant_id: str, file_id: str = None
         logging.info(f"File ID: {file_id}")
         
         # Create thread - each call gets a fresh thread (no conversation context)
-        thread = openai.beta.threads.create(
-            messages=[{
-                "role": "user",
-                "content": question,
-                **({"attachments": [{"file_id": file_id, "tools": [{"type": "file_search"}]}]} if file_id else {})
-            }]
-        )
-        logging.info(f"Created thread: {thread.id}")
-        
-        # Run assistant and wait for completion
-        run = openai.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id
-        )
-        logging.info(f"Run completed with status: {run.status}")
-        logging.info(f"Run ID: {run.id}")
-        
-        if run.status != 'completed':
-            logging.error(f"Run details: {run}")
-            raise RuntimeError(f"Assistant run failed with status: {run.status}")
-        
-        # Get the response
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        assistant_message = messages.data[0]
-        
-        # Extract text content and handle citations properly
-        text_content = assistant_message.content[0].text
-        raw_answer = text_content.value
+        thread_id = backend.create_thread(_question_messages(question, file_id))
+        logging.info(f"Created thread: {thread_id}")
         
-        # Clean up formatting issues but preserve paragraph structure
-        # First normalize line endings to \n
-        answer = raw_answer.replace('\r\n', '\n').replace('\r', '\n')
-        
-        # Remove excessive line breaks (more than 2) but keep paragraph breaks
-        answer = re.sub(r'\n{3,}', '\n\n', answer)  # Replace 3+ line breaks with 2
-        
-        # Clean up spaces but don't remove all double spaces (some may be intentional)
-        answer = re.sub(r'[ \t]+', ' ', answer)  # Replace multiple spaces/tabs with single space
-        answer = re.sub(r' +\n', '\n', answer)   # Remove spaces before line breaks
-        answer = re.sub(r'\n +', '\n', answer)   # Remove spaces after line breaks
-        
-        # Remove all citation patterns - we just want the pure answer
-        # Handle various citation formats: [1], [1:2], [1:2*source], 【4:0†source】, etc.
-        answer = re.sub(r'\[[0-9]+(?::[0-9]+)?(?:\*[^\]]*)?[^\]]*\]', '', answer)  # [1], [1:2], [1:2*source]
-        answer = re.sub(r'【[0-9]+(?::[0-9]+)?(?:†[^】]*)?[^】]*】', '', answer)  # 【4:0†source】
-        answer = re.sub(r'\([0-9]+(?::[0-9]+)?(?:\*[^\)]*)?[^\)]*\)', '', answer)  # (1), (1:2), (1:2*source)
+        # Run assistant and wait for completion (raises RunWaitError for any other end state)
+        run_id = backend.start_run(thread_id, assistant_id)
+        logging.info(f"Run ID: {run_id}")
+        try:
+            wait_for_run_sync(backend, thread_id, run_id, deadline=deadline)
+        except RunWaitError as e:
+            logging.error(f"Run details: {e.run}")
+            raise
         
-        # Final cleanup - preserve line breaks but clean up excessive spacing
-        answer = re.sub(r'[ \t]+', ' ', answer)    # Multiple spaces to single space
-        answer = re.sub(r'\n\s*\n\s*\n+', '\n\n', answer)  # Multiple line breaks to double
-        answer = answer.strip()  # Remove leading/trailing whitespace only
+        # Get the response and handle citations properly
+        answer = clean_answer(backend.latest_assistant_message(thread_id) or "")
         
         logging.info(f"Answer length: {len(answer)}")
         logging.info(f"Answer preview: {answer[:200]}...")
@@ -92,26 +134,214 @@ def query_openai_assistant(question: str, assistant_id: str, file_id: str = None
         raise
 
 
-def query_openai_assistant_batch(questions: list, assistant_id: str) -> list:
+def clean_answer(raw_answer: str) -> str:
+    """Normalizes whitespace and strips citation markers from a model answer."""
+    # Clean up formatting issues but preserve paragraph structure
+    # First normalize line endings to \n
+    answer = raw_answer.replace('\r\n', '\n').replace('\r', '\n')
+    
+    # Remove excessive line breaks (more than 2) but keep paragraph breaks
+    answer = re.sub(r'\n{3,}', '\n\n', answer)  # Replace 3+ line breaks with 2
+    
+    # Clean up spaces but don't remove all double spaces (some may be intentional)
+    answer = re.sub(r'[ \t]+', ' ', answer)  # Replace multiple spaces/tabs with single space
+    answer = re.sub(r' +\n', '\n', answer)   # Remove spaces before line breaks
+    answer = re.sub(r'\n +', '\n', answer)   # Remove spaces after line breaks
+    
+    # Remove all citation patterns - we just want the pure answer
+    # Handle various citation formats: [1], [1:2], [1:2*source], 【4:0†source】, etc.
+    answer = re.sub(r'\[[0-9]+(?::[0-9]+)?(?:\*[^\]]*)?[^\]]*\]', '', answer)  # [1], [1:2], [1:2*source]
+    answer = re.sub(r'【[0-9]+(?::[0-9]+)?(?:†[^】]*)?[^】]*】', '', answer)  # 【4:0†source】
+    answer = re.sub(r'\([0-9]+(?::[0-9]+)?(?:\*[^\)]*)?[^\)]*\)', '', answer)  # (1), (1:2), (1:2*source)
+    
+    # Final cleanup - preserve line breaks but clean up excessive spacing
+    answer = re.sub(r'[ \t]+', ' ', answer)    # Multiple spaces to single space
+    answer = re.sub(r'\n\s*\n\s*\n+', '\n\n', answer)  # Multiple line breaks to double
+    answer = answer.strip()  # Remove leading/trailing whitespace only
+    return answer
+
+
+def _notify(on_answer, index: int, answer: str):
+    """Invokes a progress callback without letting its failures break the batch."""
+    if on_answer is None:
+        return
+    try:
+        on_answer(index, answer)
+    except Exception as e:
+        logging.warning(f"Answer callback failed for question {index + 1}: {e}")
+
+
+def query_openai_assistant_batch(questions: list, assistant_id: str, max_workers: int = None,
+                                 question_timeout: float = None, on_answer: Callable[[int, str], None] = None,
+                                 engine: str = "assistant") -> list:
     """
-    Processes multiple questions by calling the individual query function for each.
+    Processes multiple questions concurrently by calling the individual query function for each.
     This ensures identical behavior between individual and batch processing.
+    `engine` selects the retrieval engine per answer_question ("assistant" or "local").
+
+    Up to `max_workers` questions are in flight at once (OPENAI_BATCH_MAX_WORKERS by default).
+    A question that fails or runs longer than `question_timeout` seconds
+    (OPENAI_BATCH_QUESTION_TIMEOUT by default) gets an error string as its answer;
+    its assistant run gets the same deadline, so it is cancelled rather than left running.
+    The whole batch is bounded as well, by question_timeout per round of `max_workers`
+    questions: should workers hang in calls no deadline covers, the questions still waiting
+    for a worker fail at that point instead of blocking the batch forever.
+    Answers are returned in the same order as the input questions.
+    If given, `on_answer(index, answer)` is called from the calling thread as each question finishes.
     """
-    logging.info(f"=== Processing {len(questions)} Questions Individually ===")
-    
-    answers = []
-    for i, question in enumerate(questions, 1):
-        logging.info(f"Processing question {i}/{len(questions)}: {question[:100]}...")
-        
+    total = len(questions)
+    if not total:
+        return []
+
+    max_workers = max(1, min(max_workers or BATCH_MAX_WORKERS, total))
+    question_timeout = question_timeout or BATCH_QUESTION_TIMEOUT
+    logging.info(f"=== Processing {total} Questions ({max_workers} workers, {question_timeout:.0f}s timeout) ===")
+
+    answers = [None] * total
+    started_at = {}
+    batch_deadline = time.monotonic() + question_timeout * math.ceil(total / max_workers)
+
+    def _answer(index: int, question: str) -> str:
+        started_at[index] = time.monotonic()
+        logging.info(f"Processing question {index + 1}/{total}: {question[:100]}...")
+        # Use the exact same function as individual F24 expert mode
+        return answer_question(question, assistant_id, engine, deadline=question_timeout)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="assistant-batch")
+    try:
+        pending = {executor.submit(_answer, i, q): i for i, q in enumerate(questions)}
+        while pending:
+            done, _ = wait(pending, timeout=BATCH_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                try:
+                    answers[i] = future.result()
+                    logging.info(f"✅ Question {i + 1} answered successfully")
+                except Exception as question_error:
+                    logging.error(f"❌ Failed to process question {i + 1}: {question_error}")
+                    answers[i] = f"Error processing this question: {str(question_error)}"
+                _notify(on_answer, i, answers[i])
+
+            # Give up on questions that have been running for too long. The worker thread
+            # cannot be interrupted, so its result is simply discarded when it finishes.
+            now = time.monotonic()
+            for future, i in list(pending.items()):
+                start = started_at.get(i)
+                if start is not None and now - start > question_timeout:
+                    pending.pop(future)
+                    logging.error(f"❌ Question {i + 1} timed out after {question_timeout:.0f}s")
+                    answers[i] = f"Error processing this question: timed out after {question_timeout:.0f}s"
+                    _notify(on_answer, i, answers[i])
+                elif now > batch_deadline:
+                    pending.pop(future)
+                    future.cancel()
+                    logging.error(f"❌ Question {i + 1} {'timed out' if start is not None else 'never started'} before the batch deadline")
+                    answers[i] = "Error processing this question: the batch ran out of time"
+                    _notify(on_answer, i, answers[i])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logging.info(f"=== Processing Complete: {len(answers)} answers generated ===")
+    return answers
+
+
+# --- Async variants (event loop friendly, share the async connection pool) ---
+async def _with_answer_cache_async(question: str, cache_id: str, compute: Callable[[], Awaitable[str]]) -> str:
+    """Async counterpart of _with_answer_cache; cache reads and writes run in a worker thread."""
+    if not ANSWER_CACHE_ENABLED:
+        return await compute()
+    cached_answer, kb_version = await asyncio.to_thread(answer_cache.lookup, question, cache_id)
+    if cached_answer is not None:
+        logging.info(f"Answer cache hit: {question[:100]}...")
+        return cached_answer
+    answer = await compute()
+    await asyncio.to_thread(answer_cache.store, question, cache_id, answer, kb_version)
+    return answer
+
+
+async def answer_question_async(question: str, assistant_id: str, engine: str = "assistant") -> str:
+    """Async counterpart of answer_question."""
+    if engine == "assistant":
+        return await query_openai_assistant_async(question, assistant_id)
+    if engine == "local":
+        # Local retrieval is DB + provider calls; keep it off the event loop
+        return await asyncio.to_thread(query_local_rag, question)
+    raise ValueError(f"Unknown retrieval engine: {engine}. Supported: {', '.join(RETRIEVAL_ENGINES)}")
+
+
+async def query_openai_assistant_async(question: str, assistant_id: str, file_id: str = None,
+                                       use_cache: bool = True) -> str:
+    """Async counterpart of query_openai_assistant on the configured LLM backend."""
+    if not use_cache or file_id:
+        return await _query_openai_assistant_uncached_async(question, assistant_id, file_id)
+    return await _with_answer_cache_async(
+        question, assistant_id, lambda: _query_openai_assistant_uncached_async(question, assistant_id)
+    )
+
+
+async def _query_openai_assistant_uncached_async(question: str, assistant_id: str, file_id: str = None) -> str:
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        raise ValueError("OPENAI_API_KEY environment variable not set.")
+
+    try:
+        logging.info(f"Assistant call (async): {question[:100]}...")
+        thread_id = await backend.create_thread_async(_question_messages(question, file_id))
+        run_id = await backend.start_run_async(thread_id, assistant_id)
         try:
-            # Use the exact same function as individual F24 expert mode
-            answer = query_openai_assistant(question, assistant_id)
-            answers.append(answer)
-            logging.info(f"✅ Question {i} answered successfully")
-            
-        except Exception as question_error:
-            logging.error(f"❌ Failed to process question {i}: {question_error}")
-            answers.append(f"Error processing this question: {str(question_error)}")
-    
+            await wait_for_run(backend, thread_id, run_id)
+        except RunWaitError as e:
+            logging.error(f"Run details: {e.run}")
+            raise
+
+        answer = clean_answer(await backend.latest_assistant_message_async(thread_id) or "")
+        logging.info(f"Answer length: {len(answer)}")
+        return answer
+
+    except Exception as e:
+        logging.error(f"Failed to query OpenAI Assistant: {e}")
+        raise
+
+
+async def query_openai_assistant_batch_async(questions: list, assistant_id: str, max_concurrency: int = None,
+                                             question_timeout: float = None,
+                                             on_answer: Callable[[int, str], None] = None,
+                                             engine: str = "assistant") -> list:
+    """
+    Async counterpart of query_openai_assistant_batch. All questions are awaited on the
+    event loop with at most `max_concurrency` in flight (OPENAI_BATCH_MAX_CONCURRENCY by
+    default), so no thread is held per pending assistant run. Timeouts are enforced per
+    question and the timed out request is cancelled. Answers keep the input order;
+    `on_answer(index, answer)` is called on the event loop as each question finishes.
+    """
+    total = len(questions)
+    if not total:
+        return []
+
+    max_concurrency = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, total))
+    question_timeout = question_timeout or BATCH_QUESTION_TIMEOUT
+    logging.info(f"=== Processing {total} Questions (async, {max_concurrency} in flight, {question_timeout:.0f}s timeout) ===")
+
+    answers = [None] * total
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _answer(index: int, question: str):
+        async with semaphore:
+            logging.info(f"Processing question {index + 1}/{total}: {question[:100]}...")
+            try:
+                answers[index] = await asyncio.wait_for(
+                    answer_question_async(question, assistant_id, engine), question_timeout
+                )
+                logging.info(f"✅ Question {index + 1} answered successfully")
+            except asyncio.TimeoutError:
+                logging.error(f"❌ Question {index + 1} timed out after {question_timeout:.0f}s")
+                answers[index] = f"Error processing this question: timed out after {question_timeout:.0f}s"
+            except Exception as question_error:
+                logging.error(f"❌ Failed to process question {index + 1}: {question_error}")
+                answers[index] = f"Error processing this question: {str(question_error)}"
+        _notify(on_answer, index, answers[index])
+
+    await asyncio.gather(*(_answer(i, q) for i, q in enumerate(questions)))
+
     logging.info(f"=== Processing Complete: {len(answers)} answers generated ===")
     return answers
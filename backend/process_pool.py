@@ -0,0 +1,274 @@
+"""
+process_pool.py
+---------------
+Shared process pool for CPU-bound document work (Excel conversion, DOCX and
+unstructured parsing), so it neither holds the event loop nor a threadpool
+thread under the GIL.
+
+- Sized to the machine's cores (PROCESS_POOL_WORKERS; 0 runs tasks in a thread instead).
+- Workers are spawned, not forked, and warmed at startup by importing the
+  parsing libraries.
+- Every task has a timeout (PROCESS_TASK_TIMEOUT_SECONDS), counted from when a
+  worker starts it; time spent queued behind a busy pool has its own, longer limit
+  (PROCESS_QUEUE_TIMEOUT_SECONDS) and fails only that task. A task that times out,
+  or a worker that crashes, retires the pool: a fresh one takes new tasks while
+  the old one finishes what it still has in flight and is then terminated. Tasks
+  lost to a crashed pool are retried once in a single-use worker, so a stuck or
+  crashing conversion only fails its own request.
+
+Submitted functions and their arguments must be picklable (module-level functions).
+"""
+
+import os
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, Future, InvalidStateError, TimeoutError as FutureTimeoutError, wait
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(os.cpu_count() or 1)))
+PROCESS_TASK_TIMEOUT_SECONDS = float(os.getenv("PROCESS_TASK_TIMEOUT_SECONDS", "300"))
+PROCESS_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PROCESS_QUEUE_TIMEOUT_SECONDS", str(PROCESS_TASK_TIMEOUT_SECONDS * 4)))
+WARM_UP_MODULES = ("pandas", "openpyxl", "reportlab.platypus", "docx", "lxml.html")
+
+class ProcessTaskError(RuntimeError):
+    """A pooled task timed out or its worker process died."""
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_in_flight = {}  # executor -> set of futures still running on it
+
+# --- Task start reporting ---
+# A pool future is marked running as soon as it is queued for a worker, so workers
+# report the id of each task they pick up and timeouts are counted from there.
+_start_queue = None
+_start_queue_lock = threading.Lock()
+_started = {}  # task id -> Future resolved when a worker starts the task
+_task_ids = itertools.count()
+
+def _init_worker(queue):
+    global _start_queue
+    _start_queue = queue
+
+def _run_task(task_id: int, fn: Callable, args: tuple, kwargs: dict):
+    _start_queue.put(task_id)
+    return fn(*args, **kwargs)
+
+def _mark_started(started: Future):
+    try:
+        started.set_result(None)
+    except InvalidStateError:
+        pass  # Already started, finished or given up on
+
+def _listen_for_starts(queue):
+    for task_id in iter(queue.get, None):
+        started = _started.pop(task_id, None)
+        if started is not None:
+            _mark_started(started)
+
+def _get_start_queue():
+    global _start_queue
+    with _start_queue_lock:
+        if _start_queue is None:
+            _start_queue = multiprocessing.get_context("spawn").SimpleQueue()
+            threading.Thread(
+                target=_listen_for_starts, args=(_start_queue,), name="process-pool-starts", daemon=True
+            ).start()
+        return _start_queue
+
+def _new_executor(max_workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(_get_start_queue(),)
+    )
+
+def _warm_up(modules) -> int:
+    import importlib
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    return os.getpid()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = _new_executor(PROCESS_POOL_WORKERS)
+            _in_flight[_executor] = set()
+            logging.info(f"Started process pool with {PROCESS_POOL_WORKERS} workers")
+        return _executor
+
+def _terminate(executor: ProcessPoolExecutor):
+    # Kills workers that are still busy (e.g. with a task that timed out)
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _retire(executor: ProcessPoolExecutor, reason: str, trigger: Optional[Future] = None):
+    """
+    Swaps in a fresh pool and terminates `executor` once its other tasks are done.
+    `trigger` is the task that caused the retirement (e.g. one that timed out); it is not
+    waited for, since it may never finish.
+    """
+    global _executor
+    with _lock:
+        if _executor is not executor:
+            return  # Already retired by another task
+        _executor = None
+        others = [f for f in _in_flight.pop(executor, set()) if f is not trigger and not f.done()]
+    logging.warning(f"Recycling process pool ({reason}); {len(others)} task(s) left to finish on the old pool")
+
+    def reap():
+        wait(others, timeout=PROCESS_QUEUE_TIMEOUT_SECONDS + PROCESS_TASK_TIMEOUT_SECONDS)
+        _terminate(executor)
+
+    threading.Thread(target=reap, name="process-pool-reaper", daemon=True).start()
+
+def _submit_reporting_start(executor: ProcessPoolExecutor, fn: Callable, args: tuple, kwargs: dict):
+    """Submits fn and returns (future, started), where `started` resolves once a worker begins it."""
+    task_id = next(_task_ids)
+    started = _started[task_id] = Future()
+    try:
+        future = executor.submit(_run_task, task_id, fn, args, kwargs)
+    except BaseException:
+        _started.pop(task_id, None)
+        raise
+    future.add_done_callback(lambda _: (_started.pop(task_id, None), _mark_started(started)))
+    return future, started
+
+def _submit(fn: Callable, *args, **kwargs):
+    executor = _get_executor()
+    try:
+        future, started = _submit_reporting_start(executor, fn, args, kwargs)
+    except (BrokenProcessPool, RuntimeError) as e:
+        # Broken or shut down between lookup and submit: retry once on a fresh pool
+        _retire(executor, f"submit failed: {e}")
+        executor = _get_executor()
+        future, started = _submit_reporting_start(executor, fn, args, kwargs)
+    with _lock:
+        tracked = _in_flight.get(executor)
+        if tracked is not None:
+            tracked.add(future)
+            future.add_done_callback(tracked.discard)
+    return executor, future, started
+
+def _submit_isolated(fn: Callable, *args, **kwargs):
+    """Runs one task in a single-use worker, so a retried task cannot take down the shared pool."""
+    executor = _new_executor(1)
+    future, started = _submit_reporting_start(executor, fn, args, kwargs)
+    future.add_done_callback(lambda _: executor.shutdown(wait=False))
+    return executor, future, started
+
+def _discard(executor: ProcessPoolExecutor, reason: str, trigger: Optional[Future] = None):
+    with _lock:
+        shared = executor is _executor
+    if shared:
+        _retire(executor, reason, trigger)
+    else:
+        _terminate(executor)
+
+def _task_name(fn: Callable) -> str:
+    return getattr(fn, "__qualname__", repr(fn))
+
+def _queue_timed_out(fn: Callable, future: Future) -> ProcessTaskError:
+    # The pool is busy, not stuck: drop this task without retiring the pool
+    future.cancel()
+    return ProcessTaskError(
+        f"{_task_name(fn)} waited more than {PROCESS_QUEUE_TIMEOUT_SECONDS:.0f}s for a free worker"
+    )
+
+def run_cpu_bound_sync(fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+    """
+    Runs fn(*args, **kwargs) in the process pool and blocks for the result.
+    Meant for code that already runs in a worker thread. Raises ProcessTaskError
+    on timeout or worker crash; exceptions raised by fn propagate unchanged.
+    When the pool breaks, every task on it fails, so a task is retried once in a
+    single-use worker: bystanders succeed there and the crashing task fails alone.
+    """
+    if PROCESS_POOL_WORKERS <= 0:
+        return fn(*args, **kwargs)
+    timeout = timeout or PROCESS_TASK_TIMEOUT_SECONDS
+    for attempt in range(2):
+        executor, future, started = (_submit_isolated if attempt else _submit)(fn, *args, **kwargs)
+        if not wait([started], timeout=PROCESS_QUEUE_TIMEOUT_SECONDS).done:
+            raise _queue_timed_out(fn, future)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            _discard(executor, f"{_task_name(fn)} timed out", future)
+            raise ProcessTaskError(f"{_task_name(fn)} timed out after {timeout:.0f}s")
+        except BrokenProcessPool as e:
+            _discard(executor, f"worker crashed during {_task_name(fn)}", future)
+            if attempt:
+                raise ProcessTaskError(f"Worker process crashed while running {_task_name(fn)}") from e
+
+async def run_cpu_bound(fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+    """Async counterpart of run_cpu_bound_sync; the event loop stays free while the task runs."""
+    if PROCESS_POOL_WORKERS <= 0:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    timeout = timeout or PROCESS_TASK_TIMEOUT_SECONDS
+    for attempt in range(2):
+        executor, future, started = (_submit_isolated if attempt else _submit)(fn, *args, **kwargs)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(started), PROCESS_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise _queue_timed_out(fn, future)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            _discard(executor, f"{_task_name(fn)} timed out", future)
+            raise ProcessTaskError(f"{_task_name(fn)} timed out after {timeout:.0f}s")
+        except BrokenProcessPool as e:
+            _discard(executor, f"worker crashed during {_task_name(fn)}", future)
+            if attempt:
+                raise ProcessTaskError(f"Worker process crashed while running {_task_name(fn)}") from e
+
+def map_cpu_bound_sync(fn: Callable, args_list: List[tuple], timeout: Optional[float] = None) -> list:
+    """
+    Runs fn(*args) for every tuple in `args_list` in parallel across the pool.
+    Returns results in order; a failed call has its exception in place of the result.
+    """
+    if PROCESS_POOL_WORKERS <= 0 or len(args_list) <= 1:
+        results = []
+        for args in args_list:
+            try:
+                results.append(run_cpu_bound_sync(fn, *args, timeout=timeout))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(len(args_list), PROCESS_POOL_WORKERS)) as threads:
+        futures = [threads.submit(run_cpu_bound_sync, fn, *args, timeout=timeout) for args in args_list]
+    return [f.exception() or f.result() for f in futures]
+
+def start_process_pool():
+    """Creates the pool and warms every worker (spawn + imports) without waiting for it."""
+    if PROCESS_POOL_WORKERS <= 0:
+        return
+    executor = _get_executor()
+    for _ in range(PROCESS_POOL_WORKERS):
+        executor.submit(_warm_up, WARM_UP_MODULES)
+
+def shutdown_process_pool():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        _in_flight.clear()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+__all__ = [
+    "run_cpu_bound", "run_cpu_bound_sync", "map_cpu_bound_sync", "ProcessTaskError",
+    "start_process_pool", "shutdown_process_pool", "PROCESS_POOL_WORKERS", "PROCESS_TASK_TIMEOUT_SECONDS",
+    "PROCESS_QUEUE_TIMEOUT_SECONDS"
+]
@@ -0,0 +1,164 @@
+"""
+processed_items.py
+------------------
+Tracking store for items that have already been ingested (crawled URLs, file
+hashes, ...), kept in the ProcessedItem table instead of processed_items.txt.
+
+Items are keyed by (namespace, key), so lookups are indexed point or batch
+queries. Writes are single-statement upserts (INSERT ... ON CONFLICT), which
+makes concurrent writers from several API workers safe. Items may carry an
+expiry; expired items read as not processed and are removed by purge_expired_items.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from sqlmodel import Session, select, delete, col
+from db import engine
+from models import ProcessedItem
+
+NAMESPACE_URL = "url"
+NAMESPACE_FILE_HASH = "file_hash"
+LOOKUP_BATCH_SIZE = 500  # Keys per IN (...) query
+LEGACY_TRACK_FILE = "processed_items.txt"
+
+def _insert_statement():
+    """Dialect-specific INSERT that supports ON CONFLICT upserts."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Processed item upserts are not supported on {engine.dialect.name}")
+    return insert(ProcessedItem.__table__)
+
+def _not_expired(now: datetime):
+    return (col(ProcessedItem.expires_at).is_(None)) | (col(ProcessedItem.expires_at) > now)
+
+# --- Writes ---
+def mark_processed(keys: Iterable[str], namespace: str = NAMESPACE_URL, ttl_seconds: Optional[int] = None,
+                   info: Optional[str] = None):
+    """Records keys as processed (refreshing timestamps/expiry of keys seen before)."""
+    keys = list(dict.fromkeys(k for k in keys if k))
+    if not keys:
+        return
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds) if ttl_seconds else None
+    rows = [
+        {"namespace": namespace, "item_key": key, "info": info,
+         "created_at": now, "updated_at": now, "expires_at": expires_at}
+        for key in keys
+    ]
+    insert = _insert_statement()
+    statement = insert.on_conflict_do_update(
+        index_elements=["namespace", "item_key"],
+        set_={"info": insert.excluded.info, "updated_at": insert.excluded.updated_at, "expires_at": insert.excluded.expires_at}
+    )
+    with engine.begin() as conn:
+        for start in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            conn.execute(statement, rows[start:start + LOOKUP_BATCH_SIZE])
+
+def unmark_processed(keys: Iterable[str], namespace: str = NAMESPACE_URL):
+    keys = list(keys)
+    with Session(engine) as session:
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            session.exec(
+                delete(ProcessedItem)
+                .where(ProcessedItem.namespace == namespace)
+                .where(col(ProcessedItem.item_key).in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+            )
+        session.commit()
+
+def purge_expired_items() -> int:
+    """Deletes expired items. Returns how many were removed."""
+    with Session(engine) as session:
+        result = session.exec(
+            delete(ProcessedItem)
+            .where(col(ProcessedItem.expires_at).is_not(None))
+            .where(col(ProcessedItem.expires_at) <= datetime.utcnow())
+        )
+        session.commit()
+        return result.rowcount or 0
+
+# --- Lookups ---
+def is_processed(key: str, namespace: str = NAMESPACE_URL) -> bool:
+    """Point lookup on the (namespace, key) primary key."""
+    with Session(engine) as session:
+        row = session.get(ProcessedItem, (namespace, key))
+        return row is not None and (row.expires_at is None or row.expires_at > datetime.utcnow())
+
+def filter_processed(keys: Iterable[str], namespace: str = NAMESPACE_URL) -> Set[str]:
+    """Batch lookup: the subset of `keys` that is processed and not expired."""
+    keys = list(dict.fromkeys(keys))
+    found = set()
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            found.update(session.exec(
+                select(ProcessedItem.item_key)
+                .where(ProcessedItem.namespace == namespace)
+                .where(col(ProcessedItem.item_key).in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+                .where(_not_expired(now))
+            ).all())
+    return found
+
+def get_processed_info(keys: Iterable[str], namespace: str = NAMESPACE_URL) -> Dict[str, Optional[str]]:
+    """Batch lookup returning {key: info} for processed, unexpired keys."""
+    keys = list(dict.fromkeys(keys))
+    info = {}
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            info.update(session.exec(
+                select(ProcessedItem.item_key, ProcessedItem.info)
+                .where(ProcessedItem.namespace == namespace)
+                .where(col(ProcessedItem.item_key).in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+                .where(_not_expired(now))
+            ).all())
+    return info
+
+def list_processed(namespace: str = NAMESPACE_URL, limit: Optional[int] = None) -> List[str]:
+    """Processed keys of a namespace, most recently updated first."""
+    with Session(engine) as session:
+        query = (
+            select(ProcessedItem.item_key)
+            .where(ProcessedItem.namespace == namespace)
+            .where(_not_expired(datetime.utcnow()))
+            .order_by(col(ProcessedItem.updated_at).desc())
+        )
+        if limit:
+            query = query.limit(limit)
+        return list(session.exec(query).all())
+
+# --- Legacy file import ---
+def import_legacy_track_file(path: str = LEGACY_TRACK_FILE, namespace: str = NAMESPACE_URL) -> int:
+    """
+    Moves identifiers from the old processed_items.txt into the store and renames the
+    file so it is imported only once. Returns the number of identifiers imported.
+
+    Every uvicorn worker calls this on startup, so the file is first claimed with an
+    atomic rename; workers that lose the race find it gone and import nothing.
+    """
+    claimed = f"{path}.importing.{os.getpid()}"
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return 0
+    try:
+        with open(claimed, "r") as f:
+            keys = [line.strip() for line in f if line.strip()]
+        mark_processed(keys, namespace)
+    except Exception:
+        os.replace(claimed, path)  # Put it back so the next startup retries the import
+        raise
+    os.replace(claimed, path + ".imported")
+    logging.info(f"Imported {len(keys)} processed items from {path}")
+    return len(keys)
+
+__all__ = [
+    "NAMESPACE_URL", "NAMESPACE_FILE_HASH",
+    "mark_processed", "unmark_processed", "purge_expired_items",
+    "is_processed", "filter_processed", "get_processed_info", "list_processed",
+    "import_legacy_track_file"
+]
@@ -0,0 +1,142 @@
+"""
+question_dedup.py
+-----------------
+Collapses near-duplicate questions before they are sent to the assistant.
+
+Questions are normalized and broken into character shingles. MinHash signatures
+with LSH banding find candidate pairs cheaply, and candidates are confirmed with
+the exact Jaccard similarity of their shingle sets. Everything runs locally.
+
+Shingle similarity alone merges questions that differ in one meaningful word
+("... before onboarding" / "... after onboarding" score above 0.9), so a pair is
+only merged when, in addition, both questions have the same content words, i.e.
+they differ only in stopwords, punctuation, case or plural endings.
+Off by default (QUESTION_DEDUP_ENABLED).
+"""
+
+import os
+import re
+import zlib
+import logging
+from typing import List, Tuple
+import numpy as np
+from answer_cache import normalize_question
+
+QUESTION_DEDUP_ENABLED = os.getenv("QUESTION_DEDUP_ENABLED", "false").lower() == "true"
+QUESTION_DEDUP_THRESHOLD = float(os.getenv("QUESTION_DEDUP_THRESHOLD", "0.85"))  # Jaccard similarity
+SHINGLE_SIZE = 4
+LSH_BANDS = 6
+LSH_ROWS = 6  # Signature length is LSH_BANDS * LSH_ROWS
+
+# Words that never change what a question asks. Negations, quantifiers and
+# prepositions ("not", "all", "before", "after", "without") are deliberately absent.
+STOPWORDS = frozenset("""
+    a an the this that these those is are was were be been being do does did
+    you your yours we our ours they their it its i my me us please
+    of to in on at as for by and or
+    there here which who whom what kindly describe provide confirm
+""".split())
+
+# Universal hash permutations (a * h + b) % p. With p < 2**31 and 32-bit crc32
+# hashes the products fit in uint64 without overflow.
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(1729)  # Fixed seed keeps grouping deterministic across workers
+_PERM_A = _rng.integers(1, (1 << 31) - 1, size=LSH_BANDS * LSH_ROWS, dtype=np.uint64)[:, None]
+_PERM_B = _rng.integers(0, (1 << 31) - 1, size=LSH_BANDS * LSH_ROWS, dtype=np.uint64)[:, None]
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Character shingles of the normalized text (the whole text if it is shorter than `size`)."""
+    normalized = normalize_question(text)
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def _numbers(text: str) -> frozenset:
+    return frozenset(re.findall(r"\d+", text))
+
+def content_words(text: str) -> frozenset:
+    """Normalized words other than STOPWORDS, with a plural "s" dropped."""
+    words = normalize_question(text).split()
+    return frozenset(
+        w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+        for w in words if w not in STOPWORDS
+    )
+
+def minhash_signature(shingle_set: set) -> Tuple[int, ...]:
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return tuple(((_PERM_A * hashes[None, :] + _PERM_B) % _PRIME).min(axis=1).tolist())
+
+def group_near_duplicates(questions: List[str], threshold: float = QUESTION_DEDUP_THRESHOLD) -> List[int]:
+    """
+    Returns, for every question, the index of its group representative
+    (the first occurrence of the group in the input order).
+    """
+    parent = list(range(len(questions)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            # Keep the earliest question as the representative
+            parent[max(ri, rj)] = min(ri, rj)
+
+    shingle_sets = [shingles(q) for q in questions]
+    # "Control 4.1" and "Control 4.2" differ only slightly but are different questions
+    numbers = [_numbers(q) for q in questions]
+    words = [content_words(q) for q in questions]
+    buckets = {}
+    checked = set()
+    for i, shingle_set in enumerate(shingle_sets):
+        signature = minhash_signature(shingle_set)
+        for band in range(LSH_BANDS):
+            band_key = (band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+            for j in buckets.setdefault(band_key, []):
+                if (j, i) in checked:
+                    continue
+                checked.add((j, i))
+                if find(i) == find(j) or numbers[i] != numbers[j] or words[i] != words[j]:
+                    continue
+                a, b = shingle_sets[i], shingle_sets[j]
+                # Jaccard can never exceed the size ratio; skip the set operations when it cannot pass
+                if min(len(a), len(b)) < threshold * max(len(a), len(b)):
+                    continue
+                if jaccard(a, b) >= threshold:
+                    union(i, j)
+            buckets[band_key].append(i)
+
+    return [find(i) for i in range(len(questions))]
+
+def collapse_questions(questions: List[str], threshold: float = QUESTION_DEDUP_THRESHOLD) -> Tuple[List[str], List[int]]:
+    """
+    Returns (representatives, mapping) where `representatives` holds one question per
+    near-duplicate group in input order and `mapping[i]` is the representative index
+    answering `questions[i]`.
+    """
+    group_of = group_near_duplicates(questions, threshold)
+    representatives = []
+    position = {}
+    mapping = []
+    for i, root in enumerate(group_of):
+        if root not in position:
+            position[root] = len(representatives)
+            representatives.append(questions[root])
+        mapping.append(position[root])
+
+    if len(representatives) < len(questions):
+        logging.info(f"Collapsed {len(questions)} questions into {len(representatives)} unique questions")
+    return representatives, mapping
+
+__all__ = [
+    "collapse_questions", "group_near_duplicates", "shingles", "jaccard", "content_words",
+    "QUESTION_DEDUP_ENABLED", "QUESTION_DEDUP_THRESHOLD"
+]
@@ -6,10 +6,12 @@ Stores Q&A sessions, supports rename/delete operations.
 """
 
 import json
+import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import select
 from models import QuestionnaireSession
 from db import get_session
+from answer_memory import answer_memory
 
 router = APIRouter()
 
@@ -66,6 +68,7 @@ def delete_questionnaire(session_id: int, session=Depends(get_session)):
         raise HTTPException(status_code=404, detail="Questionnaire not found")
     session.delete(entry)
     session.commit()
+    answer_memory.remove_session(session_id)
     return {"success": True}
 
 # --- Internal utility for saving entries ---
@@ -78,6 +81,11 @@ def save_questionnaire_entry(title: str, file_name: str, results: list, session)
     session.add(new_entry)
     session.commit()
     session.refresh(new_entry)
+    # Make the new answers available for reuse right away
+    try:
+        answer_memory.index_session(new_entry.id, results)
+    except Exception as e:
+        logging.warning(f"Failed to index questionnaire session {new_entry.id} for answer reuse: {e}")
     return new_entry.id
 
 # --- Exported utilities for imports ---
@@ -0,0 +1,191 @@
+"""
+questionnaire_jobs.py
+---------------------
+Asynchronous questionnaire processing. An upload returns a job id immediately,
+a background task extracts and answers the questions, and clients poll for
+progress (questions done / total, ETA) and the final result.
+
+Job state lives in the QuestionnaireJob table so any API worker can report on it.
+Finished results are persisted through save_questionnaire_entry like /process.
+"""
+
+import json
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import Session
+from db import engine
+from models import QuestionnaireJob, QuestionnaireSession
+from answer_questionnaire import (
+    validate_questionnaire_upload,
+    save_upload_to_temp,
+    cleanup_temp_file,
+    extract_questions,
+    answer_questions,
+    persist_results,
+)
+
+router = APIRouter()
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+# --- Internal: job state helpers ---
+def _update_job(job_id: str, **fields):
+    with Session(engine) as session:
+        job = session.get(QuestionnaireJob, job_id)
+        if not job:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        session.add(job)
+        session.commit()
+
+def _estimate_eta(job: QuestionnaireJob):
+    """Seconds left, extrapolated from the average time per answered question."""
+    if job.status != "answering" or not job.answering_started_at or job.questions_done == 0:
+        return None
+    elapsed = (datetime.utcnow() - job.answering_started_at).total_seconds()
+    remaining = job.questions_total - job.questions_done
+    return round(elapsed / job.questions_done * remaining, 1)
+
+def _job_status(job: QuestionnaireJob) -> dict:
+    return {
+        "job_id": job.id,
+        "file_name": job.file_name,
+        "status": job.status,
+        "questions_done": job.questions_done,
+        "questions_total": job.questions_total,
+        "eta_seconds": _estimate_eta(job),
+        "session_id": job.session_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+# --- Background worker ---
+async def run_questionnaire_job(job_id: str, temp_path: str, file_name: str, reuse_answers: bool = False,
+                                retrieval_engine: str = "assistant"):
+    """
+    Extracts, answers and persists a questionnaire while recording progress on the job.
+    Runs on the event loop; job row updates go through the threadpool, and progress
+    writes are coalesced so at most one is in flight.
+    """
+    progress = {"done": 0, "written": 0, "writer": None}
+
+    async def _write_progress():
+        while progress["written"] < progress["done"]:
+            done = progress["done"]
+            await run_in_threadpool(_update_job, job_id, questions_done=done)
+            progress["written"] = done
+
+    def on_answer(index: int, answer: str):
+        progress["done"] += 1
+        if progress["writer"] is None or progress["writer"].done():
+            progress["writer"] = asyncio.ensure_future(_write_progress())
+
+    try:
+        await run_in_threadpool(_update_job, job_id, status="extracting")
+        questions = await extract_questions(temp_path, file_name)
+
+        await run_in_threadpool(
+            _update_job,
+            job_id,
+            status="answering",
+            questions_total=len(questions),
+            answering_started_at=datetime.utcnow()
+        )
+
+        results = await answer_questions(questions, on_answer=on_answer, reuse_answers=reuse_answers, retrieval_engine=retrieval_engine)
+        if progress["writer"] is not None:
+            await progress["writer"]
+        session_id = await run_in_threadpool(persist_results, file_name, results)
+
+        await run_in_threadpool(
+            _update_job,
+            job_id,
+            status="completed",
+            questions_done=len(results),
+            session_id=session_id,
+            finished_at=datetime.utcnow()
+        )
+        logging.info(f"Questionnaire job {job_id} completed: {len(results)} questions, session {session_id}")
+
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else f"Internal error: {str(e)}"
+        logging.error(f"Questionnaire job {job_id} failed: {detail}")
+        await run_in_threadpool(_update_job, job_id, status="failed", error=detail, finished_at=datetime.utcnow())
+
+    finally:
+        cleanup_temp_file(temp_path)
+
+# --- API: Submit questionnaire for background processing ---
+@router.post("/jobs", status_code=202)
+async def create_questionnaire_job(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    reuse_answers: bool = Query(False, description="Reuse stored answers for questions answered before"),
+    retrieval_engine: str = Query("assistant", alias="engine", description="Retrieval engine: assistant or local")
+):
+    """
+    Accepts a questionnaire upload and returns a job id right away.
+    Poll /questionnaires/jobs/{job_id} for progress and /result for the answers.
+    """
+    ext = validate_questionnaire_upload(file)
+    temp_path = await save_upload_to_temp(file, ext)
+
+    job = QuestionnaireJob(id=uuid.uuid4().hex, file_name=file.filename)
+    try:
+        with Session(engine) as session:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+    except Exception as e:
+        cleanup_temp_file(temp_path)
+        logging.error(f"Failed to create questionnaire job: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+    background_tasks.add_task(run_questionnaire_job, job.id, temp_path, file.filename, reuse_answers, retrieval_engine)
+    logging.info(f"Queued questionnaire job {job.id} for {file.filename}")
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/questionnaires/jobs/{job.id}",
+        "result_url": f"/questionnaires/jobs/{job.id}/result"
+    })
+
+# --- API: Job progress ---
+@router.get("/jobs/{job_id}")
+def get_questionnaire_job(job_id: str):
+    with Session(engine) as session:
+        job = session.get(QuestionnaireJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return _job_status(job)
+
+# --- API: Job result ---
+@router.get("/jobs/{job_id}/result")
+def get_questionnaire_job_result(job_id: str):
+    """Returns the same payload as /questionnaires/process once the job has completed."""
+    with Session(engine) as session:
+        job = session.get(QuestionnaireJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail=job.error or "Job failed")
+        if job.status not in TERMINAL_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+
+        entry = session.get(QuestionnaireSession, job.session_id)
+        if not entry:
+            raise HTTPException(status_code=404, detail="Questionnaire results not found")
+        return {
+            "questions_and_answers": json.loads(entry.results_json),
+            "session_id": entry.id
+        }
+
+__all__ = ["router", "run_questionnaire_job"]
@@ -0,0 +1,158 @@
+"""
+questionnaire_parse_cache.py
+----------------------------
+Content-addressed cache of extracted questionnaire questions.
+
+Results of parse_questionnaire_file are keyed on the SHA-256 of the file bytes, the
+extraction assistant id and the parser's config fingerprint (parser version and the
+settings that change its output), so re-uploading the same questionnaire (e.g. after
+a failed or timed-out /questionnaires/process run) skips extraction entirely, while
+a parser change or new settings extract again. Entries
+live in the QuestionnaireParseCacheEntry table, shared by every API worker, and the
+table is trimmed to QUESTIONNAIRE_PARSE_CACHE_MAX_ENTRIES least recently used rows.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import APIRouter
+from langchain.schema import Document
+from sqlmodel import Session, select, delete, func, col
+from db import engine
+from models import QuestionnaireParseCacheEntry
+
+router = APIRouter()
+
+# Cache configuration
+QUESTIONNAIRE_PARSE_CACHE_ENABLED = os.getenv("QUESTIONNAIRE_PARSE_CACHE_ENABLED", "true").lower() == "true"
+QUESTIONNAIRE_PARSE_CACHE_MAX_ENTRIES = int(os.getenv("QUESTIONNAIRE_PARSE_CACHE_MAX_ENTRIES", "500"))
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class QuestionnaireParseCache:
+    """Parsed question lists backed by the QuestionnaireParseCacheEntry table, with LRU eviction."""
+
+    def __init__(self, max_entries: int = QUESTIONNAIRE_PARSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(file_hash: str, assistant_id: str, config: str = "") -> str:
+        return hashlib.sha256(f"{file_hash}\x1f{assistant_id}\x1f{config}".encode("utf-8")).hexdigest()
+
+    def lookup(self, file_path: str, assistant_id: str, config: str = "") -> Tuple[Optional[List[Document]], Optional[str]]:
+        """
+        Returns (documents or None, file hash). Pass the hash back to store() so the file
+        is not read twice. Cached documents get `file_path`'s name as their source.
+        `config` fingerprints the parser settings; entries stored under another one are not reused.
+        """
+        if not QUESTIONNAIRE_PARSE_CACHE_ENABLED:
+            return None, None
+        try:
+            file_hash = file_sha256(file_path)
+        except Exception as e:
+            logging.warning(f"Questionnaire parse cache unavailable, could not hash {file_path}: {e}")
+            self.stats["errors"] += 1
+            return None, None
+
+        try:
+            with Session(engine) as session:
+                row = session.get(QuestionnaireParseCacheEntry, self.make_key(file_hash, assistant_id, config))
+                if row is not None:
+                    row.hits += 1
+                    row.last_used_at = datetime.utcnow()
+                    session.add(row)
+                    session.commit()
+                    source = os.path.basename(file_path)
+                    docs = [
+                        Document(page_content=doc["page_content"], metadata={**doc["metadata"], "source": source})
+                        for doc in json.loads(row.documents_json)
+                    ]
+                    self.stats["hits"] += 1
+                    logging.info(f"Reusing {len(docs)} cached questions for {file_path} (first seen as {row.filename})")
+                    return docs, file_hash
+        except Exception as e:
+            logging.warning(f"Questionnaire parse cache lookup failed: {e}")
+            self.stats["errors"] += 1
+
+        self.stats["misses"] += 1
+        return None, file_hash
+
+    def store(self, file_hash: Optional[str], assistant_id: str, file_path: str, docs: List[Document],
+              config: str = ""):
+        """Caches a complete extraction result; empty results are never cached."""
+        if file_hash is None or not docs:
+            return
+        try:
+            with Session(engine) as session:
+                session.merge(QuestionnaireParseCacheEntry(
+                    key=self.make_key(file_hash, assistant_id, config),
+                    file_hash=file_hash,
+                    assistant_id=assistant_id,
+                    filename=os.path.basename(file_path),
+                    documents_json=json.dumps([{"page_content": d.page_content, "metadata": d.metadata} for d in docs]),
+                    question_count=len(docs)
+                ))
+                session.commit()
+            self.stats["stores"] += 1
+            self.evict()
+        except Exception as e:
+            logging.warning(f"Questionnaire parse cache store failed: {e}")
+            self.stats["errors"] += 1
+
+    def evict(self):
+        """Trims the table to the `max_entries` least recently used rows."""
+        with Session(engine) as session:
+            keep = (
+                select(QuestionnaireParseCacheEntry.key)
+                .order_by(col(QuestionnaireParseCacheEntry.last_used_at).desc())
+                .limit(self.max_entries)
+            )
+            session.exec(delete(QuestionnaireParseCacheEntry).where(col(QuestionnaireParseCacheEntry.key).not_in(keep)))
+            session.commit()
+
+    def clear(self) -> int:
+        with Session(engine) as session:
+            result = session.exec(delete(QuestionnaireParseCacheEntry))
+            session.commit()
+            return result.rowcount
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        with Session(engine) as session:
+            entries = session.exec(select(func.count()).select_from(QuestionnaireParseCacheEntry)).one()
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "enabled": QUESTIONNAIRE_PARSE_CACHE_ENABLED,
+        }
+
+questionnaire_parse_cache = QuestionnaireParseCache()
+
+# --- API: Cache statistics ---
+@router.get("/questionnaires/stats")
+def get_questionnaire_parse_cache_stats():
+    return questionnaire_parse_cache.snapshot()
+
+# --- API: Drop all cached question lists ---
+@router.post("/questionnaires/clear")
+def clear_questionnaire_parse_cache():
+    removed = questionnaire_parse_cache.clear()
+    return {"success": True, "removed": removed}
+
+__all__ = [
+    "router", "questionnaire_parse_cache", "file_sha256",
+    "QuestionnaireParseCache", "QUESTIONNAIRE_PARSE_CACHE_ENABLED"
+]
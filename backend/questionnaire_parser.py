@@ -5,101 +5,363 @@ Handles parsing of uploaded questionnaire files (Excel, PDF, DOCX, etc.) into qu
 """
 
 import os
-import pandas as pd
-from typing import List
+import re
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from langchain.schema import Document
 from langchain_unstructured import UnstructuredLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import logging
-import openai
+from llm_backend import get_llm_backend, LLMBackend
+from run_waiter import wait_for_run, wait_for_run_sync
+from process_pool import run_cpu_bound, run_cpu_bound_sync
+from questionnaire_structure import (
+    detect_sheet_questions, SheetQuestions, QUESTION_FAST_PATH_ENABLED, QUESTION_FAST_PATH_MIN_CONFIDENCE
+)
+from excel_to_pdf_converter import WorkbookReader
+from questionnaire_parse_cache import questionnaire_parse_cache
 
 SUPPORTED_FORMATS = {"pdf", "docx", "txt", "eml", "html", "pptx", "rtf", "md", "json", "xlsx"}
 DEFAULT_CHUNK_SIZE = 800
 DEFAULT_CHUNK_OVERLAP = 100
 
+# Question extraction: "single" sends the whole file in one assistant message, "windowed"
+# splits it into overlapping windows extracted concurrently, "auto" windows files larger
+# than one window
+QUESTION_EXTRACT_MODE = os.getenv("QUESTION_EXTRACT_MODE", "auto")
+EXTRACT_WINDOW_CHARS = int(os.getenv("QUESTION_EXTRACT_WINDOW_CHARS", "12000"))
+EXTRACT_WINDOW_OVERLAP = int(os.getenv("QUESTION_EXTRACT_WINDOW_OVERLAP", "1500"))
+EXTRACT_WINDOW_CONCURRENCY = int(os.getenv("QUESTION_EXTRACT_WINDOW_CONCURRENCY", "8"))
+EXTRACT_ASSISTANT_ENV = "OPENAI_QUESTION_EXTRACT_ASSISTANT_ID"
+WINDOW_MERGE_THRESHOLD = 0.9  # Shingle Jaccard similarity of a question repeated across an overlap
+# Bump when a code change alters the questions extracted from the same file, so cached results are dropped
+QUESTION_PARSER_VERSION = 1
+
+def _parse_cache_config() -> str:
+    """Fingerprint of everything besides the file and assistant that shapes extraction results."""
+    return (
+        f"v{QUESTION_PARSER_VERSION};mode={QUESTION_EXTRACT_MODE};"
+        f"window={EXTRACT_WINDOW_CHARS}/{EXTRACT_WINDOW_OVERLAP};"
+        f"fast_path={QUESTION_FAST_PATH_ENABLED}@{QUESTION_FAST_PATH_MIN_CONFIDENCE}"
+    )
+
 def create_text_splitter(chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> RecursiveCharacterTextSplitter:
     """Factory for consistent text splitting across file types."""
     return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
+EXTRACTION_PROMPTS = {
+    "table": "Extract all questions or prompts from the following table.",
+    "text": "Extract all questions or prompts from the following text.",
+}
+
+class QuestionExtractionIncomplete(RuntimeError):
+    """Some windows of a questionnaire failed extraction, so its question list would have gaps."""
+
+@dataclass
+class QuestionnaireSection:
+    """One unit of extraction: a worksheet, or the whole text of a document (sheet None)."""
+    kind: str  # "table" or "text", see EXTRACTION_PROMPTS
+    content: str = ""
+    sheet: Optional[str] = None
+    rows: List[Tuple[int, List[str]]] = field(default_factory=list)  # Numbered rows of sheets sent to the assistant
+    detected: Optional[SheetQuestions] = None  # Set when the sheet structure was read without the assistant
+
+def _table_text(rows: List[Tuple[int, List[str]]]) -> str:
+    return "\n".join(" | ".join(cells) for _, cells in rows)
+
+def _load_workbook_sections(file_path: str, detect_structure: bool) -> List[QuestionnaireSection]:
+    """Every non-empty sheet in one workbook pass; sheets with a clear question column come back already detected."""
+    sections = []
+    with WorkbookReader(file_path) as reader:
+        for sheet_name, rows in reader.iter_sheets(numbered=True):
+            rows = list(rows)
+            if len(rows) < 2:
+                continue  # Empty or header only
+            detected = None
+            if detect_structure:
+                try:
+                    detected = detect_sheet_questions(sheet_name, rows)
+                except Exception as e:
+                    logging.warning(f"Structure detection failed for sheet '{sheet_name}' of {file_path}: {e}")
+            if detected is not None:
+                sections.append(QuestionnaireSection(kind="table", sheet=sheet_name, detected=detected))
+            else:
+                sections.append(QuestionnaireSection(kind="table", content=_table_text(rows), sheet=sheet_name, rows=rows))
+    if not sections:
+        logging.warning(f"Excel file {file_path} is empty")
+    return sections
+
+def _load_questionnaire_sections(file_path: str, detect_structure: bool = QUESTION_FAST_PATH_ENABLED) -> List[QuestionnaireSection]:
+    """Reads the questionnaire file into extraction sections (empty if there is no content)."""
+    ext = file_path.split(".")[-1].lower()
+    if ext not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported file format: {ext}")
+
+    if ext == "xlsx":
+        return _load_workbook_sections(file_path, detect_structure)
+    elif ext == "docx":
+        try:
+            from docx import Document as DocxDocument
+            doc = DocxDocument(file_path)
+            paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+            return [QuestionnaireSection(kind="text", content="\n".join(paragraphs))]
+        except ImportError:
+            logging.warning("python-docx is not installed. Cannot process DOCX files.")
+            return []
+        except Exception as e:
+            logging.error(f"Failed to parse DOCX file {file_path}: {e}")
+            return []
+    else:
+        # For unstructured files, extract text
+        loader = UnstructuredLoader(file_path)
+        raw_docs = loader.load()
+        if not raw_docs:
+            logging.warning(f"No content extracted from {file_path}")
+            return []
+        return [QuestionnaireSection(kind="text", content="\n".join([doc.page_content for doc in raw_docs]))]
+
+# --- Windowed extraction ---
+def _table_windows(table: str, window_chars: int, overlap_chars: int) -> List[str]:
+    """Splits a rendered table on row boundaries, repeating the header line in every window."""
+    header, *rows = table.splitlines()
+    windows, current, size = [], [], 0
+    for row in rows:
+        if current and size + len(row) + 1 > window_chars:
+            windows.append("\n".join([header] + current))
+            # Carry the trailing rows that fit in the overlap into the next window
+            carried, carried_size = [], 0
+            for previous in reversed(current):
+                if carried_size + len(previous) + 1 > overlap_chars:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous) + 1
+            current, size = carried, carried_size
+        current.append(row)
+        size += len(row) + 1
+    if current or not windows:
+        windows.append("\n".join([header] + current))
+    return windows
+
+def _extraction_windows(kind: str, content: str) -> List[str]:
+    """Assistant messages for the content: one, or overlapping windows for large files."""
+    prompt = EXTRACTION_PROMPTS[kind]
+    windowed = QUESTION_EXTRACT_MODE == "windowed" or (
+        QUESTION_EXTRACT_MODE == "auto" and len(content) > EXTRACT_WINDOW_CHARS
+    )
+    if not windowed:
+        return [f"{prompt}\n\n{content}"]
+    if kind == "table":
+        pieces = _table_windows(content, EXTRACT_WINDOW_CHARS, EXTRACT_WINDOW_OVERLAP)
+    else:
+        pieces = create_text_splitter(EXTRACT_WINDOW_CHARS, EXTRACT_WINDOW_OVERLAP).split_text(content)
+    return [f"{prompt}\n\n{piece}" for piece in pieces]
+
+def _window_body(kind: str, window: str) -> str:
+    """The content part of an extraction message, without the prompt (and the repeated table header)."""
+    body = window[len(EXTRACTION_PROMPTS[kind]) + 2:]
+    return body.split("\n", 1)[1] if kind == "table" and "\n" in body else body
+
+def _overlap(previous: str, current: str) -> str:
+    """The longest end of `previous` that `current` starts with: the text both windows contain."""
+    for size in range(min(len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:size]):
+            return current[:size]
+    return ""
+
+def _merge_window_questions(window_questions: List[List[str]], window_bodies: List[str]) -> List[str]:
+    """
+    Concatenates per-window questions in document order. A question is dropped as
+    extracted twice only when it matches one from the previous window and its text lies
+    in the overlap the two windows share; a question that really repeats (e.g. the same
+    question under several sections) is kept. Matching questions must also carry the
+    same numbers, so "Control 2.1" and "Control 2.11" stay apart.
+    """
+    from question_dedup import shingles, jaccard
+
+    def signature(question: str):
+        return shingles(question), frozenset(re.findall(r"\d+", question))
+
+    merged = []
+    previous = []
+    for k, questions in enumerate(window_questions):
+        current = [(question, signature(question)) for question in questions]
+        overlap = shingles(_overlap(window_bodies[k - 1], window_bodies[k])) if k else set()
+
+        def in_overlap(shingle_set: set) -> bool:
+            # Containment rather than substring, as the assistant may tidy up the wording
+            return bool(overlap) and len(shingle_set & overlap) >= WINDOW_MERGE_THRESHOLD * len(shingle_set)
+
+        merged.extend(
+            question for question, (shingle_set, numbers) in current
+            if not (in_overlap(shingle_set) and any(
+                numbers == seen_numbers and jaccard(shingle_set, seen_shingles) >= WINDOW_MERGE_THRESHOLD
+                for seen_shingles, seen_numbers in previous
+            ))
+        )
+        previous = [sig for _, sig in current]
+    return merged
+
+def _extraction_assistant_id() -> str:
+    assistant_id = os.getenv(EXTRACT_ASSISTANT_ENV)
+    if not assistant_id:
+        raise ValueError("OPENAI_QUESTION_EXTRACT_ASSISTANT_ID environment variable not set")
+    return assistant_id
+
+def _questions_from_reply(reply: Optional[str]) -> List[str]:
+    # Split the latest assistant message by lines, filter out empty lines
+    return [line.strip() for line in (reply or "").splitlines() if line.strip()]
+
+def _extract_questions(backend: LLMBackend, content_for_llm: str, assistant_id: str) -> List[str]:
+    """Runs the extraction assistant on one message and returns the extracted lines."""
+    thread_id = backend.create_thread()
+    backend.add_message(thread_id, content_for_llm)
+    run_id = backend.start_run(thread_id, assistant_id)
+    # Wait for completion (adaptive polling, bounded by OPENAI_RUN_DEADLINE_SECONDS)
+    wait_for_run_sync(backend, thread_id, run_id)
+    return _questions_from_reply(backend.latest_assistant_message(thread_id))
+
+async def _extract_questions_async(backend: LLMBackend, content_for_llm: str, assistant_id: str) -> List[str]:
+    thread_id = await backend.create_thread_async()
+    await backend.add_message_async(thread_id, content_for_llm)
+    run_id = await backend.start_run_async(thread_id, assistant_id)
+    await wait_for_run(backend, thread_id, run_id)
+    return _questions_from_reply(await backend.latest_assistant_message_async(thread_id))
+
+def _plan_windows(sections: List[QuestionnaireSection]) -> List[Tuple[int, str]]:
+    """(section index, assistant message) for every window of the sections that need the assistant."""
+    return [
+        (i, window)
+        for i, section in enumerate(sections) if section.detected is None
+        for window in _extraction_windows(section.kind, section.content)
+    ]
+
+def _locate_rows(section: QuestionnaireSection, questions: List[str]) -> List[Tuple[Optional[int], str]]:
+    """Pairs assistant-extracted questions with the sheet row holding the same text, when there is one."""
+    rows_by_text = {}
+    for row_number, cells in section.rows:
+        for cell in cells:
+            rows_by_text.setdefault(" ".join(cell.split()).casefold(), row_number)
+    return [(rows_by_text.get(" ".join(question.split()).casefold()), question) for question in questions]
+
+def _collect_documents(file_path: str, sections: List[QuestionnaireSection], jobs: List[Tuple[int, str]], results: list) -> List[Document]:
+    """
+    Merges the questions of all sections in document (sheet) order. Raises
+    QuestionExtractionIncomplete when any window failed, rather than returning a
+    question list with gaps.
+    """
+    failures = [(i, result) for (i, _), result in zip(jobs, results) if isinstance(result, Exception)]
+    for i, error in failures:
+        where = f"sheet '{sections[i].sheet}' of " if sections[i].sheet else ""
+        logging.error(f"Question extraction failed for a window of {where}{file_path}: {error}")
+    if failures:
+        raise QuestionExtractionIncomplete(
+            f"Question extraction failed for {len(failures)} of {len(jobs)} part(s) of the file: {failures[0][1]}"
+        )
+
+    window_questions = {i: [] for i in range(len(sections))}
+    window_bodies = {i: [] for i in range(len(sections))}
+    for (i, window), result in zip(jobs, results):
+        window_questions[i].append(result)
+        window_bodies[i].append(_window_body(sections[i].kind, window))
+
+    docs = []
+    for i, section in enumerate(sections):
+        if section.detected is not None:
+            located = section.detected.questions
+            extra = {"question_column": section.detected.question_column, "answer_column": section.detected.answer_column}
+        else:
+            located = _locate_rows(section, _merge_window_questions(window_questions[i], window_bodies[i]))
+            extra = {}
+        for row, question in located:
+            metadata = {"source": os.path.basename(file_path), "idx": len(docs)}
+            if section.sheet is not None:
+                metadata.update(sheet=section.sheet, row=row)
+            metadata.update(extra)
+            docs.append(Document(page_content=question, metadata=metadata))
+
+    detected = sum(section.detected is not None for section in sections)
+    logging.info(
+        f"Extracted {len(docs)} questions from {file_path}: {detected} of {len(sections)} section(s) read directly, "
+        f"{len(jobs)} assistant window(s)."
+    )
+    return docs
+
 def parse_questionnaire_file(file_path: str) -> List[Document]:
     """
     Uses OpenAI Assistant to extract questions from any questionnaire file.
     Assistant ID must be configured via OPENAI_QUESTION_EXTRACT_ASSISTANT_ID environment variable.
-    Returns a list of Documents, one per detected question.
+    Every sheet of an Excel workbook is extracted; sheets with a clear question column are read
+    directly (questionnaire_structure). Large contents are split into overlapping windows, and
+    all windows of all sheets are extracted concurrently (see QUESTION_EXTRACT_MODE).
+    Results are cached by file content, assistant id and parser settings
+    (questionnaire_parse_cache), so re-uploading the same file skips extraction.
+    Returns a list of Documents, one per detected question, or an empty list when the file
+    cannot be read. Raises QuestionExtractionIncomplete when part of the file could not be
+    extracted, so callers never treat a partial question list as the whole questionnaire.
     """
     try:
-        ext = file_path.split(".")[-1].lower()
-        if ext not in SUPPORTED_FORMATS:
-            raise ValueError(f"Unsupported file format: {ext}")
-
-        # 1. Extract raw content from file
-        if ext == "xlsx":
-            df = pd.read_excel(file_path)
-            if df.empty:
-                logging.warning(f"Excel file {file_path} is empty")
-                return []
-            # Convert the table to a string for LLM
-            table_str = df.to_string(index=False)
-            content_for_llm = f"Extract all questions or prompts from the following table.\n\n{table_str}"
-        elif ext == "docx":
-            try:
-                from docx import Document as DocxDocument
-                doc = DocxDocument(file_path)
-                paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-                text = "\n".join(paragraphs)
-                content_for_llm = f"Extract all questions or prompts from the following text.\n\n{text}"
-            except ImportError:
-                logging.warning("python-docx is not installed. Cannot process DOCX files.")
-                return []
-            except Exception as e:
-                logging.error(f"Failed to parse DOCX file {file_path}: {e}")
-                return []
-        else:
-            # For unstructured files, extract text
-            loader = UnstructuredLoader(file_path)
-            raw_docs = loader.load()
-            if not raw_docs:
-                logging.warning(f"No content extracted from {file_path}")
-                return []
-            text = "\n".join([doc.page_content for doc in raw_docs])
-            content_for_llm = f"Extract all questions or prompts from the following text.\n\n{text}"
-
-        # 2. Call OpenAI Assistant to extract questions
-        assistant_id = os.getenv("OPENAI_QUESTION_EXTRACT_ASSISTANT_ID")
-        if not assistant_id:
-            raise ValueError("OPENAI_QUESTION_EXTRACT_ASSISTANT_ID environment variable not set")
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=content_for_llm
-        )
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id
-        )
-        # Wait for completion
-        import time
-        while True:
-            run_status = openai.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-            if run_status.status in ["completed", "failed", "cancelled"]:
-                break
-            time.sleep(1)
-        if run_status.status != "completed":
-            raise RuntimeError(f"Assistant run failed with status: {run_status.status}")
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        # Get the latest assistant message
-        questions = []
-        for msg in reversed(messages.data):
-            if msg.role == "assistant":
-                # Split by lines, filter out empty lines
-                questions = [line.strip() for line in msg.content[0].text.value.splitlines() if line.strip()]
-                break
-        # 3. Return as Document objects
-        docs = [Document(page_content=q, metadata={"source": os.path.basename(file_path), "idx": i}) for i, q in enumerate(questions)]
-        logging.info(f"Extracted {len(docs)} questions from {file_path} using OpenAI Assistant.")
+        # 0. Reuse the questions of an identical file extracted earlier
+        cache_id, cache_config = os.getenv(EXTRACT_ASSISTANT_ENV, ""), _parse_cache_config()
+        cached, file_hash = questionnaire_parse_cache.lookup(file_path, cache_id, cache_config)
+        if cached is not None:
+            return cached
+
+        # 1. Extract raw content from file (CPU-bound, runs in the process pool)
+        sections = run_cpu_bound_sync(_load_questionnaire_sections, file_path)
+        jobs = _plan_windows(sections)
+
+        # 2. Call OpenAI Assistant to extract questions, one run per window
+        results = []
+        if jobs:
+            assistant_id = _extraction_assistant_id()
+            backend = get_llm_backend()
+            with ThreadPoolExecutor(max_workers=min(len(jobs), EXTRACT_WINDOW_CONCURRENCY)) as pool:
+                futures = [pool.submit(_extract_questions, backend, window, assistant_id) for _, window in jobs]
+            results = [f.exception() or f.result() for f in futures]
+
+        # 3. Return as Document objects (raises if any window failed, so only complete results are cached)
+        docs = _collect_documents(file_path, sections, jobs, results)
+        questionnaire_parse_cache.store(file_hash, cache_id, file_path, docs, cache_config)
+        return docs
+    except QuestionExtractionIncomplete:
+        raise
+    except Exception as e:
+        logging.error(f"Failed to extract questions from {file_path} using Assistant: {e}")
+        return []
+
+async def parse_questionnaire_file_async(file_path: str) -> List[Document]:
+    """
+    Async counterpart of parse_questionnaire_file. File parsing runs in the process pool;
+    the assistant calls and run polling are awaited on the configured LLM backend,
+    with up to EXTRACT_WINDOW_CONCURRENCY windows (across all sheets) in flight.
+    """
+    try:
+        cache_id, cache_config = os.getenv(EXTRACT_ASSISTANT_ENV, ""), _parse_cache_config()
+        cached, file_hash = await asyncio.to_thread(questionnaire_parse_cache.lookup, file_path, cache_id, cache_config)
+        if cached is not None:
+            return cached
+
+        sections = await run_cpu_bound(_load_questionnaire_sections, file_path)
+        jobs = _plan_windows(sections)
+
+        results = []
+        if jobs:
+            assistant_id = _extraction_assistant_id()
+            backend = get_llm_backend()
+            semaphore = asyncio.Semaphore(EXTRACT_WINDOW_CONCURRENCY)
+
+            async def extract(window: str) -> List[str]:
+                async with semaphore:
+                    return await _extract_questions_async(backend, window, assistant_id)
+
+            results = await asyncio.gather(*(extract(window) for _, window in jobs), return_exceptions=True)
+        docs = _collect_documents(file_path, sections, jobs, results)
+        await asyncio.to_thread(questionnaire_parse_cache.store, file_hash, cache_id, file_path, docs, cache_config)
         return docs
+    except QuestionExtractionIncomplete:
+        raise
     except Exception as e:
         logging.error(f"Failed to extract questions from {file_path} using Assistant: {e}")
         return []
@@ -0,0 +1,174 @@
+"""
+questionnaire_structure.py
+--------------------------
+Local structure detection for Excel questionnaires, so well-formed sheets are read
+directly instead of through an assistant run.
+
+For each column below the header row the detector scores:
+- header keywords ("Question", "Requirement", "Control description", ...)
+- question-mark density and interrogative/imperative openings ("Does", "Describe", ...)
+- text-length statistics (questions are sentences, not IDs or Yes/No cells)
+
+The best column is used when its confidence is at least QUESTION_FAST_PATH_MIN_CONFIDENCE
+and clearly ahead of the runner-up; otherwise the caller falls back to the assistant.
+Every non-empty cell of the chosen column is a question (statement-style requirements
+included) except section titles; if those make up more than MAX_SECTION_TITLE_RATIO of
+the filled rows the layout is not what it seems and the assistant is used as well.
+"""
+
+import os
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+QUESTION_FAST_PATH_ENABLED = os.getenv("QUESTION_FAST_PATH_ENABLED", "true").lower() == "true"
+QUESTION_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("QUESTION_FAST_PATH_MIN_CONFIDENCE", "0.6"))
+HEADER_SCAN_ROWS = 15  # Rows searched for the header row
+MIN_CONFIDENCE_MARGIN = 0.1  # Best column must beat the runner-up by this much
+MIN_QUESTION_ROWS = 3
+MAX_HEADER_WORDS = 5
+MAX_SECTION_TITLE_WORDS = 5
+MAX_SECTION_TITLE_RATIO = 0.2
+
+QUESTION_HEADER_WORDS = {
+    "question", "questions", "requirement", "requirements", "control", "controls", "query",
+    "inquiry", "prompt", "criteria", "criterion", "description", "item", "topic", "request"
+}
+ANSWER_HEADER_WORDS = {
+    "answer", "answers", "response", "responses", "reply", "comment", "comments",
+    "explanation", "evidence", "remarks", "yes", "status"
+}
+IDENTIFIER_HEADER_WORDS = {"id", "no", "nr", "number", "ref", "reference", "#", "code", "section"}
+QUESTION_OPENINGS = {
+    "does", "do", "is", "are", "can", "could", "has", "have", "will", "would", "should", "shall",
+    "how", "what", "which", "who", "when", "where", "why", "please", "describe", "provide",
+    "list", "explain", "specify", "indicate", "confirm", "detail", "outline", "state", "attach", "identify"
+}
+_WORD = re.compile(r"[a-z#]+")
+_LEADING_NUMBERING = re.compile(r"^\s*(?:[\w]{0,3}[\d.)\-:]+\s+)")
+# "2. Access Control", "Section 3", "IV) Privacy": top-level numbering only, "2.1 ..." is an item
+_SECTION_NUMBERING = re.compile(r"^\s*(?:(?:section|part|chapter)\s+[\w.]+|(?:\d+|[ivxlc]+|[a-z])[.):])(?:\s|$)", re.IGNORECASE)
+
+@dataclass
+class ColumnScore:
+    index: int
+    header: str
+    confidence: float
+    question_mark_ratio: float = 0.0
+    opening_ratio: float = 0.0
+    sentence_ratio: float = 0.0
+
+@dataclass
+class SheetQuestions:
+    sheet: str
+    question_column: str
+    answer_column: Optional[str]
+    confidence: float
+    questions: List[Tuple[int, str]] = field(default_factory=list)  # (row number, question)
+
+def _header_words(header: str) -> set:
+    return set(_WORD.findall(header.lower()))
+
+def _is_answer_header(header: str) -> bool:
+    return bool(_header_words(header) & ANSWER_HEADER_WORDS)
+
+def _is_question_header(header: str) -> bool:
+    if "?" in header or len(header.split()) > MAX_HEADER_WORDS:
+        return False  # A question itself, not a column title
+    words = _header_words(header)
+    return bool(words & QUESTION_HEADER_WORDS) and not (words & (ANSWER_HEADER_WORDS | IDENTIFIER_HEADER_WORDS))
+
+def _looks_like_question(text: str) -> bool:
+    if "?" in text:
+        return True
+    words = _LEADING_NUMBERING.sub("", text).lower().split()
+    return bool(words) and words[0].strip(":,") in QUESTION_OPENINGS
+
+def _is_section_title(text: str, cells: List[str]) -> bool:
+    """A numbered heading that is the only filled cell of its row."""
+    if sum(bool(cell.strip()) for cell in cells) != 1 or _looks_like_question(text):
+        return False
+    return bool(_SECTION_NUMBERING.match(text)) and len(text.split()) <= MAX_SECTION_TITLE_WORDS
+
+def _find_header_row(rows: List[Tuple[int, List[str]]]) -> Optional[int]:
+    """Position in `rows` of the header row (the first with a question header cell), None for headerless sheets."""
+    for position, (_, cells) in enumerate(rows[:HEADER_SCAN_ROWS]):
+        if any(_is_question_header(cell) for cell in cells):
+            return position
+    return None
+
+def score_column(index: int, header: str, values: List[str]) -> ColumnScore:
+    """Confidence (0..1) that a column holds the questions of the sheet."""
+    filled = [value for value in values if value]
+    if not filled or _is_answer_header(header):
+        return ColumnScore(index, header, 0.0)
+    question_mark_ratio = sum("?" in value for value in filled) / len(filled)
+    opening_ratio = sum(_looks_like_question(value) for value in filled) / len(filled)
+    sentence_ratio = sum(len(value.split()) >= 4 for value in filled) / len(filled)
+    fill_ratio = len(filled) / len(values)
+    confidence = (
+        0.4 * _is_question_header(header)
+        + 0.35 * max(question_mark_ratio, opening_ratio)
+        + 0.25 * sentence_ratio
+    ) * min(1.0, 0.5 + fill_ratio)  # Mostly empty columns are notes, not the question list
+    return ColumnScore(index, header, round(confidence, 3), question_mark_ratio, opening_ratio, sentence_ratio)
+
+def detect_sheet_questions(sheet_name: str, rows: List[Tuple[int, List[str]]]) -> Optional[SheetQuestions]:
+    """
+    Finds the question (and answer) column of a sheet given its numbered rows.
+    Returns None when the sheet has no confident question column.
+    """
+    if len(rows) < 2:
+        return None
+    header_position = _find_header_row(rows)
+    width = max(len(cells) for _, cells in rows)
+    if header_position is None:
+        # Without a recognisable header every row is data and the column must speak for itself
+        header, data = [], rows
+    else:
+        header, data = rows[header_position][1], rows[header_position + 1:]
+    headers = [header[i] if i < len(header) else "" for i in range(width)]
+
+    scores = sorted(
+        (score_column(i, headers[i], [cells[i] if i < len(cells) else "" for _, cells in data]) for i in range(width)),
+        key=lambda score: score.confidence, reverse=True
+    )
+    best = scores[0]
+    runner_up = scores[1].confidence if len(scores) > 1 else 0.0
+    if best.confidence < QUESTION_FAST_PATH_MIN_CONFIDENCE or best.confidence - runner_up < MIN_CONFIDENCE_MARGIN:
+        logging.info(
+            f"Sheet '{sheet_name}': no confident question column "
+            f"(best '{best.header}' {best.confidence}, runner-up {runner_up})"
+        )
+        return None
+
+    answer_index = next((i for i, h in enumerate(headers) if i != best.index and _is_answer_header(h)), None)
+    questions = []
+    titles = 0
+    for row_number, cells in data:
+        text = cells[best.index].strip() if best.index < len(cells) else ""
+        if not text or text == best.header:
+            continue
+        # Section titles ("2. Access Control") share the column but are not questions
+        if _is_section_title(text, cells):
+            titles += 1
+        else:
+            questions.append((row_number, text))
+    if len(questions) < MIN_QUESTION_ROWS:
+        return None
+    if titles > MAX_SECTION_TITLE_RATIO * (titles + len(questions)):
+        logging.info(f"Sheet '{sheet_name}': {titles} of {titles + len(questions)} rows look like section titles")
+        return None
+    return SheetQuestions(
+        sheet=sheet_name,
+        question_column=best.header or f"Column {best.index + 1}",
+        answer_column=headers[answer_index] if answer_index is not None else None,
+        confidence=best.confidence,
+        questions=questions
+    )
+
+__all__ = [
+    "detect_sheet_questions", "score_column",
+    "SheetQuestions", "ColumnScore", "QUESTION_FAST_PATH_ENABLED", "QUESTION_FAST_PATH_MIN_CONFIDENCE"
+]
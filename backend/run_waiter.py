@@ -0,0 +1,184 @@
+"""
+run_waiter.py
+-------------
+Waits for OpenAI Assistant runs to finish, for every place that starts a run
+(question extraction, query_openai_assistant).
+
+- Adaptive polling: the first polls are quick (short extraction runs finish in a
+  second or two), then the interval grows by RUN_POLL_BACKOFF up to
+  RUN_POLL_MAX_SECONDS. Intervals are jittered so hundreds of runs started together
+  do not poll in lockstep.
+- Hard deadline (OPENAI_RUN_DEADLINE_SECONDS): a run still going after it is
+  cancelled and RunDeadlineExceeded is raised.
+- Every terminal state is handled: "completed" returns the run; "failed",
+  "cancelled", "expired" and "incomplete" raise RunWaitError. "requires_action"
+  is treated as terminal too, since no assistant here has tools to call back:
+  the run is cancelled instead of being left to expire.
+- A failed poll (network error, 5xx) is retried up to RUN_RETRIEVE_RETRIES times
+  on the same backoff before giving up. Whenever waiting stops on an error, the run
+  is cancelled first and the error re-raised, so no run is left going unwatched.
+- wait_for_run is a coroutine that holds no thread while it sleeps, so one event
+  loop can wait on hundreds of runs. A waiter that is cancelled (request timeout,
+  client gone) cancels its run as well. wait_for_run_sync is the blocking twin for
+  code already running in a worker thread.
+
+`backend` is the llm_backend.LLMBackend the run was started on.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Optional
+from llm_backend import LLMBackend, RunState
+
+RUN_POLL_INITIAL_SECONDS = float(os.getenv("OPENAI_RUN_POLL_INITIAL_SECONDS", "0.25"))
+RUN_POLL_MAX_SECONDS = float(os.getenv("OPENAI_RUN_POLL_MAX_SECONDS", "5"))
+RUN_POLL_BACKOFF = 1.5
+RUN_POLL_JITTER = 0.2  # +/- fraction applied to every interval
+RUN_DEADLINE_SECONDS = float(os.getenv("OPENAI_RUN_DEADLINE_SECONDS", "600"))
+RUN_RETRIEVE_RETRIES = int(os.getenv("OPENAI_RUN_RETRIEVE_RETRIES", "3"))  # Extra attempts per poll
+
+PENDING_STATUSES = {"queued", "in_progress", "cancelling"}
+CANCEL_ON_STATUSES = {"requires_action"}  # Stopped runs that still hold the thread until cancelled
+
+class RunWaitError(RuntimeError):
+    """An assistant run ended in a state other than "completed"."""
+
+    def __init__(self, message: str, status: str, run=None):
+        super().__init__(message)
+        self.status = status
+        self.run = run
+
+class RunDeadlineExceeded(RunWaitError):
+    """An assistant run did not finish before its deadline and was cancelled."""
+
+def poll_delays(initial: float = RUN_POLL_INITIAL_SECONDS, maximum: float = RUN_POLL_MAX_SECONDS):
+    """Endless sequence of jittered poll intervals: initial, initial * backoff, ... capped at maximum."""
+    delay = initial
+    while True:
+        yield delay * random.uniform(1 - RUN_POLL_JITTER, 1 + RUN_POLL_JITTER)
+        delay = min(delay * RUN_POLL_BACKOFF, maximum)
+
+def _failure(run: RunState) -> RunWaitError:
+    message = f"Assistant run failed with status: {run.status}"
+    if run.last_error:
+        message += f" ({run.last_error})"
+    return RunWaitError(message, run.status, run)
+
+def _deadline_error(run_id: str, deadline: float, status: str) -> RunDeadlineExceeded:
+    return RunDeadlineExceeded(f"Assistant run {run_id} still {status} after {deadline:g}s, cancelled", status)
+
+def _finish(run: RunState, thread_id: str, polls: int, started: float):
+    logging.info(f"Run {run.id} on thread {thread_id} ended as {run.status} after {polls} poll(s) in {time.monotonic() - started:.1f}s")
+    if run.status == "completed":
+        return run
+    raise _failure(run)
+
+# --- Async ---
+_pending_cancels = set()  # Keeps fire-and-forget cancel tasks alive until they finish
+
+async def cancel_run(backend: LLMBackend, thread_id: str, run_id: str):
+    """Best-effort cancel; a run that already ended cannot be cancelled and is ignored."""
+    try:
+        await backend.cancel_run_async(thread_id, run_id)
+        logging.info(f"Cancelled run {run_id} on thread {thread_id}")
+    except Exception as e:
+        logging.debug(f"Could not cancel run {run_id}: {e}")
+
+async def wait_for_run(backend: LLMBackend, thread_id: str, run_id: str, deadline: Optional[float] = None) -> RunState:
+    """
+    Polls a run until it ends and returns it when completed. Raises RunWaitError for any
+    other terminal state and RunDeadlineExceeded after `deadline` seconds
+    (OPENAI_RUN_DEADLINE_SECONDS by default); in both cases a run that is still alive is cancelled.
+    """
+    deadline = deadline or RUN_DEADLINE_SECONDS
+    started = time.monotonic()
+    delays = poll_delays()
+    polls = 0
+    try:
+        while True:
+            run = await _retrieve(backend, thread_id, run_id, delays)
+            polls += 1
+            status = run.status
+            if status not in PENDING_STATUSES:
+                if status in CANCEL_ON_STATUSES:
+                    await cancel_run(backend, thread_id, run_id)
+                return _finish(run, thread_id, polls, started)
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                await cancel_run(backend, thread_id, run_id)
+                raise _deadline_error(run_id, deadline, status)
+            await asyncio.sleep(min(next(delays), remaining))
+    except asyncio.CancelledError:
+        # The caller gave up on the run; stop it so it does not keep running (and billing) unseen
+        task = asyncio.ensure_future(cancel_run(backend, thread_id, run_id))
+        _pending_cancels.add(task)
+        task.add_done_callback(_pending_cancels.discard)
+        raise
+    except RunWaitError:
+        raise  # The run has ended or was cancelled already
+    except Exception:
+        await cancel_run(backend, thread_id, run_id)
+        raise
+
+async def _retrieve(backend: LLMBackend, thread_id: str, run_id: str, delays) -> RunState:
+    """retrieve_run_async, retried RUN_RETRIEVE_RETRIES times on the poll backoff."""
+    for attempt in range(RUN_RETRIEVE_RETRIES + 1):
+        try:
+            return await backend.retrieve_run_async(thread_id, run_id)
+        except Exception as e:
+            if attempt == RUN_RETRIEVE_RETRIES:
+                raise
+            logging.warning(f"Polling run {run_id} failed (attempt {attempt + 1}), retrying: {e}")
+            await asyncio.sleep(next(delays))
+
+# --- Sync ---
+def cancel_run_sync(backend: LLMBackend, thread_id: str, run_id: str):
+    try:
+        backend.cancel_run(thread_id, run_id)
+        logging.info(f"Cancelled run {run_id} on thread {thread_id}")
+    except Exception as e:
+        logging.debug(f"Could not cancel run {run_id}: {e}")
+
+def wait_for_run_sync(backend: LLMBackend, thread_id: str, run_id: str, deadline: Optional[float] = None) -> RunState:
+    """Blocking counterpart of wait_for_run, for code running in a worker thread."""
+    deadline = deadline or RUN_DEADLINE_SECONDS
+    started = time.monotonic()
+    delays = poll_delays()
+    polls = 0
+    try:
+        while True:
+            run = _retrieve_sync(backend, thread_id, run_id, delays)
+            polls += 1
+            if run.status not in PENDING_STATUSES:
+                if run.status in CANCEL_ON_STATUSES:
+                    cancel_run_sync(backend, thread_id, run_id)
+                return _finish(run, thread_id, polls, started)
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                cancel_run_sync(backend, thread_id, run_id)
+                raise _deadline_error(run_id, deadline, run.status)
+            time.sleep(min(next(delays), remaining))
+    except RunWaitError:
+        raise
+    except BaseException:
+        # Includes KeyboardInterrupt / SystemExit, which would otherwise leave the run going
+        cancel_run_sync(backend, thread_id, run_id)
+        raise
+
+def _retrieve_sync(backend: LLMBackend, thread_id: str, run_id: str, delays) -> RunState:
+    for attempt in range(RUN_RETRIEVE_RETRIES + 1):
+        try:
+            return backend.retrieve_run(thread_id, run_id)
+        except Exception as e:
+            if attempt == RUN_RETRIEVE_RETRIES:
+                raise
+            logging.warning(f"Polling run {run_id} failed (attempt {attempt + 1}), retrying: {e}")
+            time.sleep(next(delays))
+
+__all__ = [
+    "wait_for_run", "wait_for_run_sync", "cancel_run", "cancel_run_sync", "poll_delays",
+    "RunWaitError", "RunDeadlineExceeded", "RUN_DEADLINE_SECONDS", "RUN_RETRIEVE_RETRIES"
+]
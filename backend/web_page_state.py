@@ -0,0 +1,132 @@
+"""
+web_page_state.py
+-----------------
+Per-URL state of scanned websites, used to make /knowledge/scan-website incremental.
+
+For every crawled page the WebPageState table keeps the HTTP validators (ETag,
+Last-Modified) for conditional GETs, a hash and copy of the extracted text, the
+page's same-domain links, and the vector store file the page was ingested into.
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlmodel import Session, select, update, col
+from db import engine
+from models import WebPageState
+from web_utils import CrawledPage, extract_page_text, hash_content
+
+UPDATE_BATCH_SIZE = 500
+
+def _to_dict(row: WebPageState) -> dict:
+    # Page text is left out on purpose; it is streamed with iter_page_texts when needed
+    return {
+        "url": row.url,
+        "site": row.site,
+        "etag": row.etag,
+        "last_modified": row.last_modified,
+        "content_hash": row.content_hash,
+        "links": json.loads(row.links_json or "[]"),
+        "file_id": row.file_id
+    }
+
+def load_site_pages(site: str) -> Dict[str, dict]:
+    """Known pages of a site keyed by URL (without their text)."""
+    with Session(engine) as session:
+        rows = session.exec(select(WebPageState).where(WebPageState.site == site)).all()
+        return {row.url: _to_dict(row) for row in rows}
+
+def save_site_pages(site: str, pages: List[dict]):
+    """
+    Upserts page states (dicts shaped like load_site_pages values, optionally with "text").
+    The stored text is kept when a page dict has none (e.g. a 304 response).
+    `changed_at` is only moved when the content hash differs from the stored one.
+    """
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        for page in pages:
+            row = session.get(WebPageState, page["url"])
+            if row is None:
+                row = WebPageState(url=page["url"], site=site, content_hash=page["content_hash"], text=page.get("text", ""))
+            elif row.content_hash != page["content_hash"]:
+                row.changed_at = now
+            row.site = site
+            row.etag = page.get("etag")
+            row.last_modified = page.get("last_modified")
+            row.content_hash = page["content_hash"]
+            if "text" in page:
+                row.text = page["text"]
+            row.links_json = json.dumps(page.get("links", []))
+            row.file_id = page.get("file_id")
+            row.fetched_at = now
+            session.add(row)
+        session.commit()
+
+def set_page_files(file_by_url: Dict[str, Optional[str]]):
+    """Points pages at the vector store file they were ingested into."""
+    urls_by_file: Dict[Optional[str], List[str]] = {}
+    for url, file_id in file_by_url.items():
+        urls_by_file.setdefault(file_id, []).append(url)
+    with Session(engine) as session:
+        for file_id, urls in urls_by_file.items():
+            for start in range(0, len(urls), UPDATE_BATCH_SIZE):
+                session.exec(
+                    update(WebPageState)
+                    .where(col(WebPageState.url).in_(urls[start:start + UPDATE_BATCH_SIZE]))
+                    .values(file_id=file_id)
+                )
+        session.commit()
+
+def iter_page_texts(site: str, file_ids: Iterable[str], exclude_urls: Iterable[str] = ()) -> Iterator[Tuple[str, str]]:
+    """Streams (url, text) of the stored pages held in the given files, in URL order."""
+    file_ids = list(file_ids)
+    if not file_ids:
+        return
+    exclude = set(exclude_urls)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(WebPageState.url, WebPageState.text)
+            .where(WebPageState.site == site)
+            .where(col(WebPageState.file_id).in_(file_ids))
+            .order_by(WebPageState.url)
+            .execution_options(yield_per=100)
+        )
+        for url, text in rows:
+            if url not in exclude:
+                yield url, text
+
+def classify_page(page: CrawledPage, previous: Optional[dict], force: bool = False) -> Tuple[dict, bool]:
+    """
+    Builds the state of a crawled page and decides whether it has to be re-ingested.
+    A page is changed when it is new, its extracted text hash differs, or it has text
+    that was never ingested; `force` marks every downloaded page changed. 304 pages
+    keep their stored state (and text) and are never changed.
+    """
+    if page.not_modified and previous:
+        return {
+            **previous,
+            "etag": page.headers.get("etag") or previous["etag"],
+            "last_modified": page.headers.get("last-modified") or previous["last_modified"]
+        }, False
+
+    text = page.text if page.text is not None else extract_page_text(page.html or "")
+    entry = {
+        "url": page.url,
+        "etag": page.headers.get("etag"),
+        "last_modified": page.headers.get("last-modified"),
+        "content_hash": hash_content(text),
+        "text": text,
+        "links": page.links,
+        "file_id": previous["file_id"] if previous else None
+    }
+    changed = (
+        force
+        or previous is None
+        or previous["content_hash"] != entry["content_hash"]
+        or (previous["file_id"] is None and bool(text.strip()))
+    )
+    return entry, changed
+
+__all__ = [
+    "load_site_pages", "save_site_pages", "set_page_files", "iter_page_texts", "classify_page"
+]
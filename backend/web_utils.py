@@ -5,84 +5,168 @@ Utility functions for crawling websites and tracking processed URLs for knowledg
 """
 
 import os
+import time
+import asyncio
 import hashlib
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import httpx
+from collections import deque, defaultdict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse, urldefrag
+from http_client import get_async_http_client
+from html_extract import get_html_extractor
+from processed_items import NAMESPACE_URL, list_processed, is_processed, mark_processed
 
-PROCESSED_TRACK_FILE = "processed_items.txt"
 MAX_WEB_PAGES = 25
+CRAWLER_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; Knowledge-Bot/1.0)'}
+PAGE_FETCH_TIMEOUT = 15
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+CRAWL_PER_HOST_LIMIT = int(os.getenv("CRAWL_PER_HOST_LIMIT", "8"))
+CRAWL_TIMEOUT_SECONDS = 120  # 2 minutes max per domain
 
-def get_processed_ids() -> set:
-    if not os.path.exists(PROCESSED_TRACK_FILE):
-        return set()
-    with open(PROCESSED_TRACK_FILE, "r") as f:
-        return set(line.strip() for line in f.readlines())
+@dataclass
+class CrawledPage:
+    url: str
+    html: Optional[str]  # None when the server answered 304 Not Modified
+    headers: dict = field(default_factory=dict)
+    links: List[str] = field(default_factory=list)
+    text: Optional[str] = None  # Extracted main text, when the page is HTML
+    not_modified: bool = False
 
-def add_processed_id(identifier: str):
-    with open(PROCESSED_TRACK_FILE, "a") as f:
-        f.write(identifier + "\n")
+# Processed identifiers live in the ProcessedItem table (see processed_items.py)
+def get_processed_ids(namespace: str = NAMESPACE_URL) -> set:
+    return set(list_processed(namespace))
+
+def is_processed_id(identifier: str, namespace: str = NAMESPACE_URL) -> bool:
+    return is_processed(identifier, namespace)
+
+def add_processed_id(identifier: str, namespace: str = NAMESPACE_URL, ttl_seconds: Optional[int] = None):
+    mark_processed([identifier], namespace, ttl_seconds)
 
 def hash_content(content: str) -> str:
     return hashlib.md5(content.encode("utf-8")).hexdigest()
 
-def crawl_static_links(base_url: str, max_pages: int = MAX_WEB_PAGES) -> list:
-    """Recursively crawl a domain and return a list of same-domain subpages with timeout protection."""
-    visited = set()
-    to_visit = [base_url]
-    results = []
+def conditional_headers(validator: Optional[dict]) -> dict:
+    """If-None-Match / If-Modified-Since headers from a page's stored ETag and Last-Modified."""
+    headers = {}
+    if validator:
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+    return headers
+
+async def fetch_page(url: str, headers: dict = None) -> Optional[httpx.Response]:
+    """GETs a page with the shared async client (keep-alive pooled). Returns None on timeout or network error."""
+    try:
+        return await get_async_http_client().get(
+            url, headers={**CRAWLER_HEADERS, **(headers or {})}, timeout=PAGE_FETCH_TIMEOUT
+        )
+    except httpx.TimeoutException:
+        print(f"[web_utils] ⏱️  Timeout fetching {url} - skipping")
+    except httpx.HTTPError as e:
+        print(f"[web_utils] ⚠️  Error fetching {url}: {e}")
+    return None
+
+def extract_page_text(html: str) -> str:
+    """Main text of an HTML page using the configured extractor (see html_extract.py)."""
+    return get_html_extractor().extract_text(html)
+
+def extract_links(html: str, page_url: str, domain: str) -> List[str]:
+    """Same-domain links of a page, resolved and without fragments, in document order."""
+    return [link for link in get_html_extractor().extract_links(html, page_url) if urlparse(link).netloc == domain]
+
+def parse_page(html: str, page_url: str, domain: str):
+    """Text and same-domain links of a page from a single parse."""
+    text, links = get_html_extractor().parse(html, page_url)
+    return text, [link for link in links if urlparse(link).netloc == domain]
+
+async def iter_crawl_site(base_url: str, max_pages: int = MAX_WEB_PAGES, concurrency: int = CRAWL_CONCURRENCY,
+                          per_host_limit: int = CRAWL_PER_HOST_LIMIT,
+                          validators: Dict[str, dict] = None) -> AsyncIterator[CrawledPage]:
+    """
+    Concurrently crawls a domain breadth-first and yields up to `max_pages` pages with
+    their HTML as they arrive, so callers never need to download a page twice and can
+    process each page without holding the whole site in memory.
+
+    The frontier is a deque plus a seen-set (each URL is queued at most once).
+    Up to `concurrency` fetches run at a time, with at most `per_host_limit` per host.
+    Each page is parsed once (text and links) in a worker thread. The crawl stops after CRAWL_TIMEOUT_SECONDS.
+
+    With `validators` ({url: {"etag", "last_modified", "links"}} from a previous scan),
+    known pages are fetched conditionally; a 304 yields a page with `not_modified` set,
+    no HTML and the stored links, so the crawl still reaches the rest of the site.
+    """
+    validators = validators or {}
     domain = urlparse(base_url).netloc
-    start_time = __import__('time').time()
-    MAX_CRAWL_TIME = 120  # 2 minutes max per domain
-
-    print(f"[web_utils] Starting crawl of {domain} (max {max_pages} pages, {MAX_CRAWL_TIME}s timeout)")
-
-    while to_visit and len(visited) < max_pages:
-        # Check timeout
-        if __import__('time').time() - start_time > MAX_CRAWL_TIME:
-            print(f"[web_utils] ⚠️  Crawl timeout for {domain} after {MAX_CRAWL_TIME}s - returning {len(results)} pages")
-            break
-
-        url = to_visit.pop(0)
-        if url in visited:
-            continue
-
-        try:
-            print(f"[web_utils] Crawling page {len(visited)+1}/{max_pages}: {url}")
-            res = requests.get(url, timeout=15, headers={
-                'User-Agent': 'Mozilla/5.0 (compatible; Knowledge-Bot/1.0)'
-            })
-            if res.status_code != 200:
-                print(f"[web_utils] ⚠️  HTTP {res.status_code} for {url}")
-                continue
-
-            visited.add(url)
-            results.append(url)
-            
-            # Only parse HTML for additional links if we haven't hit our limit
-            if len(visited) < max_pages:
-                soup = BeautifulSoup(res.text, "html.parser")
-                new_links = 0
-                for a in soup.find_all("a", href=True):
-                    href = a["href"]
-                    if href.startswith(("#", "mailto:", "javascript:")):
-                        continue
-                    full_url = urljoin(url, href)
-                    if urlparse(full_url).netloc == domain and full_url not in visited and full_url not in to_visit:
-                        to_visit.append(full_url)
-                        new_links += 1
-                        if len(to_visit) > max_pages * 2:  # Prevent queue explosion
-                            break
-                if new_links > 0:
-                    print(f"[web_utils] Found {new_links} new links from {url}")
-
-        except requests.exceptions.Timeout:
-            print(f"[web_utils] ⏱️  Timeout crawling {url} - skipping")
-            continue
-        except Exception as e:
-            print(f"[web_utils] ⚠️  Error crawling {url}: {e}")
-            continue
-
-    elapsed = round(__import__('time').time() - start_time, 1)
-    print(f"[web_utils] Crawl complete for {domain}: {len(results)} pages in {elapsed}s")
-    return results[:max_pages]
+    base_url = urldefrag(base_url).url
+    frontier = deque([base_url])
+    seen = {base_url}
+    host_limits = defaultdict(lambda: asyncio.Semaphore(per_host_limit))
+    yielded = 0
+    in_flight = set()
+    start_time = time.monotonic()
+
+    print(f"[web_utils] Starting crawl of {domain} (max {max_pages} pages, {concurrency} concurrent, {CRAWL_TIMEOUT_SECONDS}s timeout)")
+
+    async def visit(url: str):
+        validator = validators.get(url)
+        async with host_limits[urlparse(url).netloc]:
+            res = await fetch_page(url, conditional_headers(validator))
+        if res is None:
+            return None, []
+        if res.status_code == 304 and validator:
+            links = validator.get("links", [])
+            return CrawledPage(url=url, html=None, headers=dict(res.headers), links=links, not_modified=True), links
+        if res.status_code != 200:
+            print(f"[web_utils] ⚠️  HTTP {res.status_code} for {url}")
+            return None, []
+        page = CrawledPage(url=url, html=res.text, headers=dict(res.headers))
+        if "html" in res.headers.get("content-type", "text/html"):
+            page.text, page.links = await asyncio.to_thread(parse_page, page.html, url, domain)
+        return page, page.links
+
+    try:
+        while frontier or in_flight:
+            # Never start more fetches than pages still needed
+            while frontier and len(in_flight) < concurrency and yielded + len(in_flight) < max_pages:
+                in_flight.add(asyncio.create_task(visit(frontier.popleft())))
+            if not in_flight:
+                break
+
+            remaining = CRAWL_TIMEOUT_SECONDS - (time.monotonic() - start_time)
+            done, in_flight = await asyncio.wait(in_flight, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"[web_utils] ⚠️  Crawl timeout for {domain} after {CRAWL_TIMEOUT_SECONDS}s - returning {yielded} pages")
+                break
+
+            for task in done:
+                try:
+                    page, links = task.result()
+                except Exception as e:
+                    print(f"[web_utils] ⚠️  Error crawling page: {e}")
+                    continue
+                if page is None or yielded >= max_pages:
+                    continue
+                for link in links:
+                    if link not in seen and len(frontier) < max_pages * 2:  # Prevent queue explosion
+                        seen.add(link)
+                        frontier.append(link)
+                yielded += 1
+                yield page
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+    elapsed = round(time.monotonic() - start_time, 1)
+    print(f"[web_utils] Crawl complete for {domain}: {yielded} pages in {elapsed}s")
+
+async def crawl_site(base_url: str, max_pages: int = MAX_WEB_PAGES, concurrency: int = CRAWL_CONCURRENCY,
+                     per_host_limit: int = CRAWL_PER_HOST_LIMIT,
+                     validators: Dict[str, dict] = None) -> List[CrawledPage]:
+    """Crawls a domain and returns all pages (see iter_crawl_site)."""
+    return [page async for page in iter_crawl_site(base_url, max_pages, concurrency, per_host_limit, validators)]
+
+async def crawl_static_links(base_url: str, max_pages: int = MAX_WEB_PAGES) -> list:
+    """Crawls a domain and returns the URLs of the same-domain pages found (see crawl_site)."""
+    return [page.url for page in await crawl_site(base_url, max_pages)]
@@ -0,0 +1,79 @@
+"""
+website_aggregator.py
+---------------------
+Streams scanned website text into size-bounded knowledge files.
+
+Each page is appended to the current file as a section tagged with its source
+URL and written to disk immediately, so memory stays flat however large the site
+is. When the next section would push the file past the size limit, a new file is
+started. Sections are never split: a single page larger than the limit gets a
+file of its own.
+"""
+
+import os
+import re
+import hashlib
+from dataclasses import dataclass, field
+from typing import List
+
+WEBSITE_FILE_MAX_BYTES = int(os.getenv("WEBSITE_FILE_MAX_BYTES", str(1024 * 1024)))
+
+@dataclass
+class AggregatedFile:
+    path: str
+    filename: str
+    urls: List[str] = field(default_factory=list)
+    size: int = 0
+    sha256: object = field(default_factory=hashlib.sha256, repr=False)  # Running hash of the bytes written
+
+    @property
+    def content_hash(self) -> str:
+        return self.sha256.hexdigest()
+
+class WebsiteContentWriter:
+    """Appends URL-tagged page sections to rolling files in `directory`. Not thread-safe."""
+
+    def __init__(self, directory: str, site: str, prefix: str, max_bytes: int = WEBSITE_FILE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files: List[AggregatedFile] = []
+        self._base_name = f"website_content_{re.sub(r'[^A-Za-z0-9.-]+', '_', site)}_{prefix}"
+        self._handle = None
+
+    def _roll_over(self):
+        self._close_current()
+        filename = f"{self._base_name}_{len(self.files) + 1:03d}.txt"
+        self.files.append(AggregatedFile(path=os.path.join(self.directory, filename), filename=filename))
+        self._handle = open(self.files[-1].path, "wb")
+
+    def _close_current(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def add(self, url: str, text: str):
+        """Writes one page section; pages without text are skipped."""
+        if not text or not text.strip():
+            return
+        section = f"--- Content from {url} ---\n{text}\n\n".encode("utf-8")
+        current = self.files[-1] if self.files else None
+        if current is None or (current.size and current.size + len(section) > self.max_bytes):
+            self._roll_over()
+            current = self.files[-1]
+        self._handle.write(section)
+        current.sha256.update(section)
+        current.size += len(section)
+        current.urls.append(url)
+
+    def close(self) -> List[AggregatedFile]:
+        """Closes the current file and returns all written files."""
+        self._close_current()
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._close_current()
+
+__all__ = ["WebsiteContentWriter", "AggregatedFile", "WEBSITE_FILE_MAX_BYTES"]